@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AdminPanelConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'admin_panel'
+
+    def ready(self):
+        # Registers the import_users job handler for the web and run_jobs processes
+        from . import bulk_import  # noqa: F401
@@ -0,0 +1,211 @@
+# Include Django Packages
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+
+# Include DRF Packages
+from rest_framework import serializers
+
+# Include From the Project Directory
+from app.models import Job, Users
+from app.cache import bump_version
+from app.directory import add_users
+from app.jobs import job_handler
+from app.relocation import relocations
+
+# Include Built-in Package
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import io
+import multiprocessing
+import threading
+
+
+REQUIRED_COLUMNS = ('email', 'password', 'firstname', 'surname')
+
+
+class UserImportRowSerializer(serializers.Serializer):
+    """
+    One CSV row, validated without touching the database
+    """
+    email = serializers.EmailField(max_length=50)
+    password = serializers.CharField(max_length=128)
+    firstname = serializers.CharField(max_length=50)
+    surname = serializers.CharField(max_length=50)
+    number_task = serializers.IntegerField(required=False, default=0, min_value=0)
+    valid_user = serializers.BooleanField(required=False, default=True)
+
+
+class InvalidImportFile(ValueError):
+    pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def hash_executor():
+    """
+    The password hashing pool of this worker, started by the first import and
+    shared by the later ones. Its processes come from a fork server, a fork of
+    the multithreaded worker itself could inherit locks held by other threads.
+    """
+    global _executor
+    workers = getattr(settings, 'USER_IMPORT_HASH_WORKERS', None)
+    if workers == 0:
+        return None
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+        return _executor
+
+
+def hash_passwords(passwords, executor):
+    if executor is None:
+        return [make_password(password) for password in passwords]
+    return list(executor.map(make_password, passwords, chunksize=64))
+
+
+def read_upload(uploaded_file):
+    """
+    The text of the uploaded CSV, refused before it is queued when its header lacks a column
+    """
+    content = uploaded_file.read().decode('utf-8-sig')
+    header = next(csv.reader(io.StringIO(content)), [])
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise InvalidImportFile(f"Missing CSV columns: {', '.join(missing)}")
+    return content
+
+
+def read_rows(content):
+    """
+    (line number, row) pairs of the CSV text
+    """
+    reader = csv.DictReader(io.StringIO(content, newline=''))
+    for row in reader:
+        # Line 1 is the header
+        yield reader.line_num, row
+
+
+@job_handler('import_users')
+def import_users(job, report):
+    """
+    Create the users of the CSV upload queued by AdminUserImportView in the
+    brand database, chunk by chunk: validate the rows, find taken emails with
+    one IN query, hash the passwords in the shared process pool and
+    bulk_create the rest. The created count and the errors of the rejected
+    rows are saved in job.result after every chunk, a retry resumes after
+    the last saved chunk. The upload holds plain passwords, it is dropped from
+    the payload once the import is done.
+    """
+    brand_name = job.brand_name
+    chunk_size = getattr(settings, 'USER_IMPORT_CHUNK_SIZE', 1000)
+    executor = hash_executor()
+
+    rows = list(read_rows(job.payload['csv']))
+    result = job.result or {'created': 0, 'failed': 0, 'errors': []}
+    done = job.progress_done
+    seen = {Users.objects.normalize_email((row.get('email') or '').strip()).lower() for _, row in rows[:done]}
+    report(done, len(rows))
+
+    while done < len(rows):
+        chunk = rows[done:done + chunk_size]
+        result['created'] += import_chunk(brand_name, chunk, seen, result['errors'], executor)
+        result['failed'] = len(result['errors'])
+        done += len(chunk)
+        Job.objects.using('default').filter(id=job.id).update(result=result)
+        report(done)
+
+    result['errors'].sort(key=lambda error: error['line'])
+    Job.objects.using('default').filter(id=job.id).update(result=result, payload={})
+    return result
+
+
+def import_chunk(brand_name, chunk, seen, errors, executor):
+    valid = []
+    for line, row in chunk:
+        serializer = UserImportRowSerializer(data={key: (value or '').strip() for key, value in row.items() if key})
+        if not serializer.is_valid():
+            errors.append({'line': line, 'email': row.get('email'), 'errors': serializer.errors})
+            continue
+
+        data = serializer.validated_data
+        data['email'] = Users.objects.normalize_email(data['email'])
+        if data['email'].lower() in seen:
+            errors.append({'line': line, 'email': data['email'], 'errors': {'email': ['Duplicate email in the file']}})
+            continue
+        seen.add(data['email'].lower())
+        valid.append((line, data))
+
+    new_rows = reject_taken(brand_name, valid, errors)
+    if not new_rows:
+        return 0
+
+    passwords = hash_passwords([data['password'] for _, data in new_rows], executor)
+    users = {
+        line: Users(
+            email=data['email'], password=password, firstname=data['firstname'], surname=data['surname'],
+            brand_name=brand_name, number_task=data['number_task'], valid_user=data['valid_user'],
+        )
+        for (line, data), password in zip(new_rows, passwords)
+    }
+
+    while True:
+        try:
+            with transaction.atomic(using=brand_name):
+                Users.objects.using(brand_name).bulk_create(users.values(), batch_size=500)
+            break
+        except IntegrityError:
+            # Somebody registered one of the emails meanwhile and the chunk was rolled
+            # back, only the rows whose email is taken now are rejected
+            rows = [(line, {'email': user.email}) for line, user in users.items()]
+            remaining = {line for line, _ in reject_taken(brand_name, rows, errors)}
+            if len(remaining) == len(users):
+                for line, user in users.items():
+                    errors.append({'line': line, 'email': user.email, 'errors': {'non_field_errors': ['Not imported, the row conflicts with existing data']}})
+                return 0
+            users = {line: user for line, user in users.items() if line in remaining}
+            if not users:
+                return 0
+
+    users = list(users.values())
+    # bulk_create sends no post_save
+    bump_version(brand_name, Users)
+
+    # bulk_create skips the post_save that fills the login directory, the
+    # backends that cannot return the new ids (MySQL) need them read back
+    if all(user.userid for user in users):
+        rows = [(user.userid, user.email, user.brand_name) for user in users]
+    else:
+        rows = Users.objects.using(brand_name).filter(
+            email__in=[user.email for user in users]
+        ).values_list('userid', 'email', 'brand_name')
+    rows = list(rows)
+    add_users(brand_name, rows)
+    # Nor the post_save that mirrors the rows of a moving brand
+    relocations.mirror(Users, brand_name, [userid for userid, _, _ in rows])
+
+    return len(users)
+
+
+def reject_taken(brand_name, rows, errors):
+    """
+    The (line, data) rows whose email is not taken in the brand yet, an error is added for the others
+    """
+    if not rows:
+        return []
+
+    taken = set(
+        Users.objects.using(brand_name).filter(
+            email__in=[data['email'] for _, data in rows]
+        ).values_list('email', flat=True)
+    )
+    remaining = []
+    for line, data in rows:
+        if data['email'] in taken:
+            errors.append({'line': line, 'email': data['email'], 'errors': {'email': ['User with this email already exists in this brand']}})
+        else:
+            remaining.append((line, data))
+    return remaining
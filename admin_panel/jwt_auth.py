@@ -1,5 +1,6 @@
 # Include a Django packeage
 from django.conf import settings
+from django.db.utils import InterfaceError, OperationalError
 
 # Include DRF Packeges
 from rest_framework import permissions
@@ -7,6 +8,8 @@ from rest_framework.exceptions import AuthenticationFailed
 
 # Include using a Project Directory
 from app.models import BrandAdmin
+from app.batch import decode_token
+from app.utils import is_admin_token
 
 # Include third-party packages
 import jwt
@@ -22,6 +25,9 @@ class AdminJWTAuthorization(permissions.BasePermission):
     def decode_jwt_token(token):
         try:
             decoded_token = jwt.decode(token, settings.SIMPLE_JWT['SIGNING_KEY'], algorithms=['HS256'])
+            # A user token may carry the id of an admin of its brand
+            if not is_admin_token(decoded_token):
+                return None
             return decoded_token
         except jwt.ExpiredSignatureError:
             return None
@@ -41,7 +47,7 @@ class AdminJWTAuthorization(permissions.BasePermission):
                 return None
             
             token = auth_header.split(' ')[-1]
-            decoded_token = self.decode_jwt_token(token)
+            decoded_token = decode_token(request, token, self.decode_jwt_token)
             
             if decoded_token:
                 admin_id = decoded_token['user_id']
@@ -57,6 +63,9 @@ class AdminJWTAuthorization(permissions.BasePermission):
                 except BrandAdmin.DoesNotExist:
                     return None
             return None
+        except (OperationalError, InterfaceError):
+            # Reported to the health tracker by the view, see app.health.record_connection_error
+            raise
         except Exception as e:
             raise AuthenticationFailed(f"Token verification failed: {str(e)}")
     
@@ -67,7 +76,7 @@ class AdminJWTAuthorization(permissions.BasePermission):
                 return False
             
             token = auth_header.split(' ')[-1]
-            decoded_token = self.decode_jwt_token(token)
+            decoded_token = decode_token(request, token, self.decode_jwt_token)
             
             if not decoded_token:
                 return False
@@ -78,7 +87,7 @@ class AdminJWTAuthorization(permissions.BasePermission):
             if not brand_name:
                 return False
                         
-            admin = BrandAdmin.objects.filter(id=admin_id, brand_name=brand_name, is_active=True).first()
+            admin = BrandAdmin.objects.using('default').filter(id=admin_id, brand_name=brand_name, is_active=True).first()
             
             if not admin:
                 return False
@@ -89,5 +98,46 @@ class AdminJWTAuthorization(permissions.BasePermission):
             
             return True
             
+        except (OperationalError, InterfaceError):
+            raise
+        except Exception as e:
+            return False
+
+class AsyncAdminJWTAuthorization(AdminJWTAuthorization):
+    """
+    AdminJWTAuthorization for the async views, the admin lookup goes through the async ORM
+    """
+
+    async def ahas_permission(self, request, view):
+        try:
+            auth_header = request.headers.get('Authorization')
+            if not auth_header:
+                return False
+
+            token = auth_header.split(' ')[-1]
+            decoded_token = decode_token(request, token, self.decode_jwt_token)
+
+            if not decoded_token:
+                return False
+
+            admin_id = decoded_token['user_id']
+            brand_name = decoded_token.get('brand_name')
+
+            if not brand_name:
+                return False
+
+            admin = await BrandAdmin.objects.using('default').filter(id=admin_id, brand_name=brand_name, is_active=True).afirst()
+
+            if not admin:
+                return False
+
+            request.admin = admin
+            request.brand_name = brand_name
+            request.admin_name = admin.firstname
+
+            return True
+
+        except (OperationalError, InterfaceError):
+            raise
         except Exception as e:
-            return False
\ No newline at end of file
+            return False
@@ -1,7 +1,10 @@
+from django.db import transaction
 from rest_framework import serializers
 from app.models import *
 from .models import *
 from app.middleware import get_current_brand
+from app.utils import SparseFieldsetMixin, insert_unique
+from app.events import publish_event
 
 import bcrypt
 
@@ -46,16 +49,7 @@ class BrandAdminSerializer(serializers.ModelSerializer):
         if not all([email, password, firstname, surname]):
             raise ValueError("All fields (email, password, firstname, surname) are required")
 
-        db_alias = 'default'
-        
-        existing_user = BrandAdmin.objects.using(db_alias).filter(
-            email=email, 
-            brand_name=brand_name
-        ).first()
-
-        if existing_user:
-            raise ValueError('User with this email already exists in this brand')
-        
+        # A duplicate email is refused by the (email, brand_name) unique constraint on insert
         attrs['brand_name'] = brand_name
         attrs['password'] = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=15)).decode()
 
@@ -63,11 +57,13 @@ class BrandAdminSerializer(serializers.ModelSerializer):
     
 
     def create(self, validated_data):
-        admin = BrandAdmin.objects.create(**validated_data)
-        return admin
+        return insert_unique(
+            lambda: BrandAdmin.objects.using('default').create(**validated_data),
+            'default', 'User with this email already exists in this brand'
+        )
     
 
-class AdminUserSerializer(serializers.ModelSerializer):
+class AdminUserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Users
         exclude = ("password", "groups", "user_permissions", "is_staff")
@@ -99,7 +95,8 @@ class AdminUserSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save(using=self.context.get('brand_name'))
+        # Only write the changed columns, the login directory is only touched when the email changes
+        instance.save(using=self.context.get('brand_name'), update_fields=[*validated_data, 'updated_at'])
         return instance
     
 
@@ -135,6 +132,16 @@ class AdminContactSerializer(serializers.ModelSerializer):
         if user:
             user.number_task = instance.request_for_task
             user.save(using=brand_name, update_fields=['number_task', 'updated_at'])
+
+        # Let the user's open event stream know once the change is committed
+        event = {
+            'type': 'contact.approved' if str(instance.status) == '1' else 'contact.updated',
+            'contact_id': instance.id,
+            'status': str(instance.status),
+            'request_for_task': instance.request_for_task,
+            'number_task': user.number_task if user else None,
+        }
+        transaction.on_commit(lambda: publish_event(brand_name, instance.userid, event), using=brand_name)
         
         return instance
     
@@ -149,6 +156,8 @@ class AdminCreatedUserSerializer(serializers.ModelSerializer):
         model = Users
         fields = ('userid', 'email', 'firstname', 'surname', 'password', 'brand_name', 'number_task', 'valid_user', 'created_at', 'updated_at')
         read_only_fields = ('userid', 'created_at', 'updated_at', 'brand_name')
+        # No UniqueValidator query, see create
+        extra_kwargs = {'email': {'validators': []}}
 
     def validate_email(self, value):
         """Strip whitespace from email"""
@@ -175,7 +184,6 @@ class AdminCreatedUserSerializer(serializers.ModelSerializer):
         return value
 
     def validate(self, attrs):
-        brand_name = self.context.get('brand_name')
         email = attrs.get('email')
         password = attrs.get('password')
         firstname = attrs.get('firstname')
@@ -185,19 +193,13 @@ class AdminCreatedUserSerializer(serializers.ModelSerializer):
         if not all([email, password, firstname, surname]):
             raise ValueError("All fields (email, password, firstname, surname) are required")
 
-        db_alias = brand_name if brand_name != 'default' else 'default'
-        
-        existing_user = Users.objects.using(db_alias).filter(
-            email=email, 
-            brand_name=brand_name
-        ).first()
-        if existing_user:
-            raise ValueError('User with this email already exists in this brand')
-                    
+        # A duplicate email is refused by the (email, brand_name) unique constraint on insert
         return attrs
 
     def create(self, validated_data):
         validated_data['brand_name'] = get_current_brand()
-        validated_data['is_valid'] = True
-        user = Users.objects.create_user(**validated_data)
-        return user
\ No newline at end of file
+        validated_data['valid_user'] = True
+        return insert_unique(
+            lambda: Users.objects.db_manager(validated_data['brand_name']).create_user(**validated_data),
+            validated_data['brand_name'], 'User with this email already exists in this brand'
+        )
\ No newline at end of file
@@ -1,3 +1,407 @@
-from django.test import TestCase
+# Include Django Packages
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.db.utils import OperationalError
+from django.test import AsyncClient, override_settings
+from django.utils import timezone
 
-# Create your tests here.
+# Include From the Project Directory
+from app.models import BrandAdmin, Users, Tasks, ContactUs, Tombstone, Job
+from app.testing import TenantTestCase
+from app.jobs import enqueue, drain
+from app.health import health
+from app.archival import archive_brand
+from app.cache import get_cache
+from app.profiling import ProfileStore
+from app.relocation import relocations, start, copy, verify
+from app.db_router import set_brand_context
+from app.utils import AlreadyExists
+from admin_panel.serializers import AdminCreatedUserSerializer
+from admin_panel import bulk_import
+
+# Include Built-in Package
+from datetime import timedelta
+from unittest import mock
+
+
+class BrandEndpointTests(TenantTestCase):
+
+    def test_brand_list(self):
+        with self.assertQueryBudget(1):
+            response = self.client.get('/api/admin/brands')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['data'].values()), {'vehicle', 'furniture'})
+        self.assertIn('max-age', response['Cache-Control'])
+
+        with self.assertQueryBudget(0):
+            response = self.client.get('/api/admin/brands', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_brand_list_rebuilt_on_brand_change(self):
+        self.client.get('/api/admin/brands')
+        self.vehicle.brand_name = 'cars'
+        self.vehicle.save(using='default')
+
+        response = self.client.get('/api/admin/brands')
+
+        self.assertEqual(set(response.json()['data'].values()), {'cars', 'furniture'})
+
+
+class AdminAuthEndpointTests(TenantTestCase):
+
+    def test_admin_register(self):
+        # The brand and the insert, plus the savepoint the test transaction puts around the insert
+        with self.assertQueryBudget(4):
+            response = self.client.post(f'/api/admin/register/{self.vehicle.brand_id}', {
+                'email': 'second@vehicle.com', 'password': 'password', 'firstname': 'Second', 'surname': 'Admin'
+            }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(BrandAdmin.objects.using('default').filter(email='second@vehicle.com').exists())
+
+    def test_admin_register_existing_email(self):
+        response = self.client.post(f'/api/admin/register/{self.vehicle.brand_id}', {
+            'email': 'admin@vehicle.com', 'password': 'password', 'firstname': 'Same', 'surname': 'Admin'
+        }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(BrandAdmin.objects.using('default').filter(email='admin@vehicle.com').count(), 1)
+
+    def test_admin_created_user_duplicate_refused(self):
+        set_brand_context('vehicle')
+        self.addCleanup(set_brand_context, None)
+        data = {'email': 'user@vehicle.com', 'password': 'password', 'firstname': 'Same', 'surname': 'User'}
+
+        serializer = AdminCreatedUserSerializer(data=data)
+        self.assertTrue(serializer.is_valid())
+        with self.assertRaises(AlreadyExists):
+            serializer.save()
+
+        serializer = AdminCreatedUserSerializer(data={**data, 'email': 'created@vehicle.com'})
+        self.assertTrue(serializer.is_valid())
+        self.assertTrue(serializer.save().valid_user)
+        self.assertEqual(Users.objects.using('vehicle').filter(email__in=['user@vehicle.com', 'created@vehicle.com']).count(), 2)
+
+    def test_admin_login(self):
+        with self.assertQueryBudget(2):
+            response = self.client.post(f'/api/admin/login/{self.vehicle.brand_id}', {
+                'email': 'admin@vehicle.com', 'password': 'password'
+            }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+
+
+class AdminUserEndpointTests(TenantTestCase):
+
+    def test_list_users(self):
+        with self.assertQueryBudget(2):
+            response = self.client.get('/api/admin/users', **self.admin_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertQueriesDoNotGrow(
+            lambda: self.client.get('/api/admin/users', **self.admin_headers()),
+            lambda: [self.create_user('vehicle', f'more{index}@vehicle.com') for index in range(5)],
+        )
+
+    def test_update_user(self):
+        with self.assertQueryBudget(3):
+            response = self.client.put(f'/api/admin/user/{self.user.userid}', {
+                'number_task': 7
+            }, content_type='application/json', **self.admin_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Users.objects.using('vehicle').get(userid=self.user.userid).number_task, 7)
+
+    def test_import_users(self):
+        rows = ['email,password,firstname,surname,number_task']
+        rows += [f'new{index}@vehicle.com,secret,New,User {index},5' for index in range(5)]
+        rows += ['user@vehicle.com,secret,Taken,User,1', 'new0@vehicle.com,secret,Twice,User,1', 'not-an-email,secret,Bad,Row,1']
+        upload = SimpleUploadedFile('users.csv', '\n'.join(rows).encode(), content_type='text/csv')
+
+        with self.assertQueryBudget(2):
+            response = self.client.post('/api/admin/users/import', {'file': upload}, **self.admin_headers())
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['data']['job_id']
+
+        with self.settings(USER_IMPORT_CHUNK_SIZE=4):
+            self.assertEqual(drain(), 1)
+
+        data = self.client.get(f'/api/admin/jobs/{job_id}', **self.admin_headers()).json()['data']
+        self.assertEqual(data['status'], 'succeeded')
+        self.assertEqual(data['progress'], {'done': 8, 'total': 8})
+        self.assertEqual(data['result']['created'], 5)
+        self.assertEqual([error['line'] for error in data['result']['errors']], [7, 8, 9])
+        self.assertEqual(Users.objects.using('vehicle').filter(email__startswith='new').count(), 5)
+        self.assertTrue(Users.objects.using('vehicle').get(email='new1@vehicle.com').check_password('secret'))
+        # The plain passwords do not stay in the queue
+        self.assertEqual(Job.objects.using('default').get(id=job_id).payload, {})
+
+    def test_import_without_required_columns_refused(self):
+        upload = SimpleUploadedFile('users.csv', b'email,password\nnew@vehicle.com,secret', content_type='text/csv')
+
+        response = self.client.post('/api/admin/users/import', {'file': upload}, **self.admin_headers())
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.using('default').exists())
+
+    def test_import_rejects_only_rows_registered_meanwhile(self):
+        rows = ['email,password,firstname,surname', 'late@vehicle.com,secret,Late,User', 'early@vehicle.com,secret,Early,User']
+        upload = SimpleUploadedFile('users.csv', '\n'.join(rows).encode(), content_type='text/csv')
+        job_id = self.client.post('/api/admin/users/import', {'file': upload}, **self.admin_headers()).json()['data']['job_id']
+
+        hash_passwords = bulk_import.hash_passwords
+
+        def register_meanwhile(passwords, executor):
+            # Registered between the IN check and the insert
+            self.create_user('vehicle', 'late@vehicle.com')
+            return hash_passwords(passwords, executor)
+
+        with mock.patch.object(bulk_import, 'hash_passwords', register_meanwhile):
+            drain()
+
+        result = Job.objects.using('default').get(id=job_id).result
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['errors'], [{
+            'line': 2, 'email': 'late@vehicle.com', 'errors': {'email': ['User with this email already exists in this brand']}
+        }])
+        self.assertTrue(Users.objects.using('vehicle').filter(email='early@vehicle.com').exists())
+
+    def test_import_resumes_after_saved_chunks(self):
+        rows = ['email,password,firstname,surname'] + [f'chunk{index}@vehicle.com,secret,Chunk,User' for index in range(4)]
+        upload = SimpleUploadedFile('users.csv', '\n'.join(rows).encode(), content_type='text/csv')
+        job_id = self.client.post('/api/admin/users/import', {'file': upload}, **self.admin_headers()).json()['data']['job_id']
+
+        import_chunk = bulk_import.import_chunk
+        calls = []
+
+        def crash_on_second_chunk(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise OperationalError('worker lost')
+            return import_chunk(*args)
+
+        with self.settings(USER_IMPORT_CHUNK_SIZE=2, JOB_RETRY_BASE_DELAY=0, JOB_RETRY_MAX_DELAY=0), \
+                mock.patch.object(bulk_import, 'import_chunk', crash_on_second_chunk):
+            drain()
+
+        job = Job.objects.using('default').get(id=job_id)
+        self.assertEqual((job.status, job.attempts), ('succeeded', 2))
+        self.assertEqual(job.result, {'created': 4, 'failed': 0, 'errors': []})
+        # The retry started from the third row
+        self.assertEqual([args[1][0][0] for args in calls], [2, 4, 4])
+
+    def test_imported_users_mirrored_to_moving_brand(self):
+        self.addCleanup(relocations.restore, 'vehicle')
+        relocation = start('vehicle', 'vehicle_next')
+        copy(relocation)
+
+        upload = SimpleUploadedFile('users.csv', b'email,password,firstname,surname\nmoved@vehicle.com,secret,Moved,User')
+        self.client.post('/api/admin/users/import', {'file': upload}, **self.admin_headers())
+        with self.captureOnCommitCallbacks(using='vehicle', execute=True):
+            drain()
+
+        self.assertTrue(Users.objects.using('vehicle_next').filter(email='moved@vehicle.com').exists())
+        self.assertEqual(verify(relocation, repair=False), 0)
+
+    @override_settings(USER_IMPORT_HASH_WORKERS=1)
+    def test_imports_share_one_hashing_pool(self):
+        self.addCleanup(setattr, bulk_import, '_executor', None)
+        executors = []
+        for index in range(2):
+            upload = SimpleUploadedFile('users.csv', f'email,password,firstname,surname\npool{index}@vehicle.com,secret,Pool,User'.encode())
+            job_id = self.client.post('/api/admin/users/import', {'file': upload}, **self.admin_headers()).json()['data']['job_id']
+            drain()
+            self.assertEqual(Job.objects.using('default').get(id=job_id).result['created'], 1)
+            executors.append(bulk_import._executor)
+
+        self.addCleanup(executors[0].shutdown)
+        self.assertIsNotNone(executors[0])
+        self.assertIs(executors[0], executors[1])
+        self.assertTrue(Users.objects.using('vehicle').get(email='pool1@vehicle.com').check_password('secret'))
+
+    def test_delete_user(self):
+        self.create_tasks(self.user, 3)
+
+        with self.assertQueryBudget(6):
+            response = self.client.delete(
+                f'/api/admin/delete/user/{self.vehicle.brand_id}/{self.user.userid}', **self.admin_headers()
+            )
+
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['data']['job_id']
+        self.assertTrue(Tasks.objects.using('vehicle').exists())
+
+        with override_settings(JOB_DELETE_CHUNK_SIZE=2):
+            self.assertEqual(drain(), 1)
+
+        self.assertFalse(Tasks.objects.using('vehicle').exists())
+        self.assertFalse(Users.objects.using('vehicle').filter(userid=self.user.userid).exists())
+        self.assertEqual(Tombstone.objects.using('vehicle').filter(model_name='tasks').count(), 3)
+
+        response = self.client.get(f'/api/admin/jobs/{job_id}', **self.admin_headers())
+        self.assertEqual(response.json()['data']['status'], 'succeeded')
+        self.assertEqual(response.json()['data']['progress'], {'done': 4, 'total': 4})
+
+    def test_deleted_user_refused_by_other_workers(self):
+        self.create_tasks(self.user, 2)
+        headers = self.user_headers()
+        self.assertEqual(self.client.get('/my-tasks', **headers).status_code, 200)
+
+        # run_jobs is another process, its version bumps never reach this worker's cache
+        enqueue('delete_user', 'vehicle', {'userid': self.user.userid})
+        with mock.patch('app.signals.bump_version'):
+            self.assertEqual(drain(), 1)
+
+        response = self.client.get('/my-tasks', **headers)
+        self.assertNotEqual(response.status_code, 200)
+        self.assertNotIn('data', response.json())
+
+        get_cache().clear()
+        response = self.client.get('/my-tasks', **headers)
+        self.assertNotEqual(response.status_code, 200)
+
+    def test_delete_user_job_retried_with_backoff(self):
+        job = enqueue('delete_user', 'vehicle', {'userid': self.user.userid})
+        Job.objects.using('default').filter(id=job.id).update(kind='missing')
+
+        with self.assertLogs('app.jobs', 'ERROR'):
+            self.assertEqual(drain(), 1)
+
+        job.refresh_from_db(using='default')
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+
+
+class AdminContactEndpointTests(TenantTestCase):
+
+    def test_unreachable_database_reported_by_admin_authentication(self):
+        self.addCleanup(health.reset)
+
+        def unreachable(*args):
+            raise OperationalError("Can't connect to MySQL server on default")
+
+        with mock.patch.object(connections['default'], 'create_cursor', side_effect=unreachable):
+            response = self.client.get('/api/admin/contacts', **self.admin_headers())
+
+        # Not a 403, the view reports the error to the breaker of the database
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("Can't connect", health.breaker('default').last_error)
+
+    def test_list_contacts(self):
+        self.create_contacts(self.user, 3)
+
+        with self.assertQueryBudget(3):
+            response = self.client.get('/api/admin/contacts', **self.admin_headers())
+
+        self.assertEqual(len(response.json()['data']), 3)
+        self.assertQueriesDoNotGrow(
+            lambda: self.client.get('/api/admin/contacts', **self.admin_headers()),
+            lambda: self.create_contacts(self.user, 10, start=3),
+        )
+
+    def test_list_contacts_with_archived(self):
+        self.create_contacts(self.user, 3)
+        ContactUs.objects.using('vehicle').filter(saved_search__endswith='0').update(
+            updated_at=timezone.now() - timedelta(days=400)
+        )
+        archive_brand('vehicle')
+
+        hot = self.client.get('/api/admin/contacts', **self.admin_headers())
+        everything = self.client.get('/api/admin/contacts?include_archived=1', **self.admin_headers())
+
+        self.assertEqual(len(hot.json()['data']), 2)
+        self.assertEqual(len(everything.json()['data']), 3)
+        self.assertNotEqual(hot['ETag'], everything['ETag'])
+
+    def test_approve_contact(self):
+        self.create_contacts(self.user, 1, status='0')
+        contact = ContactUs.objects.using('vehicle').get()
+
+        with self.captureOnCommitCallbacks(using='vehicle'), self.assertQueryBudget(5):
+            response = self.client.put(f'/api/admin/contact/{contact.id}', {
+                'status': 1, 'request_for_task': 9
+            }, content_type='application/json', **self.admin_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Users.objects.using('vehicle').get(userid=self.user.userid).number_task, 9)
+
+    def test_metrics(self):
+        self.client.get('/my-tasks', **self.user_headers())
+
+        with self.assertQueryBudget(1):
+            response = self.client.get('/api/admin/metrics', **self.admin_headers())
+
+        self.assertIn('app_db_queries_per_request_count{brand="vehicle",view="user-tasks"}', response.content.decode())
+
+    def test_profile_on_demand(self):
+        token = self.admin_headers()['HTTP_AUTHORIZATION'].split(' ')[1]
+        response = self.client.get('/my-tasks', HTTP_X_PROFILE_TOKEN=token, **self.user_headers())
+        profile_id = response['X-Profile-Id']
+
+        summary = self.client.get('/api/admin/profiles', **self.admin_headers()).json()['data']
+        self.assertIn(profile_id, [profile['id'] for profile in summary])
+
+        profile = self.client.get(f'/api/admin/profiles/{profile_id}', **self.admin_headers()).json()['data']
+        self.assertEqual(profile['view'], 'user-tasks')
+        self.assertTrue(profile['queries'])
+        self.assertTrue(profile['functions'])
+
+    def test_profile_query_parameter(self):
+        self.assertTrue(self.client.get('/api/admin/metrics?profile=1', **self.admin_headers()).has_header('X-Profile-Id'))
+        self.assertFalse(self.client.get('/api/admin/metrics?profile=10', **self.admin_headers()).has_header('X-Profile-Id'))
+
+    def test_profile_query_parameter_only_on_admin_endpoints(self):
+        response = self.client.get('/my-tasks?profile=1', **self.user_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Profile-Id'))
+
+    def test_user_token_cannot_profile(self):
+        # The user's userid is also the id of an active admin of the brand
+        self.assertEqual(self.user.userid, self.admin.id)
+        token = self.user_headers()['HTTP_AUTHORIZATION'].split(' ')[1]
+
+        response = self.client.get('/my-tasks', HTTP_X_PROFILE_TOKEN=token, **self.user_headers())
+        self.assertFalse(response.has_header('X-Profile-Id'))
+
+        response = self.client.get('/api/admin/profiles', **self.user_headers())
+        self.assertNotEqual(response.status_code, 200)
+
+    def test_profiles_shared_by_workers(self):
+        token = self.admin_headers()['HTTP_AUTHORIZATION'].split(' ')[1]
+        profile_id = self.client.get('/my-tasks', HTTP_X_PROFILE_TOKEN=token, **self.user_headers())['X-Profile-Id']
+
+        # The store of another worker reads the same tenant cache
+        other_worker = ProfileStore(settings.PROFILING_BUFFER_SIZE, settings.PROFILING_TIMEOUT)
+        self.assertEqual(other_worker.get(profile_id, 'vehicle')['view'], 'user-tasks')
+
+    async def test_asgi_requests_not_profiled(self):
+        token = self.admin_headers()['HTTP_AUTHORIZATION'].split(' ')[1]
+
+        user_token = self.user_headers()['HTTP_AUTHORIZATION']
+        response = await AsyncClient().get('/async/my-tasks', headers={
+            'Authorization': user_token, 'X-Brand-Name': 'vehicle', 'X-Profile-Token': token,
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Profile-Id'))
+
+    def test_database_health(self):
+        self.addCleanup(health.reset)
+        breaker = health.breaker('vehicle')
+        for _ in range(10):
+            breaker.record(error=Exception('connection refused'))
+
+        response = self.client.get('/api/admin/health', HTTP_X_BRAND_NAME='vehicle', **self.admin_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['state'], 'open')
+        self.assertEqual(response.json()['data'][0]['error_rate'], 1.0)
+
+    def test_no_profile_without_admin(self):
+        response = self.client.get('/my-tasks', HTTP_X_PROFILE_TOKEN='not-a-token', **self.user_headers())
+
+        self.assertFalse(response.has_header('X-Profile-Id'))
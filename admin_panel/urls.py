@@ -8,10 +8,19 @@ urlpatterns = [
     path('login/<brand_id>',views.AdminLoginView.as_view(), name="admin_login"),
     
     path("users", views.AdminUsersView.as_view(), name="list-users"),
+    path("users/import", views.AdminUserImportView.as_view(), name="import-users"),
     path("user/<userid>", views.UpdateUserView.as_view(), name="update_user"),
 
     path("delete/user/<brand_id>/<userid>", views.AdminDeleteUserView.as_view(), name="admin-create-user"),
+    path("jobs/<job_id>", views.JobStatusView.as_view(), name="job-status"),
     
     path('contacts', views.ContactInfoView.as_view(), name='admin-contacts'),
-    path('contact/<contact_id>', views.ModifyContactInfo.as_view(), name='modify-contact')
+    path('contact/<contact_id>', views.ModifyContactInfo.as_view(), name='modify-contact'),
+
+    path('metrics', views.QueryMetricsView.as_view(), name='query-metrics'),
+
+    path('profiles', views.ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<profile_id>', views.ProfileDetailView.as_view(), name='profile-detail'),
+
+    path('health', views.DatabaseHealthView.as_view(), name='database-health')
 ]
\ No newline at end of file
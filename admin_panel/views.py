@@ -1,5 +1,8 @@
 # Include Django Packages
 from django.shortcuts import render
+from django.http import HttpResponse
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 # Include DjangoRestFrameWork Packages
 from rest_framework.response import Response
@@ -9,32 +12,44 @@ from rest_framework_simplejwt.tokens import RefreshToken
 # Include From the Project Folder
 from .models import *
 from .serializers import *
-from app.models import Brand, Users
+from app.models import Brand, Users, Job, ArchivedContact
 from .jwt_auth import AdminJWTAuthorization
-from app.utils import APIValidateView
-from app.serializers import ContactSerializer
+from app.utils import (
+    APIValidateView, get_sparse_fieldset, narrow_queryset,
+    get_collection_version, get_not_modified_response, set_version_headers, merge_versions,
+    ADMIN_TOKEN_ROLE
+)
+from app.serializers import ContactSerializer, ArchivedContactSerializer
+from app.jobs import enqueue
+from .bulk_import import read_upload, InvalidImportFile
+from app.instrumentation import metrics
+from app.profiling import profiles
+from app.registry import brand_list
+from app.health import health
 
 # Include Built-in Package
 import bcrypt
 
 # Create your views here.
 class ListOfBrandView(APIValidateView):
+    """
+    Public brand list, served from the pre-encoded snapshot in app/registry.py
+    """
     
     def get(self,request):
 
-        brand_list = {}
-        brands = Brand.objects.all()
+        snapshot = brand_list.get()
 
-        if not brands:
-            return {}
-        
-        for brand in brands:
-            brand_list[brand.id] = brand.brand_name
+        not_modified = get_conditional_response(request, etag=snapshot['etag'])
+        if not_modified is None:
+            response = HttpResponse(snapshot['body'], content_type='application/json')
+        else:
+            response = not_modified
 
-        return Response({
-            "status": "success",
-            "data":brand_list
-        }, status=status.HTTP_200_OK)
+        response['ETag'] = snapshot['etag']
+        patch_cache_control(response, public=True, max_age=settings.BRAND_LIST_MAX_AGE)
+
+        return response
 
 
 class UserRegistrationView(APIValidateView):
@@ -120,6 +135,7 @@ class AdminLoginView(APIValidateView):
             refresh = RefreshToken.for_user(admin)
             
             refresh['brand_name'] = brand_name
+            refresh['role'] = ADMIN_TOKEN_ROLE
             refresh.access_token['brand_name'] = brand_name
 
             serializer_data = BrandAdminSerializer(admin)
@@ -150,13 +166,54 @@ class AdminUsersView(APIValidateView):
         brand_name = request.brand_name
         users = Users.objects.using(brand_name).filter(brand_name=brand_name)
 
-        serializer_data = AdminUserSerializer(users, many=True)
+        fieldset = get_sparse_fieldset(request)
+        users = narrow_queryset(users, AdminUserSerializer, **fieldset)
+
+        serializer_data = AdminUserSerializer(users, many=True, **fieldset)
         return Response({
             "status":"success",
             "data":serializer_data.data
         }, status=status.HTTP_200_OK)
 
 
+class AdminUserImportView(APIValidateView):
+    """
+    Queue the import of the users of an uploaded CSV (email, password, firstname,
+    surname and optionally number_task, valid_user) in the admin's brand,
+    GET /api/admin/jobs/<job_id> reports the created count and the rejected rows
+    """
+
+    permission_classes = [AdminJWTAuthorization]
+
+    def post(self, request):
+
+        uploaded_file = request.FILES.get('file')
+
+        if not uploaded_file:
+            return Response({
+                "status": "error",
+                "message": "Upload the CSV as the `file` field"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            content = read_upload(uploaded_file)
+        except (InvalidImportFile, UnicodeDecodeError) as e:
+            return Response({
+                "status": "error",
+                "message": str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Hashing the passwords of a large file outlasts the worker timeout, the
+        # job worker (manage.py run_jobs) imports it and keeps the rejected rows in the job result
+        job = enqueue('import_users', request.brand_name, {'csv': content})
+
+        return Response({
+            "status": "success",
+            "message": "User import queued",
+            "data": {"job_id": job.id}
+        }, status=status.HTTP_202_ACCEPTED)
+
+
 class UpdateUserView(APIValidateView):
 
     permission_classes = [AdminJWTAuthorization]
@@ -188,13 +245,33 @@ class ContactInfoView(APIValidateView):
         brand_name = request.brand_name
 
         contacts = ContactUs.objects.using(brand_name).all()
-
-        serializer_data = ContactSerializer(contacts, many=True)
-
-        return Response({
+        # ?include_archived=1 adds the processed requests moved to the archive table
+        archived = None
+        if request.GET.get('include_archived') in ('1', 'true'):
+            archived = ArchivedContact.objects.using(brand_name).order_by('-created_at')
+
+        version = get_collection_version(contacts, brand_name, request.GET.urlencode())
+        if archived is not None:
+            version = merge_versions(version, get_collection_version(archived, brand_name, 'archived'))
+        not_modified = get_not_modified_response(request, version)
+        if not_modified is not None:
+            return not_modified
+
+        fieldset = get_sparse_fieldset(request)
+        contacts = narrow_queryset(contacts, ContactSerializer, **fieldset)
+
+        serializer_data = ContactSerializer(contacts, many=True, **fieldset)
+        data = serializer_data.data
+        if archived is not None:
+            archived = narrow_queryset(archived, ArchivedContactSerializer, **fieldset)
+            data = [*data, *ArchivedContactSerializer(archived, many=True, **fieldset).data]
+
+        response = Response({
             "status": "success",
-            "data" : serializer_data.data
+            "data" : data
         }, status=status.HTTP_200_OK)
+
+        return set_version_headers(response, version)
     
 
 class ModifyContactInfo(APIValidateView):
@@ -249,11 +326,122 @@ class AdminDeleteUserView(APIValidateView):
                 "message": "User not found"
             }, status=status.HTTP_404_NOT_FOUND)
         
-        Tasks.objects.using(brand.brand_name).filter(userid=userid).delete()
+        # Deleting a large user runs in chunks on the job worker (manage.py run_jobs)
+        job = enqueue('delete_user', brand.brand_name, {'userid': user.userid})
+
+        return Response({
+            "status": "success",
+            "message": "User deletion queued",
+            "data": {"job_id": job.id}
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class JobStatusView(APIValidateView):
+    """
+    Status and progress of a background job of the admin's brand
+    """
+
+    permission_classes = [AdminJWTAuthorization]
+
+    def get(self, request, job_id):
+
+        job = Job.objects.using('default').filter(id=job_id, brand_name=request.brand_name).first()
+
+        if not job:
+            return Response({
+                "status": "error",
+                "message": "Job not found"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            "status": "success",
+            "data": {
+                "job_id": job.id,
+                "kind": job.kind,
+                "status": job.status,
+                "attempts": job.attempts,
+                "progress": {"done": job.progress_done, "total": job.progress_total},
+                "error": job.error,
+                "result": job.result,
+                "created_at": job.created_at,
+                "updated_at": job.updated_at,
+            }
+        }, status=status.HTTP_200_OK)
+
+
+class QueryMetricsView(APIValidateView):
+    """
+    Query count / database time histograms of the admin's brand in the Prometheus text format
+    """
+
+    permission_classes = [AdminJWTAuthorization]
+
+    def get(self, request):
+
+        return HttpResponse(
+            metrics.render(request.brand_name),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+
+class ProfileListView(APIValidateView):
+    """
+    Latest request profiles of the admin's brand, without the call / SQL details
+    """
+
+    permission_classes = [AdminJWTAuthorization]
+
+    def get(self, request):
+
+        summary = [
+            {key: value for key, value in profile.items() if key not in ('queries', 'functions')}
+            for profile in profiles.list(request.brand_name)
+        ]
+
+        return Response({
+            "status": "success",
+            "data": summary
+        }, status=status.HTTP_200_OK)
 
-        user.delete(using=brand.brand_name)
+
+class ProfileDetailView(APIValidateView):
+    """
+    One request profile with its top functions and SQL timeline
+    """
+
+    permission_classes = [AdminJWTAuthorization]
+
+    def get(self, request, profile_id):
+
+        profile = profiles.get(profile_id, request.brand_name)
+
+        if profile is None:
+            return Response({
+                "status": "error",
+                "message": "Profile not found"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            "status": "success",
+            "data": profile
+        }, status=status.HTTP_200_OK)
+
+
+class DatabaseHealthView(APIValidateView):
+    """
+    Breaker state, error rate and latency of the admin's brand database and its replica
+    """
+
+    permission_classes = [AdminJWTAuthorization]
+
+    def get(self, request):
+
+        aliases = [request.brand_name]
+        replica = settings.TENANT_READ_REPLICAS.get(request.brand_name)
+        if replica:
+            aliases.append(replica)
 
         return Response({
             "status": "success",
-            "message": "User deleted successfully"
-        }, status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+            "data": health.status(aliases)
+        }, status=status.HTTP_200_OK)
@@ -3,4 +3,16 @@ from django.apps import AppConfig
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'app'
\ No newline at end of file
+    name = 'app'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+
+    def warm_up(self, log=None):
+        """
+        Open the database connections and prime the caches of this process, run
+        by `manage.py warm_up` and by the gunicorn post_worker_init hook
+        (gunicorn.conf.py) once the worker has loaded the app
+        """
+        from .warmup import warm_up
+        return warm_up(log)
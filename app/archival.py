@@ -0,0 +1,83 @@
+# Include Django Packages
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+# Include From the Project Directory
+from .models import Brand, Tasks, ContactUs, ArchivedTask, ArchivedContact
+from .cache import bump_version
+from .relocation import relocations
+
+# Include Built-in Package
+from datetime import timedelta
+
+
+# kind -> (hot model, archive model, extra filter, Brand retention field, retention setting)
+ARCHIVES = {
+    'tasks': (Tasks, ArchivedTask, {}, 'task_retention_days', 'ARCHIVE_TASKS_AFTER_DAYS'),
+    # Pending contact requests stay hot until an admin handles them
+    'contacts': (ContactUs, ArchivedContact, {'status': '1'}, 'contact_retention_days', 'ARCHIVE_CONTACTS_AFTER_DAYS'),
+}
+
+
+def retention_days(brand, kind):
+    """
+    Days a row of `kind` stays hot, None when the brand keeps everything hot
+    """
+    _, _, _, field, setting = ARCHIVES[kind]
+    days = getattr(brand, field, None) if brand is not None else None
+    return days if days is not None else getattr(settings, setting, None)
+
+
+def archive_rows(brand_name, kind, cutoff, chunk_size=1000, report=None):
+    """
+    Move the rows of `kind` not updated since `cutoff` into the archive table,
+    one short transaction per chunk. Archived rows are not deleted for the
+    change feed, they get no tombstone and stay readable with ?include_archived=1.
+    Returns the number of rows moved.
+    """
+    hot_model, archive_model, extra, _, _ = ARCHIVES[kind]
+    stale = hot_model.objects.using(brand_name).filter(updated_at__lt=cutoff, **extra)
+    columns = [(field.column, field.attname) for field in hot_model._meta.concrete_fields]
+
+    moved = 0
+    while True:
+        with transaction.atomic(using=brand_name):
+            rows = list(stale.order_by('id')[:chunk_size])
+            if not rows:
+                break
+
+            archive_model.objects.using(brand_name).bulk_create([
+                archive_model(**{column: getattr(row, attname) for column, attname in columns})
+                for row in rows
+            ])
+            hot_model.objects.using(brand_name).filter(id__in=[row.id for row in rows]).delete()
+            # Neither bulk_create nor the fast delete sends the signals that drop
+            # the cached reads and mirror the dual writes of a relocation
+            for model in (hot_model, archive_model):
+                transaction.on_commit(lambda model=model: bump_version(brand_name, model), using=brand_name)
+                relocations.mirror(model, brand_name, [row.id for row in rows])
+
+        moved += len(rows)
+        if report:
+            report(moved)
+    return moved
+
+
+def archive_brand(brand_name, chunk_size=None, report=None):
+    """
+    Archive every kind of row past the retention of the brand, returns kind -> rows moved
+    """
+    chunk_size = chunk_size or getattr(settings, 'ARCHIVE_CHUNK_SIZE', 1000)
+    brand = Brand.objects.using('default').filter(brand_name=brand_name).first()
+
+    moved = {}
+    for kind in ARCHIVES:
+        days = retention_days(brand, kind)
+        if days is None:
+            continue
+        cutoff = timezone.now() - timedelta(days=days)
+        done = sum(moved.values())
+        moved[kind] = archive_rows(brand_name, kind, cutoff, chunk_size, report and (lambda count: report(done + count)))
+    return moved
+
@@ -0,0 +1,192 @@
+# Include Django Packages
+from django.db import transaction
+from django.http import JsonResponse
+
+# Include DRF Packages
+from rest_framework import status
+
+# Include From the Project Directory
+from .models import Tasks
+from .jwt_auth import AsyncJWTAuthorization
+from .serializers import TaskSerializer
+from .changes import record_tombstones
+from .idempotency import idempotent
+from .utils import (
+    AsyncAPIValidateView, get_sparse_fieldset, narrow_queryset,
+    get_collection_version, get_not_modified_response, set_version_headers
+)
+
+# Include third-party packages
+from asgiref.sync import sync_to_async
+
+
+class AsyncCreateTaskAPIView(AsyncAPIValidateView):
+    """
+    Create a new task for the authenticated user.
+    """
+    permission_classes = [AsyncJWTAuthorization]
+
+    @idempotent
+    async def post(self, request):
+        data = request.data.copy()
+        user = request.user
+
+        brand_name = request.brand_name
+
+        if not user.valid_user:
+            return JsonResponse({
+                "status":"error",
+                "message": "You cannot create a task because you are not validated for it."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        total_tasks = await Tasks.objects.using(brand_name).filter(userid=user.userid).acount()
+
+        if total_tasks >= user.number_task:
+            return JsonResponse({
+                "status": "error",
+                "message": "You number of task reached so please contact us a admin for increase a task create limit."
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        data['userid'] = user.userid
+
+        # Validation runs the unique together check, so it needs a thread like any ORM call.
+        # The brand context is copied into that thread, so the router keeps the right database.
+        serializer = TaskSerializer(data=data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await sync_to_async(serializer.save)()
+
+        return JsonResponse({
+            'status': 'success',
+            'message': 'Task created successfully',
+            'data': serializer.data
+        }, status=status.HTTP_201_CREATED)
+
+
+class AsyncUpdateTaskAPIView(AsyncAPIValidateView):
+    """
+    Update an existing task.
+    """
+    permission_classes = [AsyncJWTAuthorization]
+
+    async def put(self, request):
+
+        task_id = request.data.get('id')
+        if not task_id:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Task ID is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        brand_name = request.brand_name
+
+        task = await Tasks.objects.using(brand_name).filter(id=task_id, userid=request.user.userid).afirst()
+        if not task:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Task not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = TaskSerializer(task, data=request.data, partial=True)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await sync_to_async(serializer.save)()
+
+        return JsonResponse({
+            'status': 'success',
+            'message': 'Task updated successfully',
+            'data': serializer.data
+        }, status=status.HTTP_200_OK)
+
+
+class AsyncDeleteTaskAPIView(AsyncAPIValidateView):
+    """
+    Delete a task.
+    """
+    permission_classes = [AsyncJWTAuthorization]
+
+    async def delete(self, request):
+        task_id = request.data.get('id')
+        if not task_id:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Task ID is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        brand_name = request.brand_name
+
+        task = await Tasks.objects.using(brand_name).filter(id=task_id, userid=request.user.userid).afirst()
+        if not task:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Task not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        await sync_to_async(self.delete_task)(brand_name, request.user.userid, task)
+
+        return JsonResponse({
+            'status': 'success',
+            'message': 'Task deleted successfully'
+        }, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def delete_task(brand_name, userid, task):
+        # The async ORM has no transactions, so the tombstone and delete run together in a thread
+        with transaction.atomic(using=brand_name):
+            record_tombstones(brand_name, 'tasks', [(userid, task.id)])
+            task.delete()
+
+
+class AsyncUserTasksListView(AsyncAPIValidateView):
+    """
+    Get all tasks for the authenticated user.
+    """
+    permission_classes = [AsyncJWTAuthorization]
+
+    async def get(self, request):
+        brand_name = request.brand_name
+
+        tasks_query = Tasks.objects.using(brand_name).filter(
+            userid=request.user.userid
+        ).order_by('-created_at')
+
+        # Pagination
+        page = int(request.GET.get('page', 1))
+        limit = int(request.GET.get('limit', 10))
+        start = (page - 1) * limit
+        end = start + limit
+
+        # Get total count for pagination info along with the list version
+        version = await sync_to_async(get_collection_version)(
+            tasks_query, brand_name, request.user.userid, request.GET.urlencode()
+        )
+        total_tasks = version['total']
+
+        not_modified = get_not_modified_response(request, version)
+        if not_modified is not None:
+            return not_modified
+
+        fieldset = get_sparse_fieldset(request)
+        tasks_query = narrow_queryset(tasks_query, TaskSerializer, **fieldset)
+
+        tasks = [task async for task in tasks_query[start:end]]
+
+        serializer = TaskSerializer(tasks, many=True, **fieldset)
+
+        total_pages = (total_tasks + limit - 1) // limit
+
+        response = JsonResponse({
+            'status': 'success',
+            'data': {
+                'tasks': serializer.data,
+                'pagination': {
+                    'current_page': page,
+                    'total_pages': total_pages,
+                    'total_tasks': total_tasks,
+                    'has_next': page < total_pages,
+                    'has_previous': page > 1,
+                    'limit': limit
+                },
+                'brand': brand_name
+            }
+        }, status=status.HTTP_200_OK)
+
+        return set_version_headers(response, version)
@@ -0,0 +1,232 @@
+# Include Django Packages
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.urls import resolve, Resolver404
+
+# Include From the Project Directory
+from .db_router import set_brand_context
+from .health import health, CLOSED
+from .ratelimit import admission
+from .registry import get_brand_limits
+from .relocation import relocations
+
+# Include Built-in Package
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Headers of the batch request a sub-request does not inherit
+PRIVATE_HEADERS = ('HTTP_IDEMPOTENCY_KEY', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_requests(data):
+    """
+    Validate the body of a batch request, returns (sub-requests, parallel)
+    """
+    items = data.get('requests') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BatchError("requests must be a non empty list.")
+
+    limit = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+    if len(items) > limit:
+        raise BatchError(f"A batch can hold at most {limit} requests.")
+
+    for item in items:
+        if not isinstance(item, dict) or not str(item.get('path', '')).startswith('/'):
+            raise BatchError("Every request needs a path starting with /.")
+        if not isinstance(item.get('headers', {}), dict):
+            raise BatchError("headers must be an object.")
+        item['method'] = str(item.get('method', 'GET')).upper()
+
+    parallel = bool(data.get('parallel'))
+    if parallel and any(item['method'] not in SAFE_METHODS for item in items):
+        raise BatchError("Only GET and HEAD requests can run in parallel.")
+
+    return items, parallel
+
+
+def build_request(request, item, decoded_tokens):
+    """
+    An in-process request for one sub-request, with the headers of the batch
+    request unless the sub-request sets its own
+    """
+    path, _, query_string = item['path'].partition('?')
+    body = json.dumps(item['body']).encode() if item.get('body') is not None else b''
+
+    environ = {
+        key: value for key, value in request.META.items()
+        if key not in PRIVATE_HEADERS and key not in ('CONTENT_TYPE', 'CONTENT_LENGTH')
+    }
+    environ.update({
+        'REQUEST_METHOD': item['method'],
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query_string,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': BytesIO(body),
+    })
+    for name, value in item.get('headers', {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = str(value)
+
+    sub_request = WSGIRequest(environ)
+    sub_request.brand_name = request.brand_name
+    # The bearer tokens are decoded once for the whole batch, see JWTAuthorization
+    sub_request.decoded_tokens = decoded_tokens
+    return sub_request
+
+
+def sub_response(status, body, headers=None):
+    return {'status': status, 'headers': headers or {}, 'body': body}
+
+
+def error_response(status, message):
+    return sub_response(status, {'status': 'error', 'message': message})
+
+
+def call_view(sub_request, charge):
+    """
+    Resolve and run one sub-request, returns its sub-response
+    """
+    try:
+        match = resolve(sub_request.path_info)
+    except Resolver404:
+        return error_response(404, "Not found.")
+
+    if match.url_name == 'batch':
+        return error_response(400, "Batches cannot be nested.")
+
+    if charge and getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        # The batch request itself paid for its first sub-request
+        rejected = admission.check_rate(sub_request, sub_request.brand_name, get_brand_limits(sub_request.brand_name))
+        if rejected is not None:
+            return sub_response(rejected.status_code, json.loads(rejected.content), {'Retry-After': rejected['Retry-After']})
+
+    try:
+        if iscoroutinefunction(match.func):
+            response = async_to_sync(match.func)(sub_request, *match.args, **match.kwargs)
+        else:
+            response = match.func(sub_request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    except Exception:
+        logger.exception("Sub-request %s %s failed", sub_request.method, sub_request.path)
+        return error_response(500, "The request failed.")
+
+    if response.streaming:
+        response.close()
+        return error_response(400, "Streaming endpoints cannot be batched.")
+
+    headers = {name: value for name, value in response.items() if name not in ('Content-Type', 'Content-Length')}
+    content = response.content
+    if not content:
+        body = None
+    elif 'json' in response.get('Content-Type', ''):
+        body = json.loads(content)
+    else:
+        body = content.decode(response.charset or 'utf-8', errors='replace')
+    return sub_response(response.status_code, body, headers)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def batch_executor():
+    """
+    The BATCH_MAX_WORKERS threads running the parallel reads of this worker,
+    shared by every batch. Their database connections outlive a batch like
+    the ones of the request threads, so at most BATCH_MAX_WORKERS more per alias.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BATCH_MAX_WORKERS', 4), thread_name_prefix='batch'
+            )
+        return _executor
+
+
+def run_sub_request(index, sub_request, brand_name):
+    """
+    One parallel read on a batch thread, its connections are handled as at
+    the start and end of a request: closed past CONN_MAX_AGE or when unusable
+    """
+    set_brand_context(brand_name)
+    close_old_connections()
+    # A persistent connection of this thread may still talk to a relocated brand's old database
+    relocations.apply()
+    try:
+        return call_view(sub_request, charge=index > 0)
+    finally:
+        close_old_connections()
+
+
+def run_parallel(sub_requests, brand_name):
+    """
+    Run the reads on the batch threads. The batch request went through the
+    breaker and admission checks of its brand once, the fan-out takes one
+    more request in flight: a brand at its concurrency limit or with a breaker
+    that is not closed gets the reads one after the other instead.
+    """
+    if health.breaker(brand_name).state != CLOSED:
+        return None
+
+    counted = getattr(settings, 'RATE_LIMIT_ENABLED', True)
+    if counted and not admission.enter(brand_name, get_brand_limits(brand_name)):
+        return None
+    try:
+        futures = [
+            batch_executor().submit(run_sub_request, index, sub_request, brand_name)
+            for index, sub_request in enumerate(sub_requests)
+        ]
+        return [future.result() for future in futures]
+    finally:
+        if counted:
+            admission.leave(brand_name)
+
+
+def run_batch(request, data):
+    """
+    Run the sub-requests of a batch in process under the tenant of the batch
+    request, in order on the request's database connection or, for reads,
+    in parallel. Returns the sub-responses in the order of the sub-requests.
+    """
+    items, parallel = parse_requests(data)
+    decoded_tokens = {}
+    sub_requests = [build_request(request, item, decoded_tokens) for item in items]
+
+    if parallel and len(sub_requests) > 1:
+        responses = run_parallel(sub_requests, request.brand_name)
+        if responses is not None:
+            return responses
+
+    responses = [call_view(sub_request, charge=index > 0) for index, sub_request in enumerate(sub_requests)]
+    # A sub-view may have switched the brand context, restore the batch's one
+    set_brand_context(request.brand_name)
+    return responses
+
+
+def decode_token(request, token, decode):
+    """
+    `decode(token)`, decoded once per batch for the sub-requests of a batch
+    """
+    decoded_tokens = getattr(request, 'decoded_tokens', None)
+    if decoded_tokens is None:
+        return decode(token)
+    # User and admin decoding refuse each other's tokens
+    key = (decode, token)
+    if key not in decoded_tokens:
+        decoded_tokens[key] = decode(token)
+    return decoded_tokens[key]
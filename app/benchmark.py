@@ -0,0 +1,263 @@
+# Include Django Packages
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client
+
+# Include DRF Packages
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Include From the Project Directory
+from .models import Brand, BrandAdmin, Users, Tasks, ContactUs
+from .cache import bump_version
+from .directory import backfill_alias
+from .utils import ADMIN_TOKEN_ROLE
+
+# Include Built-in Package
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, cycle
+import bcrypt
+import json
+import platform
+import threading
+import time
+
+
+BENCH_PASSWORD = 'benchmark-password'
+
+
+def tenant_aliases():
+    """
+    Brand aliases of the benchmark settings, everything except `default`
+    """
+    return [alias for alias in settings.DATABASES if alias != 'default']
+
+
+def seed(users=100, tasks=10, contacts=1, stdout=None):
+    """
+    Create the tables, one Brand + BrandAdmin per tenant and `users` users with
+    `tasks` tasks and `contacts` contact requests each in every tenant database
+    """
+    for alias in settings.DATABASES:
+        call_command('migrate', run_syncdb=True, database=alias, verbosity=0)
+
+    password = make_password(BENCH_PASSWORD)
+    admin_password = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(rounds=4)).decode()
+
+    for alias in tenant_aliases():
+        Brand.objects.using('default').update_or_create(
+            brand_name=alias,
+            defaults={'database_name': alias, 'subdomain': alias, 'db_user': alias, 'is_active': True},
+        )
+        BrandAdmin.objects.using('default').get_or_create(
+            email=f'admin@{alias}.bench', brand_name=alias,
+            defaults={'firstname': 'Bench', 'surname': 'Admin', 'password': admin_password, 'is_active': True},
+        )
+
+        Tasks.objects.using(alias).all().delete()
+        ContactUs.objects.using(alias).all().delete()
+        Users.objects.using(alias).all().delete()
+
+        Users.objects.using(alias).bulk_create([
+            Users(
+                email=f'user{index}@{alias}.bench', password=password, firstname='Bench', surname=f'User {index}',
+                brand_name=alias, valid_user=True, number_task=10 ** 6,
+            )
+            for index in range(users)
+        ], batch_size=500)
+
+        userids = list(Users.objects.using(alias).values_list('userid', flat=True))
+        Tasks.objects.using(alias).bulk_create([
+            Tasks(userid_id=userid, saved_search=f'seed {index}', min_price=index, max_price=index + 100)
+            for userid in userids
+            for index in range(tasks)
+        ], batch_size=1000)
+        ContactUs.objects.using(alias).bulk_create([
+            ContactUs(
+                userid=userid, firstname='Bench', surname='User', email=f'{userid}@{alias}.bench',
+                saved_search=f'{userid} contact {index}', request_for_task=5, status='1',
+            )
+            for userid in userids
+            for index in range(contacts)
+        ], batch_size=1000)
+
+        # bulk_create sends no post_save, drop the cached reads and fill the login directory by hand
+        for model in (Users, Tasks, ContactUs):
+            bump_version(alias, model)
+        backfill_alias(alias)
+
+        if stdout:
+            stdout.write(f"Seeded {alias}: {users} users, {users * tasks} tasks, {users * contacts} contacts")
+
+
+def access_token(principal, brand_name, role=None):
+    refresh = RefreshToken.for_user(principal)
+    refresh['brand_name'] = brand_name
+    if role:
+        refresh['role'] = role
+    access = refresh.access_token
+    access['brand_name'] = brand_name
+    return str(access)
+
+
+class Scenario:
+    """
+    One scripted request, `request(client)` must return the response
+    """
+
+    def __init__(self, name, request, expected_status):
+        self.name = name
+        self.request = request
+        self.expected_status = expected_status
+
+
+def build_scenarios():
+    """
+    login, list tasks, create task and admin list users, rotating over every tenant and user
+    """
+    users = []
+    admins = []
+    for alias in tenant_aliases():
+        for user in Users.objects.using(alias).only('userid', 'email', 'brand_name'):
+            users.append((alias, user.email, access_token(user, alias)))
+        admin = BrandAdmin.objects.using('default').get(email=f'admin@{alias}.bench', brand_name=alias)
+        admins.append(access_token(admin, alias, ADMIN_TOKEN_ROLE))
+
+    next_user = cycle(users).__next__
+    next_admin = cycle(admins).__next__
+    task_numbers = count()
+    run_id = format(time.time_ns(), 'x')
+    lock = threading.Lock()
+
+    def pick(picker):
+        with lock:
+            return picker()
+
+    def login(client):
+        alias, email, _ = pick(next_user)
+        return client.post('/login', {'email': email, 'password': BENCH_PASSWORD},
+                           content_type='application/json', HTTP_X_BRAND_NAME=alias)
+
+    def list_tasks(client):
+        alias, _, token = pick(next_user)
+        return client.get('/my-tasks', HTTP_X_BRAND_NAME=alias, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def create_task(client):
+        alias, _, token = pick(next_user)
+        number = pick(task_numbers.__next__)
+        data = {'saved_search': f'bench {run_id} {number}', 'min_price': 1, 'max_price': 2}
+        return client.post('/create-task', data, content_type='application/json',
+                           HTTP_X_BRAND_NAME=alias, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def admin_list_users(client):
+        token = pick(next_admin)
+        return client.get('/api/admin/users', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    return {
+        'login': Scenario('login', login, 200),
+        'list_tasks': Scenario('list_tasks', list_tasks, 200),
+        'create_task': Scenario('create_task', create_task, 201),
+        'admin_list_users': Scenario('admin_list_users', admin_list_users, 200),
+    }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(scenario, requests=200, concurrency=1, warmup=10):
+    """
+    Drive the scenario through the whole middleware stack in-process and
+    return latency percentiles (milliseconds) and throughput
+    """
+    client = Client()
+    for _ in range(warmup):
+        scenario.request(client)
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(share):
+        nonlocal errors
+        worker_client = Client()
+        local_latencies = []
+        local_errors = 0
+        for _ in range(share):
+            start = time.perf_counter()
+            response = scenario.request(worker_client)
+            local_latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != scenario.expected_status:
+                local_errors += 1
+        connections.close_all()
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    shares = [requests // concurrency + (1 if index < requests % concurrency else 0) for index in range(concurrency)]
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        worker(requests)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, shares))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'concurrency': concurrency,
+        'elapsed_seconds': round(elapsed, 4),
+        'requests_per_second': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+    }
+
+
+def run(scenario_names=None, requests=200, concurrency=1, warmup=10):
+    scenarios = build_scenarios()
+    names = scenario_names or list(scenarios)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'tenants': len(tenant_aliases()),
+            'users': Users.objects.using(tenant_aliases()[0]).count() if tenant_aliases() else 0,
+            'requests': requests,
+            'concurrency': concurrency,
+        },
+        'scenarios': {
+            name: run_scenario(scenarios[name], requests, concurrency, warmup)
+            for name in names
+        },
+    }
+
+
+def compare(baseline, current):
+    """
+    Relative change of the headline numbers of every scenario present in both runs
+    """
+    changes = {}
+    for name, result in current['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        changes[name] = {
+            key: round((result[key] - previous[key]) / previous[key] * 100, 1) if previous[key] else None
+            for key in ('requests_per_second', 'p50_ms', 'p95_ms', 'p99_ms')
+        }
+    return changes
+
+
+def load_report(path):
+    with open(path) as report:
+        return json.load(report)
@@ -0,0 +1,141 @@
+# Include Django Packages
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+# Include From the Project Directory
+from .singleflight import group
+
+# Include Built-in Package
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Refreshes stale entries off the request path
+_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-refresh')
+
+
+def get_cache():
+    return caches[getattr(settings, 'TENANT_CACHE_ALIAS', 'default')]
+
+
+def make_key(brand_name, *parts):
+    """
+    Every key starts with the brand, so two tenants can never read each other's entries
+    """
+    raw = ':'.join(str(part) for part in parts)
+    if len(raw) > 150:
+        raw = hashlib.sha1(raw.encode()).hexdigest()
+    return f'tenant:{brand_name}:{raw}'
+
+
+def model_label(model):
+    return model if isinstance(model, str) else model._meta.label_lower
+
+
+def version_key(brand_name, model):
+    return make_key(brand_name, 'version', model_label(model))
+
+
+def get_versions(brand_name, models):
+    """
+    Current cache version of every (brand, model), new versions start from the clock
+    so an evicted version key never brings old entries back
+    """
+    cache = get_cache()
+    keys = [version_key(brand_name, model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(brand_name, model):
+    """
+    Invalidate every cached read of `model` in the brand
+    """
+    cache = get_cache()
+    key = version_key(brand_name, model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def versioned_key(brand_name, models, *parts):
+    return make_key(brand_name, *parts, *get_versions(brand_name, models))
+
+
+def get_timeouts(timeout=None):
+    return (
+        timeout or getattr(settings, 'TENANT_CACHE_TIMEOUT', 300),
+        getattr(settings, 'TENANT_CACHE_STALE_TIMEOUT', 60),
+    )
+
+
+def store(key, compute, timeout=None):
+    """
+    Compute and cache a value, the entry is fresh for `timeout` seconds and may
+    be served stale for TENANT_CACHE_STALE_TIMEOUT more while it is refreshed
+    """
+    fresh_timeout, stale_timeout = get_timeouts(timeout)
+    value = compute()
+    get_cache().set(key, (value, time.time() + fresh_timeout), timeout=fresh_timeout + stale_timeout)
+    return value
+
+
+def refresh_in_background(key, compute, timeout=None):
+    if group.in_flight(key):
+        return
+
+    def refresh():
+        try:
+            group.do(key, lambda: store(key, compute, timeout))
+        except Exception:
+            logger.exception("Refreshing cache entry %s failed", key)
+        finally:
+            connections.close_all()
+
+    _refresher.submit(refresh)
+
+
+def read_entry(key, entry, compute, timeout=None):
+    """
+    Value of a cached entry, a stale one is served as is and refreshed in the background
+    """
+    value, fresh_until = entry
+    if time.time() >= fresh_until:
+        refresh_in_background(key, compute, timeout)
+    return value
+
+
+def cached(brand_name, models, key_parts, compute, timeout=None):
+    """
+    Return the cached value of `key_parts` for the brand or store `compute()`,
+    the entry is dropped as soon as one of `models` changes in that brand.
+    Concurrent misses of the same key in this worker share one compute()
+    """
+    key = versioned_key(brand_name, models, *key_parts)
+    entry = get_cache().get(key)
+    if entry is not None:
+        return read_entry(key, entry, compute, timeout)
+    return group.do(key, lambda: store(key, compute, timeout))
+
+
+def cached_query(*models, timeout=None):
+    """
+    Decorator for functions whose first argument is the brand name, the result
+    is cached per brand and arguments until one of `models` changes
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(brand_name, *args):
+            return cached(brand_name, models, (func.__qualname__, *args), lambda: func(brand_name, *args), timeout)
+        return wrapper
+    return decorator
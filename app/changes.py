@@ -0,0 +1,197 @@
+# Include Django Packages
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Include From the Project Directory
+from .models import Tasks, ContactUs, Tombstone
+from .serializers import TaskSerializer, ContactSerializer
+from .cache import bump_version
+from .health import health
+from .relocation import relocations
+
+# Include Built-in Package
+from datetime import timedelta
+import base64
+import json
+
+
+# stream name -> (model, cursor timestamp field, serializer)
+CHANGE_STREAMS = {
+    'tasks': (Tasks, 'updated_at', TaskSerializer),
+    'contacts': (ContactUs, 'updated_at', ContactSerializer),
+    'deleted': (Tombstone, 'deleted_at', None),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(positions):
+    """
+    Pack the per-stream (timestamp, id) positions and the time the cursor was
+    issued into an opaque token
+    """
+    payload = json.dumps({**positions, 'issued_at': timezone.now().isoformat()}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def tombstone_cutoff():
+    """
+    Tombstones older than this are pruned, None when they are kept forever
+    """
+    days = getattr(settings, 'TOMBSTONE_RETENTION_DAYS', None)
+    return timezone.now() - timedelta(days=days) if days is not None else None
+
+
+def decode_cursor(token):
+    """
+    Unpack a cursor token, an empty token means "from the beginning"
+    """
+    if not token:
+        return {}
+
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        issued_at = payload.pop('issued_at', None)
+        positions = {}
+        for stream, (timestamp, object_id) in payload.items():
+            if stream in CHANGE_STREAMS:
+                positions[stream] = (parse_datetime(timestamp), int(object_id))
+        issued_at = parse_datetime(issued_at) if issued_at else None
+    except (ValueError, TypeError, AttributeError):
+        raise InvalidCursor("Invalid cursor")
+
+    if any(timestamp is None for timestamp, _ in positions.values()):
+        raise InvalidCursor("Invalid cursor")
+
+    # The deletions since an older cursor may have been pruned already
+    cutoff = tombstone_cutoff()
+    if cutoff is not None and issued_at is not None and issued_at < cutoff:
+        raise InvalidCursor("This cursor expired, sync again without a cursor")
+
+    return positions
+
+
+def prune_tombstones(brand_name, chunk_size=1000):
+    """
+    Delete the tombstones past TOMBSTONE_RETENTION_DAYS, returns the number deleted
+    """
+    cutoff = tombstone_cutoff()
+    if cutoff is None:
+        return 0
+
+    expired = Tombstone.objects.using(brand_name).filter(deleted_at__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(expired.order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        Tombstone.objects.using(brand_name).filter(id__in=ids)._raw_delete(brand_name)
+        relocations.mirror(Tombstone, brand_name, ids)
+        deleted += len(ids)
+
+
+def record_tombstones(brand_name, model_name, rows):
+    """
+    Remember deleted rows, `rows` is an iterable of (userid, object_id)
+    """
+    tombstones = [
+        Tombstone(userid=userid, model_name=model_name, object_id=object_id)
+        for userid, object_id in rows
+    ]
+    if tombstones:
+        Tombstone.objects.using(brand_name).bulk_create(tombstones)
+
+    # Tasks and contacts keep fast deletes without a post_delete receiver
+    # (see app/signals.py), drop their cached reads once the delete is committed
+    if tombstones and model_name in CHANGE_STREAMS:
+        model = CHANGE_STREAMS[model_name][0]
+        transaction.on_commit(lambda: bump_version(brand_name, model), using=brand_name)
+        relocations.mirror(model, brand_name, [tombstone.object_id for tombstone in tombstones])
+
+
+def get_changes(brand_name, userid, cursor=None, limit=100, streams=None):
+    """
+    Return everything that changed for a user after the cursor, in every
+    stream or only `streams`. Every stream walks the (userid, timestamp, id)
+    index so the cost is O(changes).
+    """
+    positions = decode_cursor(cursor)
+    changes = {}
+    has_more = False
+    database = health.read_alias(brand_name)
+
+    for stream, (model, timestamp_field, serializer_class) in CHANGE_STREAMS.items():
+        if streams is not None and stream not in streams:
+            continue
+        queryset = model.objects.using(database).filter(userid=userid)
+
+        if stream in positions:
+            timestamp, object_id = positions[stream]
+            queryset = queryset.filter(
+                Q(**{f'{timestamp_field}__gt': timestamp}) |
+                Q(**{timestamp_field: timestamp, 'id__gt': object_id})
+            )
+
+        rows = list(queryset.order_by(timestamp_field, 'id')[:limit + 1])
+        if len(rows) > limit:
+            has_more = True
+            rows = rows[:limit]
+
+        if rows:
+            last = rows[-1]
+            positions[stream] = (getattr(last, timestamp_field), last.id)
+
+        if serializer_class:
+            changes[stream] = serializer_class(rows, many=True).data
+        else:
+            changes[stream] = [
+                {'model': row.model_name, 'id': row.object_id, 'deleted_at': row.deleted_at}
+                for row in rows
+            ]
+
+    next_cursor = encode_cursor({
+        stream: (timestamp.isoformat(), object_id)
+        for stream, (timestamp, object_id) in positions.items()
+    })
+
+    return {
+        'changes': changes,
+        'cursor': next_cursor,
+        'has_more': has_more,
+    }
+
+
+def head_cursor(brand_name, userid):
+    """
+    Cursor positioned after the latest contact request change of a user
+    """
+    latest = ContactUs.objects.using(health.read_alias(brand_name)).filter(userid=userid).order_by(
+        '-updated_at', '-id'
+    ).values_list('updated_at', 'id').first()
+    return encode_cursor({'contacts': (latest[0].isoformat(), latest[1])} if latest else {})
+
+
+def contact_events(brand_name, userid, cursor):
+    """
+    (events, next cursor) of the contact requests changed after `cursor`, the
+    event stream replays them from the change feed so nothing published while
+    the client was away is lost
+    """
+    data = get_changes(brand_name, userid, cursor, streams=('contacts',))
+    events = [
+        {
+            'type': 'contact.approved' if str(contact['status']) == '1' else 'contact.updated',
+            'contact_id': contact['id'],
+            'status': str(contact['status']),
+            'request_for_task': contact['request_for_task'],
+            # An approval sets the user's number_task to the requested count
+            'number_task': contact['request_for_task'] if str(contact['status']) == '1' else None,
+        }
+        for contact in data['changes']['contacts']
+    ]
+    return events, data['cursor']
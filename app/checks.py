@@ -0,0 +1,26 @@
+# Include Django Packages
+from django.conf import settings
+from django.core.checks import Error, register, Tags
+
+# Backends whose entries live in one process, invisible to the other workers
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register(Tags.caches)
+def check_tenant_cache(app_configs, **kwargs):
+    """
+    The tenant cache holds the version keys that invalidate cached pages, the
+    idempotency locks and stored responses. In a process-local backend none of
+    that reaches the other gunicorn workers or the run_jobs process.
+    """
+    alias = getattr(settings, 'TENANT_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error(
+        f"The tenant cache '{alias}' uses {backend}, which is not shared between processes.",
+        hint="Point CACHE_BACKEND / CACHE_LOCATION at memcached or redis.",
+        id='app.E001',
+    )]
@@ -1,7 +1,13 @@
 from django.conf import settings
-import threading
+from contextvars import ContextVar
+from .health import health
 
-_thread_locals = threading.local()
+# A context variable behaves like a thread local for sync requests and also
+# follows each request across awaits, so concurrent async requests keep their own brand
+_brand_context = ContextVar('brand_name', default=None)
+
+# Models of the app that live only in the default database
+GLOBAL_MODELS = ['brand', 'job', 'logindirectory', 'relocation']
 
 class MultiTenantRouter:
     """
@@ -14,13 +20,14 @@ class MultiTenantRouter:
         admin_apps = ['admin', 'auth', 'contenttypes', 'sessions']
         
         if (model._meta.app_label in admin_apps or 
-            model._meta.model_name == 'brand'):
+            model._meta.model_name in GLOBAL_MODELS):
             return 'default'
         
         if model._meta.app_label == 'app':
-            brand_name = getattr(_thread_locals, 'brand_name', None) or getattr(settings, 'CURRENT_BRAND_NAME', None)
+            brand_name = _brand_context.get() or getattr(settings, 'CURRENT_BRAND_NAME', None)
             if brand_name and brand_name != 'default' and brand_name in settings.DATABASES:
-                return brand_name
+                # Reads move to the brand's replica while its breaker is open
+                return health.read_alias(brand_name)
         return 'default'
 
     def db_for_write(self, model, **hints):
@@ -28,20 +35,20 @@ class MultiTenantRouter:
 
         admin_apps = ['admin', 'auth', 'contenttypes', 'sessions']
         if (model._meta.app_label in admin_apps or 
-            model._meta.model_name == 'brand'):
+            model._meta.model_name in GLOBAL_MODELS):
             return 'default'
             
         if model._meta.app_label == 'app':
-            brand_name = getattr(_thread_locals, 'brand_name', None) or getattr(settings, 'CURRENT_BRAND_NAME', None)
+            brand_name = _brand_context.get() or getattr(settings, 'CURRENT_BRAND_NAME', None)
             if brand_name and brand_name != 'default' and brand_name in settings.DATABASES:
                 return brand_name
         return 'default'
 
 def set_brand_context(brand_name):
-    """Set brand context for current thread"""
-    _thread_locals.brand_name = brand_name
+    """Set brand context for current thread / async task"""
+    _brand_context.set(brand_name)
     settings.CURRENT_BRAND_NAME = brand_name
 
 def get_brand_context():
-    """Get brand context for current thread"""
-    return getattr(_thread_locals, 'brand_name', 'default') 
\ No newline at end of file
+    """Get brand context for current thread / async task"""
+    return _brand_context.get() or 'default' 
\ No newline at end of file
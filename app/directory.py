@@ -0,0 +1,121 @@
+# Include Django Packages
+from django.conf import settings
+from django.db import connections, transaction
+
+# Include From the Project Directory
+from .models import LoginDirectory, Users
+
+# Include Built-in Package
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def email_hash(email):
+    """
+    Directory key of an email, the same for every spelling of its case
+    """
+    return hashlib.sha256(email.strip().lower().encode()).hexdigest()
+
+
+def lookup(email):
+    """
+    (brand_name, shard) of every tenant the email is registered with, one indexed query
+    """
+    return list(
+        LoginDirectory.objects.using('default').filter(email_hash=email_hash(email)).values_list('brand_name', 'shard')
+    )
+
+
+def sync_user(user, using):
+    """
+    Point the directory entry of the user at their current email and brand once
+    the brand transaction commits. A failure leaves the user row alone, the
+    entry is repaired by `manage.py backfill_login_directory`.
+    """
+    userid, email, brand_name = user.userid, user.email, user.brand_name
+
+    def write():
+        try:
+            # userid is unique within the shard, an entry under another brand is the user's old one
+            LoginDirectory.objects.using('default').filter(shard=using, userid=userid).exclude(brand_name=brand_name).delete()
+            add_users(using, [(userid, email, brand_name)])
+        except Exception:
+            logger.warning("Could not update the login directory entry of user %s in %s", userid, using, exc_info=True)
+
+    transaction.on_commit(write, using=using)
+
+
+def remove_user(user, using):
+    userid = user.userid
+
+    def write():
+        try:
+            LoginDirectory.objects.using('default').filter(shard=using, userid=userid).delete()
+        except Exception:
+            logger.warning("Could not remove the login directory entry of user %s in %s", userid, using, exc_info=True)
+
+    transaction.on_commit(write, using=using)
+
+
+def add_users(using, rows):
+    """
+    Upsert directory entries for `rows` of (userid, email, brand_name) in the `using` database
+    """
+    entries = [
+        LoginDirectory(email_hash=email_hash(email), brand_name=brand_name, userid=userid, shard=using)
+        for userid, email, brand_name in rows
+    ]
+    if not entries:
+        return
+
+    options = {'update_conflicts': True, 'update_fields': ['email_hash', 'shard']}
+    if connections['default'].features.supports_update_conflicts_with_target:
+        options['unique_fields'] = ['brand_name', 'userid']
+    LoginDirectory.objects.using('default').bulk_create(entries, batch_size=1000, **options)
+
+
+def backfill_alias(alias, chunk_size=5000):
+    """
+    Upsert an entry for every user of a tenant database and drop the entries of
+    users that are gone, returns the number of users seen
+    """
+    seen = {}
+    rows = []
+    users = Users.objects.using(alias).order_by().values_list('userid', 'email', 'brand_name')
+    for row in users.iterator(chunk_size=chunk_size):
+        rows.append(row)
+        seen.setdefault(row[2], set()).add(row[0])
+        if len(rows) >= chunk_size:
+            add_users(alias, rows)
+            rows = []
+    add_users(alias, rows)
+
+    stale = [
+        entry_id
+        for entry_id, brand_name, userid in LoginDirectory.objects.using('default').filter(shard=alias)
+        .values_list('id', 'brand_name', 'userid').iterator(chunk_size=chunk_size)
+        if userid not in seen.get(brand_name, ())
+    ]
+    for start in range(0, len(stale), chunk_size):
+        LoginDirectory.objects.using('default').filter(id__in=stale[start:start + chunk_size]).delete()
+
+    return sum(len(userids) for userids in seen.values())
+
+
+def backfill(aliases=None, workers=4):
+    """
+    Rebuild the directory from every tenant database, the tenants are scanned in parallel
+    """
+    aliases = aliases or list(settings.DATABASES)
+
+    def scan(alias):
+        try:
+            return backfill_alias(alias)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(aliases, executor.map(scan, aliases)))
@@ -0,0 +1,200 @@
+# Include Django Packages
+from django.conf import settings
+
+# Include Built-in Package
+from collections import defaultdict
+from urllib.parse import urlparse
+import asyncio
+import json
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    One waiting client, events are handed over to its event loop
+    """
+
+    def __init__(self, brand_name, userid):
+        self.brand_name = brand_name
+        self.userid = userid
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=100)
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client that does not read its events should not grow memory
+            pass
+
+
+class EventHub:
+    """
+    In-process pub/sub of events keyed by (brand, userid)
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, brand_name, userid):
+        subscription = Subscription(brand_name, int(userid))
+        with self._lock:
+            self._subscriptions[(brand_name, subscription.userid)].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        key = (subscription.brand_name, subscription.userid)
+        with self._lock:
+            self._subscriptions[key].discard(subscription)
+            if not self._subscriptions[key]:
+                del self._subscriptions[key]
+
+    def dispatch(self, brand_name, userid, event):
+        """
+        Hand an event to every local subscriber of (brand, userid), safe from any thread
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get((brand_name, int(userid)), ()))
+
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # The loop of a finished request is already closed
+                self.unsubscribe(subscription)
+
+
+hub = EventHub()
+
+
+class LocalBrokerClient:
+    """
+    Client for the `run_event_broker` command, a local stand-in for a real
+    message broker that fans events out to every worker process
+    """
+
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 8765)
+        self._publisher = None
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        line = (json.dumps(message, default=str) + '\n').encode()
+        with self._lock:
+            for _ in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = socket.create_connection(self.address, timeout=2)
+                        self._publisher.sendall(b'PUBLISH\n')
+                    self._publisher.sendall(line)
+                    return True
+                except OSError:
+                    self._close_publisher()
+        return False
+
+    def _close_publisher(self):
+        if self._publisher is not None:
+            try:
+                self._publisher.close()
+            except OSError:
+                pass
+        self._publisher = None
+
+    def listen(self):
+        """
+        Feed every event published by any worker into the local hub, reconnecting forever
+        """
+        backoff = 1
+        while True:
+            try:
+                with socket.create_connection(self.address, timeout=10) as conn:
+                    conn.settimeout(None)
+                    conn.sendall(b'SUBSCRIBE\n')
+                    backoff = 1
+                    for line in conn.makefile('rb'):
+                        message = json.loads(line)
+                        hub.dispatch(message['brand_name'], message['userid'], message['event'])
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Event broker connection lost: %s", e)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    The configured broker client, or None to keep events in this process
+    """
+    global _broker
+    url = getattr(settings, 'EVENT_BROKER_URL', None)
+    if not url:
+        return None
+
+    with _broker_lock:
+        if _broker is None:
+            _broker = LocalBrokerClient(url)
+    return _broker
+
+
+def publish_event(brand_name, userid, event):
+    """
+    Push an event to every client of (brand, userid) waiting on the event stream
+    """
+    broker = get_broker()
+    message = {'brand_name': brand_name, 'userid': int(userid), 'event': event}
+
+    if broker is not None and broker.publish(message):
+        return
+
+    hub.dispatch(brand_name, userid, event)
+
+
+def start_event_listener():
+    """
+    Subscribe this worker to the broker, a no-op without EVENT_BROKER_URL
+    """
+    broker = get_broker()
+    if broker is None:
+        return None
+
+    thread = threading.Thread(target=broker.listen, name='event-broker-listener', daemon=True)
+    thread.start()
+    return thread
+
+
+async def run_broker(host, port):
+    """
+    Tiny line based fan-out server used by the `run_event_broker` command
+    """
+    subscribers = set()
+
+    async def handle(reader, writer):
+        role = (await reader.readline()).strip()
+        try:
+            if role == b'SUBSCRIBE':
+                subscribers.add(writer)
+                await reader.read()
+            elif role == b'PUBLISH':
+                while line := await reader.readline():
+                    for subscriber in list(subscribers):
+                        try:
+                            subscriber.write(line)
+                        except (ConnectionError, RuntimeError):
+                            subscribers.discard(subscriber)
+        finally:
+            subscribers.discard(writer)
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
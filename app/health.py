@@ -0,0 +1,236 @@
+# Include Django Packages
+from django.conf import settings
+from django.http import JsonResponse
+from django.db.utils import InterfaceError, OperationalError
+
+# Include Built-in Package
+from collections import deque
+import threading
+import time
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class TenantUnavailable(Exception):
+    """
+    The database of a tenant is marked unhealthy, the request fails fast instead of waiting on it
+    """
+
+    def __init__(self, alias, retry_after):
+        self.alias = alias
+        self.retry_after = retry_after
+        super().__init__(f"The {alias} database is unavailable, please retry in {retry_after} seconds.")
+
+
+class CircuitBreaker:
+    """
+    Health of one database alias: error rate over a sliding window, latency
+    EWMA and a closed -> open -> half open -> closed breaker
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.state = CLOSED
+        self.opened_at = None
+        self.probe_started = None
+        self.latency_ewma = None
+        self.outcomes = deque()
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def config(name, default):
+        return getattr(settings, name, default)
+
+    def open_seconds(self):
+        return self.config('DB_BREAKER_OPEN_SECONDS', 15)
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(1, int(self.opened_at + self.open_seconds() - time.monotonic()) + 1)
+
+    def allow_request(self):
+        """
+        Whether a request may use the alias, an open breaker lets one probe
+        request through once DB_BREAKER_OPEN_SECONDS have passed
+        """
+        if self.state == CLOSED:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.open_seconds():
+                self.state = HALF_OPEN
+                self.probe_started = None
+                # The probe is judged by its own latency, the EWMA that tripped
+                # the breaker would stay above the threshold for several probes
+                self.latency_ewma = None
+            if self.state == HALF_OPEN:
+                # One probe at a time, a probe that never reported back is replaced
+                if self.probe_started is None or now - self.probe_started >= self.open_seconds():
+                    self.probe_started = now
+                    return True
+            return False
+
+    def allow_query(self):
+        """
+        Queries are only refused while the breaker is open, a half open breaker
+        lets the probe request run all of its queries
+        """
+        return self.state != OPEN
+
+    def record(self, duration=None, error=None):
+        now = time.monotonic()
+        with self._lock:
+            if error is None:
+                alpha = self.config('DB_LATENCY_EWMA_ALPHA', 0.2)
+                self.latency_ewma = duration if self.latency_ewma is None else (
+                    alpha * duration + (1 - alpha) * self.latency_ewma
+                )
+            else:
+                self.last_error = str(error)
+
+            if self.state == HALF_OPEN:
+                if error is None and not self.too_slow():
+                    self.close()
+                else:
+                    self.trip(now)
+                return
+
+            window = self.config('DB_BREAKER_WINDOW', 30)
+            self.outcomes.append((now, error is not None))
+            while self.outcomes and self.outcomes[0][0] < now - window:
+                self.outcomes.popleft()
+
+            if self.state == CLOSED and (self.failing() or self.too_slow()):
+                self.trip(now)
+
+    def failing(self):
+        if len(self.outcomes) < self.config('DB_BREAKER_MIN_REQUESTS', 10):
+            return False
+        errors = sum(1 for _, failed in self.outcomes if failed)
+        return errors / len(self.outcomes) >= self.config('DB_BREAKER_ERROR_RATE', 0.5)
+
+    def too_slow(self):
+        threshold = self.config('DB_BREAKER_LATENCY_THRESHOLD', None)
+        return threshold is not None and self.latency_ewma is not None and self.latency_ewma >= threshold
+
+    def trip(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self.probe_started = None
+
+    def close(self):
+        self.state = CLOSED
+        self.opened_at = None
+        self.probe_started = None
+        self.outcomes.clear()
+
+    def as_dict(self):
+        errors = sum(1 for _, failed in self.outcomes if failed)
+        return {
+            'alias': self.alias,
+            'state': self.state,
+            'error_rate': round(errors / len(self.outcomes), 3) if self.outcomes else 0.0,
+            'latency_ewma_ms': round(self.latency_ewma * 1000, 3) if self.latency_ewma is not None else None,
+            'retry_after': self.retry_after() if self.state != CLOSED else 0,
+            'last_error': self.last_error,
+        }
+
+
+class HealthRegistry:
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, alias):
+        breaker = self._breakers.get(alias)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(alias, CircuitBreaker(alias))
+        return breaker
+
+    def check_request(self, alias):
+        """
+        Raise TenantUnavailable when a request must not wait on the alias
+        """
+        breaker = self.breaker(alias)
+        if not breaker.allow_request():
+            raise TenantUnavailable(alias, breaker.retry_after())
+
+    def replica_for(self, alias):
+        """
+        Healthy read replica of the alias (TENANT_READ_REPLICAS), None when there is none
+        """
+        replica = getattr(settings, 'TENANT_READ_REPLICAS', {}).get(alias)
+        if replica and replica in settings.DATABASES and self.breaker(replica).allow_query():
+            return replica
+        return None
+
+    def read_alias(self, alias):
+        """
+        The alias to read from: the alias itself, or its replica while its breaker is open
+        """
+        if self.breaker(alias).allow_query():
+            return alias
+        return self.replica_for(alias) or alias
+
+    def reset(self):
+        with self._lock:
+            self._breakers.clear()
+
+    def status(self, aliases):
+        return [self.breaker(alias).as_dict() for alias in aliases]
+
+
+health = HealthRegistry()
+
+
+def unavailable_response(error):
+    response = JsonResponse({
+        'status': 'error',
+        'message': str(error)
+    }, status=503)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def track_health(execute, sql, params, many, context):
+    """
+    execute_wrapper of every connection: refuse queries to an open breaker,
+    report latency and connection errors of the others. A transaction that is
+    already open may still finish or roll back.
+    """
+    connection = context['connection']
+    breaker = health.breaker(connection.alias)
+    if not breaker.allow_query() and not connection.in_atomic_block:
+        raise TenantUnavailable(connection.alias, breaker.retry_after())
+
+    start = time.perf_counter()
+    try:
+        result = execute(sql, params, many, context)
+    except (OperationalError, InterfaceError) as e:
+        breaker.record(error=e)
+        e.health_recorded = True
+        raise
+    breaker.record(duration=time.perf_counter() - start)
+    return result
+
+
+def record_connection_error(alias, error):
+    """
+    Connection errors happen before the execute wrapper runs, the views report them here
+    """
+    if isinstance(error, (OperationalError, InterfaceError)) and not getattr(error, 'health_recorded', False):
+        health.breaker(alias).record(error=error)
+        error.health_recorded = True
+
+
+def install_health_tracker(connection):
+    if track_health not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, track_health)
@@ -0,0 +1,219 @@
+# Include Django Packages
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+# Include DRF Packages
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework import status
+
+# Include From the Project Directory
+from .cache import get_cache, make_key
+from .singleflight import group
+
+# Include third-party packages
+from asgiref.sync import iscoroutinefunction
+
+# Include Built-in Package
+from functools import wraps
+import asyncio
+import hashlib
+import json
+import time
+
+# Response headers worth replaying besides the body
+REPLAYED_HEADERS = ('Location', 'ETag', 'Last-Modified')
+
+
+def request_fingerprint(request):
+    """
+    Hash of what the request asks for, a key reused for another request is refused
+    """
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.md5(f"{request.method}:{request.path}:{body}".encode(), usedforsecurity=False).hexdigest()
+
+
+def store_entry(response, fingerprint):
+    if isinstance(response, Response):
+        content = JSONRenderer().render(response.data)
+        content_type = 'application/json'
+    else:
+        content = response.content
+        content_type = response.get('Content-Type')
+
+    return {
+        'status': response.status_code,
+        'content': content,
+        'content_type': content_type,
+        'headers': {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)},
+        'fingerprint': fingerprint,
+    }
+
+
+def wait_for_entry(cache_key):
+    """
+    Poll for the response of a duplicate that runs in another worker, None on timeout
+    """
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT', 10)
+    while time.monotonic() < deadline:
+        entry = get_cache().get(cache_key)
+        if entry is not None:
+            return entry
+        time.sleep(0.05)
+    return None
+
+
+async def await_entry(cache_key):
+    """
+    Async version of wait_for_entry, the event loop runs on while it polls
+    """
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT', 10)
+    while time.monotonic() < deadline:
+        entry = await get_cache().aget(cache_key)
+        if entry is not None:
+            return entry
+        await asyncio.sleep(0.05)
+    return None
+
+
+def execute_once(cache_key, fingerprint, run):
+    """
+    Run the request unless its response is stored already, the cache lock keeps
+    other workers from running it at the same time. Server errors are not stored
+    so the client's retry runs again. The lock and the stored responses only
+    reach the other workers through a shared tenant cache (see app/checks.py).
+    """
+    cache = get_cache()
+    entry = cache.get(cache_key)
+    if entry is not None:
+        return entry
+
+    lock_key = f'{cache_key}:lock'
+    if not cache.add(lock_key, 1, timeout=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60)):
+        return wait_for_entry(cache_key)
+
+    try:
+        entry = store_entry(run(), fingerprint)
+        if entry['status'] < 500:
+            cache.set(cache_key, entry, timeout=getattr(settings, 'IDEMPOTENCY_TTL', 86400))
+        return entry
+    finally:
+        cache.delete(lock_key)
+
+
+async def aexecute_once(cache_key, fingerprint, run):
+    """
+    Async version of execute_once, `run` is a coroutine function
+    """
+    cache = get_cache()
+    entry = await cache.aget(cache_key)
+    if entry is not None:
+        return entry
+
+    lock_key = f'{cache_key}:lock'
+    if not await cache.aadd(lock_key, 1, timeout=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60)):
+        return await await_entry(cache_key)
+
+    try:
+        entry = store_entry(await run(), fingerprint)
+        if entry['status'] < 500:
+            await cache.aset(cache_key, entry, timeout=getattr(settings, 'IDEMPOTENCY_TTL', 86400))
+        return entry
+    finally:
+        await cache.adelete(lock_key)
+
+
+def error_response(respond, message, status_code, headers=None):
+    return respond({'status': 'error', 'message': message}, status=status_code, headers=headers)
+
+
+def read_key(request, respond):
+    """
+    (cache key, None) for a request with a usable Idempotency-Key header,
+    (None, error response) for an unusable one and (None, None) without one
+    """
+    key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+    if not key:
+        return None, None
+
+    if len(key) > 255:
+        return None, error_response(
+            respond, "The Idempotency-Key header can be at most 255 characters.", status.HTTP_400_BAD_REQUEST
+        )
+
+    principal = getattr(request.user, 'userid', None) or 'anonymous'
+    return make_key(getattr(request, 'brand_name', 'default'), 'idempotency', principal, key), None
+
+
+def entry_response(entry, fingerprint, executed, respond):
+    if entry is None:
+        return error_response(
+            respond, "A request with this Idempotency-Key is still being processed.",
+            status.HTTP_409_CONFLICT, headers={'Retry-After': '1'}
+        )
+
+    if entry['fingerprint'] != fingerprint:
+        return error_response(
+            respond, "This Idempotency-Key was already used for a different request.",
+            status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+
+    response = HttpResponse(entry['content'], status=entry['status'], content_type=entry['content_type'])
+    for name, value in entry['headers'].items():
+        response[name] = value
+    if not executed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(handler):
+    """
+    Decorator for POST / PUT view methods: a request with an Idempotency-Key
+    header runs once per (brand, user, key) and its retries get the stored
+    response. A duplicate arriving while the first one runs waits for it.
+    Works on the async views too.
+    """
+    if iscoroutinefunction(handler):
+        return aidempotent(handler)
+
+    @wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        cache_key, refused = read_key(request, Response)
+        if cache_key is None:
+            return refused or handler(view, request, *args, **kwargs)
+
+        fingerprint = request_fingerprint(request)
+        executed = []
+
+        def run():
+            executed.append(True)
+            return handler(view, request, *args, **kwargs)
+
+        # Duplicates in this process share the first one's result, the others wait on the cache
+        entry = group.do(cache_key, lambda: execute_once(cache_key, fingerprint, run))
+        return entry_response(entry, fingerprint, executed, Response)
+
+    return wrapper
+
+
+def aidempotent(handler):
+    """
+    idempotent() for async view methods, duplicates in this process wait on the cache too
+    """
+    @wraps(handler)
+    async def wrapper(view, request, *args, **kwargs):
+        cache_key, refused = read_key(request, JsonResponse)
+        if cache_key is None:
+            return refused or await handler(view, request, *args, **kwargs)
+
+        fingerprint = request_fingerprint(request)
+        executed = []
+
+        async def run():
+            executed.append(True)
+            return await handler(view, request, *args, **kwargs)
+
+        entry = await aexecute_once(cache_key, fingerprint, run)
+        return entry_response(entry, fingerprint, executed, JsonResponse)
+
+    return wrapper
@@ -0,0 +1,170 @@
+# Include Django Packages
+from django.conf import settings
+
+# Include Built-in Package
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import defaultdict
+from bisect import bisect_left
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """
+    Queries executed while handling one request, across every database alias
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest = None
+        self.slow_queries = []
+        self.slow_threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD', 0.5)
+
+    def add(self, alias, sql, duration):
+        self.count += 1
+        self.total_time += duration
+        if self.slowest is None or duration > self.slowest[2]:
+            self.slowest = (alias, sql, duration)
+        if duration >= self.slow_threshold:
+            self.slow_queries.append((alias, sql, duration))
+
+
+# Listeners of the current request, a context variable so queries the async
+# ORM runs in sync_to_async threads are still reported to their request
+_query_listeners = ContextVar('query_listeners', default=())
+
+
+@contextmanager
+def capture_queries(callback):
+    """
+    Call `callback(alias, sql, duration)` for every query run inside the block, on every alias
+    """
+    token = _query_listeners.set(_query_listeners.get() + (callback,))
+    try:
+        yield
+    finally:
+        _query_listeners.reset(token)
+
+
+def notify_query_listeners(execute, sql, params, many, context):
+    """
+    execute_wrapper installed on every connection, free when nobody listens
+    """
+    listeners = _query_listeners.get()
+    if not listeners:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        alias = context['connection'].alias
+        for listener in listeners:
+            listener(alias, sql, duration)
+
+
+def install_query_listener(connection):
+    """
+    Put notify_query_listeners under any temporary execute_wrapper of the connection
+    """
+    if notify_query_listeners not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, notify_query_listeners)
+
+
+class Histogram:
+    """
+    Cumulative Prometheus-style histogram per label set
+    """
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = defaultdict(lambda: {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+
+    def observe(self, labels, value):
+        series = self._series[labels]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series['buckets'][index] += 1
+        series['sum'] += value
+        series['count'] += 1
+
+    def render(self, label_filter=None):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            if label_filter and not label_filter(labels):
+                continue
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['buckets']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series["count"]}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {series["sum"]:.6f}')
+            lines.append(f'{self.name}_count{{{label_text}}} {series["count"]}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    In-process request / database metrics labelled by brand and view
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = Histogram(
+            'app_db_queries_per_request', 'Database queries run by one request',
+            (1, 2, 3, 5, 10, 20, 50, 100),
+        )
+        self.db_time = Histogram(
+            'app_db_time_seconds', 'Total database time of one request',
+            (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+        )
+        self.slowest_query = Histogram(
+            'app_db_slowest_query_seconds', 'Slowest query of one request',
+            (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+        )
+
+    def observe(self, brand_name, view_name, stats):
+        labels = (('brand', brand_name), ('view', view_name))
+        with self._lock:
+            self.queries.observe(labels, stats.count)
+            self.db_time.observe(labels, stats.total_time)
+            if stats.slowest:
+                self.slowest_query.observe(labels, stats.slowest[2])
+
+    def render(self, brand_name=None):
+        """
+        Prometheus text exposition, optionally limited to one brand
+        """
+        label_filter = (lambda labels: dict(labels)['brand'] == brand_name) if brand_name else None
+        with self._lock:
+            lines = []
+            for histogram in (self.queries, self.db_time, self.slowest_query):
+                lines.extend(histogram.render(label_filter))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def log_slow_queries(brand_name, view_name, stats):
+    """
+    Log the request's queries above SLOW_QUERY_THRESHOLD, sampled with SLOW_QUERY_SAMPLE_RATE
+    """
+    sample_rate = getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0)
+    for alias, sql, duration in stats.slow_queries:
+        if random.random() >= sample_rate:
+            continue
+        logger.warning(
+            "Slow query on alias %s (brand=%s, view=%s) took %.3fs: %s",
+            alias, brand_name, view_name, duration, sql[:2000]
+        )
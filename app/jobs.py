@@ -0,0 +1,228 @@
+# Include Django Packages
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+# Include From the Project Directory
+from .models import Brand, Job, Users, Tasks, ArchivedTask, ArchivedContact
+from .changes import record_tombstones, prune_tombstones
+from .archival import archive_brand
+
+# Include Built-in Package
+from datetime import timedelta
+import logging
+import os
+import random
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+# job kind -> handler(job, report), report(done, total) stores the progress
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, brand_name, payload, max_attempts=None):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind {kind}")
+
+    return Job.objects.using('default').create(
+        kind=kind,
+        brand_name=brand_name,
+        payload=payload,
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim_next(worker):
+    """
+    Lock the oldest runnable job for `worker`, None when the queue is empty.
+    Running jobs whose lock expired (crashed worker) are runnable again.
+    """
+    now = timezone.now()
+    expired = now - timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 600))
+    runnable = Job.objects.using('default').filter(
+        Q(status='queued', run_after__lte=now) | Q(status='running', locked_at__lt=expired)
+    )
+
+    for job_id, job_status in runnable.order_by('run_after', 'id').values_list('id', 'status')[:10]:
+        # Only one worker wins the conditional update of a job
+        claimed = Job.objects.using('default').filter(id=job_id, status=job_status).filter(
+            Q(status='queued') | Q(locked_at__lt=expired)
+        ).update(status='running', locked_by=worker, locked_at=now, attempts=F('attempts') + 1, updated_at=now)
+        if claimed:
+            return Job.objects.using('default').get(id=job_id)
+    return None
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff with jitter, capped at JOB_RETRY_MAX_DELAY seconds
+    """
+    base = getattr(settings, 'JOB_RETRY_BASE_DELAY', 5)
+    cap = getattr(settings, 'JOB_RETRY_MAX_DELAY', 600)
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def run_job(job):
+    handler = JOB_HANDLERS.get(job.kind)
+
+    def report(done, total=None):
+        fields = {'progress_done': done, 'locked_at': timezone.now(), 'updated_at': timezone.now()}
+        if total is not None:
+            fields['progress_total'] = total
+        Job.objects.using('default').filter(id=job.id).update(**fields)
+
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job kind {job.kind}")
+        handler(job, report)
+    except Exception as e:
+        logger.exception("Job %s (%s) failed on attempt %s", job.id, job.kind, job.attempts)
+        if job.attempts < job.max_attempts:
+            Job.objects.using('default').filter(id=job.id).update(
+                status='queued', locked_by=None, locked_at=None, error=str(e),
+                run_after=timezone.now() + timedelta(seconds=retry_delay(job.attempts)), updated_at=timezone.now(),
+            )
+        else:
+            Job.objects.using('default').filter(id=job.id).update(
+                status='failed', locked_by=None, error=str(e), updated_at=timezone.now()
+            )
+        return False
+
+    Job.objects.using('default').filter(id=job.id).update(
+        status='succeeded', locked_by=None, error=None, updated_at=timezone.now()
+    )
+    return True
+
+
+def run_next_job(worker=None):
+    """
+    Claim and run one job, False when there was nothing to run
+    """
+    job = claim_next(worker or worker_name())
+    if job is None:
+        return False
+    run_job(job)
+    return True
+
+
+def drain():
+    """
+    Run jobs until the queue has nothing runnable left
+    """
+    count = 0
+    while run_next_job():
+        count += 1
+    return count
+
+
+def work(stop, poll_interval=1.0):
+    """
+    Worker thread loop of `manage.py run_jobs`
+    """
+    worker = worker_name()
+    try:
+        while not stop.is_set():
+            try:
+                ran = run_next_job(worker)
+            except Exception:
+                logger.exception("Job worker %s could not claim a job", worker)
+                ran = False
+            if not ran:
+                stop.wait(poll_interval)
+    finally:
+        connections.close_all()
+
+
+@job_handler('delete_user')
+def delete_user(job, report):
+    """
+    Delete a user and their tasks in chunks, every chunk is its own short
+    transaction so a retry resumes where the previous attempt stopped
+    """
+    brand_name = job.brand_name
+    userid = job.payload['userid']
+    chunk_size = getattr(settings, 'JOB_DELETE_CHUNK_SIZE', 1000)
+
+    tasks = Tasks.objects.using(brand_name).filter(userid=userid)
+    done = job.progress_done
+    report(done, done + tasks.count() + 1)
+
+    while True:
+        with transaction.atomic(using=brand_name):
+            task_ids = list(tasks.order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not task_ids:
+                break
+            record_tombstones(brand_name, 'tasks', [(userid, task_id) for task_id in task_ids])
+            Tasks.objects.using(brand_name).filter(id__in=task_ids).delete()
+        done += len(task_ids)
+        report(done)
+
+    with transaction.atomic(using=brand_name):
+        ArchivedTask.objects.using(brand_name).filter(userid=userid).delete()
+        ArchivedContact.objects.using(brand_name).filter(userid=userid).delete()
+        user = Users.objects.using(brand_name).filter(userid=userid, brand_name=brand_name).first()
+        if user:
+            record_tombstones(brand_name, 'users', [(userid, userid)])
+            user.delete(using=brand_name)
+    report(done + 1)
+
+
+@job_handler('archive_brand')
+def archive_brand_rows(job, report):
+    """
+    Move the tasks and contact requests past the brand's retention into the archive tables
+    """
+    archive_brand(job.brand_name, report=report)
+
+
+@job_handler('prune_tombstones')
+def prune_brand_tombstones(job, report):
+    """
+    Delete the change feed tombstones past TOMBSTONE_RETENTION_DAYS
+    """
+    report(prune_tombstones(job.brand_name))
+
+
+def schedule(kind):
+    """
+    Queue a `kind` job for every active brand that has none pending
+    """
+    pending = set(
+        Job.objects.using('default').filter(kind=kind, status__in=('queued', 'running'))
+        .values_list('brand_name', flat=True)
+    )
+    brands = Brand.objects.using('default').filter(is_active=True).values_list('brand_name', flat=True)
+    return [
+        enqueue(kind, brand_name, {})
+        for brand_name in brands
+        if brand_name in settings.DATABASES and brand_name not in pending
+    ]
+
+
+def schedule_archival():
+    """
+    CRONJOBS entry: queue an archive job for every active brand that has none pending
+    """
+    return schedule('archive_brand')
+
+
+def schedule_tombstone_pruning():
+    """
+    CRONJOBS entry: queue a tombstone pruning job for every active brand that has none pending
+    """
+    return schedule('prune_tombstones')
@@ -1,5 +1,6 @@
 # Include Django Packages
 from django.conf import settings
+from django.db.utils import InterfaceError, OperationalError
 
 # Include DRF Packages
 from rest_framework.exceptions import AuthenticationFailed
@@ -8,20 +9,30 @@ from rest_framework import permissions
 # Include From the Project Directory
 from app.models import Users
 from .middleware import get_current_brand
+from .health import health, TenantUnavailable
+from .batch import decode_token
+from .utils import is_admin_token
 
 # Include Built-in Package
 import jwt
 
 
+def principal_queryset(brand_name, user_id):
+    return Users.objects.using(health.read_alias(brand_name)).filter(userid=user_id, brand_name=brand_name)[:1]
+
+
 class JWTAuthorization(permissions.BasePermission):
 
     @staticmethod
     def decode_jwt_token(token):
         try:
             decoded_token = jwt.decode(token, settings.SIMPLE_JWT['SIGNING_KEY'], algorithms=['HS256'])
-            return decoded_token
         except:
             return None
+        # An admin id may well be the userid of a user of the brand
+        if is_admin_token(decoded_token):
+            return None
+        return decoded_token
     
     
     def authenticate(self, request):
@@ -31,7 +42,7 @@ class JWTAuthorization(permissions.BasePermission):
                 return None
 
             token = auth_header.split(' ')[-1]
-            decoded_token = self.decode_jwt_token(token)
+            decoded_token = decode_token(request, token, self.decode_jwt_token)
 
             brand_name = decoded_token['brand_name']
 
@@ -42,7 +53,9 @@ class JWTAuthorization(permissions.BasePermission):
                     if brand_name != get_current_brand():
                         raise AuthenticationFailed("You have not able to access another brand.")
                     
-                    user = Users.objects.using(brand_name).filter(userid=user_id, brand_name=brand_name).first()
+                    # Not cached, a deactivated or deleted user is refused on the next request
+                    users = list(principal_queryset(brand_name, user_id))
+                    user = users[0] if users else None
                     
                     if not user.is_active:
                         raise ValueError("Your account is deactivated to not able to access it.")
@@ -52,6 +65,9 @@ class JWTAuthorization(permissions.BasePermission):
                 except Users.DoesNotExist:
                     return None
             return None
+        except (TenantUnavailable, OperationalError, InterfaceError):
+            # The view reports database errors to the health tracker and answers 503 / 500
+            raise
         except Exception as e:
             raise AuthenticationFailed(f"Token verification failed: {str(e)}")
 
@@ -59,3 +75,46 @@ class JWTAuthorization(permissions.BasePermission):
         user = self.authenticate(request)
         request.user = user
         return user is not None
+
+
+class AsyncJWTAuthorization(JWTAuthorization):
+    """
+    JWTAuthorization for the async views, the user lookup goes through the async ORM
+    """
+
+    async def aauthenticate(self, request):
+        try:
+            auth_header = request.headers.get('Authorization')
+            if not auth_header:
+                return None
+
+            token = auth_header.split(' ')[-1]
+            decoded_token = decode_token(request, token, self.decode_jwt_token)
+
+            if not decoded_token:
+                return None
+
+            brand_name = decoded_token['brand_name']
+            user_id = decoded_token['user_id']
+
+            if brand_name != get_current_brand():
+                raise AuthenticationFailed("You have not able to access another brand.")
+
+            users = [user async for user in principal_queryset(brand_name, user_id)]
+            user = users[0] if users else None
+
+            if not user.is_active:
+                raise ValueError("Your account is deactivated to not able to access it.")
+            request.brand_name = brand_name
+
+            return user
+        except (TenantUnavailable, OperationalError, InterfaceError):
+            # The view reports database errors to the health tracker and answers 503 / 500
+            raise
+        except Exception as e:
+            raise AuthenticationFailed(f"Token verification failed: {str(e)}")
+
+    async def ahas_permission(self, request, view):
+        user = await self.aauthenticate(request)
+        request.user = user
+        return user is not None
@@ -0,0 +1,17 @@
+# Include Django Packages
+from django.core.management.base import BaseCommand
+
+# Include From the Project Directory
+from app.directory import backfill
+
+
+class Command(BaseCommand):
+    help = "Rebuild the email -> brand login directory from every tenant database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help="Database aliases to scan, all of them by default")
+        parser.add_argument('--workers', type=int, default=4, help="Tenants scanned in parallel")
+
+    def handle(self, *args, **options):
+        for alias, count in backfill(options['aliases'] or None, options['workers']).items():
+            self.stdout.write(f"{alias}: {count} users")
@@ -0,0 +1,44 @@
+# Include Django Packages
+from django.core.management.base import BaseCommand
+
+# Include From the Project Directory
+from app.benchmark import run, compare, load_report
+
+# Include Built-in Package
+import json
+
+
+class Command(BaseCommand):
+    help = "Run the benchmark scenarios against the seeded tenants (use with --settings=marketplace.bench_settings)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=['login', 'list_tasks', 'create_task', 'admin_list_users'],
+            help="Scenario to run, repeat for several (default: all)",
+        )
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario")
+        parser.add_argument('--concurrency', type=int, default=1, help="Client threads per scenario")
+        parser.add_argument('--warmup', type=int, default=10, help="Untimed requests before each scenario")
+        parser.add_argument('--output', help="Write the JSON report to this file")
+        parser.add_argument('--compare', help="Earlier JSON report to compare against")
+
+    def handle(self, *args, **options):
+        report = run(options['scenarios'], options['requests'], options['concurrency'], options['warmup'])
+
+        if options['compare']:
+            report['compare'] = compare(load_report(options['compare']), report)
+
+        self.stdout.write(f"{'scenario':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name, result in report['scenarios'].items():
+            self.stdout.write(
+                f"{name:<18}{result['requests_per_second']:>10}{result['p50_ms']:>10}"
+                f"{result['p95_ms']:>10}{result['p99_ms']:>10}{result['errors']:>8}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,17 @@
+# Include Django Packages
+from django.core.management.base import BaseCommand
+
+# Include From the Project Directory
+from app.benchmark import seed
+
+
+class Command(BaseCommand):
+    help = "Seed the benchmark tenants (use with --settings=marketplace.bench_settings)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help="Users per tenant")
+        parser.add_argument('--tasks', type=int, default=10, help="Tasks per user")
+        parser.add_argument('--contacts', type=int, default=1, help="Contact requests per user")
+
+    def handle(self, *args, **options):
+        seed(options['users'], options['tasks'], options['contacts'], stdout=self.stdout)
@@ -0,0 +1,48 @@
+# Include Django Packages
+from django.core.management.base import BaseCommand, CommandError
+
+# Include From the Project Directory
+from app.models import Relocation
+from app.relocation import RelocationError, relocate, finish, abort
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a brand database to another configured alias without downtime: copy, "
+        "dual write, verify checksums and cut over. Run it again to resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('brand_name')
+        parser.add_argument('target_alias', nargs='?', help="Database alias (in DATABASES) the brand moves to")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows per copy / checksum chunk")
+        parser.add_argument('--rounds', type=int, default=5, help="Verify passes before giving up")
+        parser.add_argument('--no-cutover', action='store_true', help="Stop after a matching verify pass")
+        parser.add_argument('--finish', action='store_true', help="Stop the dual writes after the cutover")
+        parser.add_argument('--abort', action='store_true', help="Drop a relocation that has not cut over")
+
+    def handle(self, *args, **options):
+        brand_name = options['brand_name']
+
+        try:
+            if options['finish'] or options['abort']:
+                relocation = Relocation.objects.using('default').filter(brand_name=brand_name).exclude(
+                    phase__in=('done', 'aborted')
+                ).order_by('-id').first()
+                if relocation is None:
+                    raise CommandError(f"{brand_name} has no relocation in progress")
+                (finish if options['finish'] else abort)(relocation)
+                self.stdout.write(f"{relocation}")
+                return
+
+            if not options['target_alias']:
+                raise CommandError("The target alias is required")
+
+            relocation = relocate(
+                brand_name, options['target_alias'], chunk_size=options['chunk_size'], rounds=options['rounds'],
+                do_cutover=not options['no_cutover'], log=self.stdout.write,
+            )
+        except RelocationError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{relocation}")
@@ -0,0 +1,23 @@
+# Include Django Packages
+from django.core.management.base import BaseCommand
+
+# Include From the Project Directory
+from app.events import run_broker
+
+# Include Built-in Package
+import asyncio
+
+
+class Command(BaseCommand):
+    help = "Run the local event broker that fans contact events out to every worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Event broker listening on {options['host']}:{options['port']}")
+        try:
+            asyncio.run(run_broker(options['host'], options['port']))
+        except KeyboardInterrupt:
+            pass
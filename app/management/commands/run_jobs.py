@@ -0,0 +1,40 @@
+# Include Django Packages
+from django.core.management.base import BaseCommand
+
+# Include From the Project Directory
+from app.jobs import drain, work
+
+# Include Built-in Package
+import threading
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (user deletion, ...) with N worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help="Run what is runnable now and exit")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self.stdout.write(f"Ran {drain()} jobs")
+            return
+
+        stop = threading.Event()
+        workers = [
+            threading.Thread(target=work, args=(stop, options['poll_interval']), name=f'job-worker-{index}')
+            for index in range(options['concurrency'])
+        ]
+        for worker in workers:
+            worker.start()
+
+        self.stdout.write(f"Job worker running with {options['concurrency']} threads")
+        try:
+            while any(worker.is_alive() for worker in workers):
+                for worker in workers:
+                    worker.join(timeout=1)
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
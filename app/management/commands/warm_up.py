@@ -0,0 +1,17 @@
+# Include Django Packages
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Open and check a connection to every database, load the brand registries and "
+        "build the URL resolver and serializers, printing the time of each phase."
+    )
+
+    def handle(self, *args, **options):
+        timings = apps.get_app_config('app').warm_up(log=self.stdout.write)
+
+        errors = timings['connections'][1]
+        if not isinstance(errors, dict) or any(errors.values()):
+            raise CommandError("Some databases could not be reached")
@@ -1,7 +1,36 @@
 from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
-from django.apps import apps
+from django.utils.cache import patch_vary_headers
+from django.middleware.gzip import GZipMiddleware
 from .db_router import set_brand_context, get_brand_context
+from .instrumentation import QueryStats, capture_queries, metrics, log_slow_queries
+from .profiling import ADMIN_PATH_PREFIX, RequestProfiler, get_profiling_admin, should_sample
+from .registry import brand_hosts, get_brand_limits
+from .ratelimit import admission
+from .relocation import relocations
+from .health import health, TenantUnavailable, unavailable_response
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+import secrets
+
+# Brotli is optional, fall back to gzip when it is not installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def brotli_compress(content, max_random_bytes):
+    """
+    Brotli counterpart of compress_string(max_random_bytes=...): a metadata
+    block of random length is skipped by decoders but varies the body size
+    """
+    compressor = brotli.Compressor()
+    # flush() leaves the stream byte aligned, so the block can go in between
+    data = compressor.process(content) + compressor.flush()
+    length = 1 + secrets.randbelow(max_random_bytes)
+    # ISLAST=0, MNIBBLES=0, one MSKIPLEN byte holding length - 1
+    header = bytes([0x16 | ((length - 1) & 0x3) << 6, (length - 1) >> 2])
+    return data + header + b'a' * length + compressor.finish()
 
 class TenantMiddleware(MiddlewareMixin):
     """
@@ -12,9 +41,7 @@ class TenantMiddleware(MiddlewareMixin):
         """
         Detect brand from request and set database context
         """        
-        if (request.path.startswith('/admin/') or 
-            request.path.startswith('/favicon.ico') or
-            request.path.startswith('/static/')):
+        if self.is_excluded_path(request):
             brand_name = 'default'
         else:
             brand_name = self.get_brand_from_request(request)
@@ -23,13 +50,60 @@ class TenantMiddleware(MiddlewareMixin):
         
         request.brand_name = brand_name
         
+        return self.check_health(request, brand_name)
+
+    async def __acall__(self, request):
+        """
+        Async twin of process_request, the brand lookup stays on the event loop under ASGI
+        """
+        if self.is_excluded_path(request):
+            brand_name = 'default'
+        else:
+            brand_name = await self.aget_brand_from_request(request)
+
+        set_brand_context(brand_name)
+
+        request.brand_name = brand_name
+
+        unavailable = self.check_health(request, brand_name)
+        if unavailable is not None:
+            return unavailable
+
+        return await self.get_response(request)
+
+    def check_health(self, request, brand_name):
+        """
+        Answer 503 right away while the brand database breaker is open instead of
+        waiting on the database, reads go on when the brand has a healthy replica
+        """
+        if request.path_info in getattr(settings, 'DB_BREAKER_EXEMPT_PATHS', ()):
+            return None
+
+        if request.method in ('GET', 'HEAD') and health.read_alias(brand_name) != brand_name:
+            return None
+
+        try:
+            health.check_request(brand_name)
+        except TenantUnavailable as e:
+            return unavailable_response(e)
         return None
+
+    def is_excluded_path(self, request):
+        """
+        Django admin and static files always use the default database
+        """
+        return (request.path.startswith('/admin/') or
+            request.path.startswith('/favicon.ico') or
+            request.path.startswith('/static/'))
     
     def get_brand_from_request(self, request):
         """
         Extract brand name from various sources
-        Priority: Header > Subdomain > URL parameter > Default
+        Priority: Header > Subdomain > URL prefix > Default
         """
+        # Follow brand databases that were relocated since the last request
+        relocations.apply()
+
         brand_name = request.META.get('HTTP_X_BRAND_NAME')
         if brand_name:
             brand_name = brand_name.lower()
@@ -37,27 +111,254 @@ class TenantMiddleware(MiddlewareMixin):
             if is_valid:
                 return brand_name.strip()
 
+        # Subdomain: <subdomain>.<one of BRAND_BASE_DOMAINS>
+        brand_name = brand_hosts.brand_for_host(request.META.get('HTTP_HOST', ''))
+        if brand_name:
+            return brand_name
+
+        # URL prefix: <BRAND_URL_PREFIX><subdomain>/my-tasks is routed as /my-tasks
+        prefixed = brand_hosts.brand_for_prefix(request.path_info)
+        if prefixed:
+            brand_name, request.path_info = prefixed
+            return brand_name
+
         return 'default'
+
+    async def aget_brand_from_request(self, request):
+        """
+        Async version of get_brand_from_request, the lookups stay on the event
+        loop while the registries are loaded, only a cold registry is loaded
+        from the database in the ORM thread
+        """
+        if relocations.is_current() and brand_hosts.is_current():
+            return self.get_brand_from_request(request)
+        return await sync_to_async(self.get_brand_from_request)(request)
     
     def is_valid_brand(self, brand_name):
         """
-        Check if brand exists and is active
+        Check if brand exists and is active, through the brand host index
         """
+        return brand_hosts.is_active(brand_name)
+
+class AdmissionMiddleware:
+    """
+    Admission control after TenantMiddleware: per brand and per user rate
+    limits (429) and a per brand limit of requests in flight (503)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'RATE_LIMIT_ENABLED', True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not self.enabled:
+            return self.get_response(request)
+
+        brand_name = getattr(request, 'brand_name', 'default')
+        limits = get_brand_limits(brand_name)
+
+        rejected = admission.check_rate(request, brand_name, limits)
+        if rejected is not None:
+            return rejected
+        if not admission.enter(brand_name, limits):
+            return admission.too_busy()
+        try:
+            return self.get_response(request)
+        finally:
+            admission.leave(brand_name)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        brand_name = getattr(request, 'brand_name', 'default')
+        # A cold limits cache reads the brands table
+        limits = await sync_to_async(get_brand_limits)(brand_name)
+
+        rejected = admission.check_rate(request, brand_name, limits)
+        if rejected is not None:
+            return rejected
+        if not admission.enter(brand_name, limits):
+            return admission.too_busy()
         try:
-            if brand_name == 'default':
-                return True
+            return await self.get_response(request)
+        finally:
+            admission.leave(brand_name)
 
-            if brand_name not in settings.DATABASES:
-                return False
 
-            Brand = apps.get_model('app', 'Brand')
-            brand = Brand.objects.using('default').get(
-                brand_name=brand_name, 
-                is_active=True
-            )
+class QueryMetricsMiddleware:
+    """
+    Count queries, database time and the slowest statement of every request,
+    labelled with the brand and URL name, into the in-process metrics
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_METRICS_ENABLED', True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not self.enabled:
+            return self.get_response(request)
+
+        stats = QueryStats()
+        with capture_queries(stats.add):
+            response = self.get_response(request)
+        self.record(request, stats)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        stats = QueryStats()
+        with capture_queries(stats.add):
+            response = await self.get_response(request)
+        self.record(request, stats)
+        return response
+
+    def record(self, request, stats):
+        brand_name = getattr(request, 'brand_name', None) or 'default'
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = (resolver_match.url_name if resolver_match else None) or 'unresolved'
+
+        metrics.observe(brand_name, view_name, stats)
+        log_slow_queries(brand_name, view_name, stats)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress large responses with brotli or gzip based on Accept-Encoding.
+    Gzip goes through Django's GZipMiddleware, brotli gets the same random
+    length padding against BREACH.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+
+        min_size = getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', 1024)
+        if len(response.content) < min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = self.get_encoding(request)
+        if encoding == 'gzip':
+            return super().process_response(request, response)
+        if encoding != 'br':
+            return response
+
+        compressed = brotli_compress(response.content, self.max_random_bytes)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+
+        # The body changed, so a strong validator is not valid anymore
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+
+        return response
+
+    def get_encoding(self, request):
+        """
+        Pick the best supported encoding the client accepts
+        """
+        accepted = {}
+        for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            name, _, params = item.strip().partition(';')
+            quality = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            if name:
+                accepted[name.lower()] = quality
+
+        for encoding in ('br', 'gzip'):
+            if encoding == 'br' and brotli is None:
+                continue
+            if accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request on demand (X-Profile-Token header, or ?profile=1 on the
+    admin endpoints, with a BrandAdmin token) or a PROFILING_SAMPLE_RATE fraction of the traffic.
+    Requests that ask for nothing go straight through, so do all requests of the ASGI app.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        profiler = self.get_profiler(request)
+        if profiler is None:
+            return self.get_response(request)
+
+        with profiler:
+            response = self.get_response(request)
+        profiler.save(response)
+        return response
+
+    async def __acall__(self, request):
+        # cProfile follows one thread: on the event loop it would profile every
+        # other coroutine and miss the sync views running in executor threads,
+        # and Python 3.12 refuses a second profiler at once. Only the WSGI app profiles.
+        return await self.get_response(request)
+
+    def wants_profile(self, request):
+        if 'HTTP_X_PROFILE_TOKEN' in request.META:
             return True
-        except Exception as e:
-            return False
+        return request.GET.get('profile') == '1' and request.path.startswith(ADMIN_PATH_PREFIX)
+
+    def get_sampler(self, request):
+        if should_sample():
+            return RequestProfiler(request, 'sample', getattr(request, 'brand_name', None) or 'default')
+        return None
+
+    def get_profiler(self, request):
+        """
+        A RequestProfiler when this request must be profiled, else None
+        """
+        if not self.wants_profile(request):
+            return self.get_sampler(request)
+
+        admin = get_profiling_admin(request)
+        brand_name = getattr(request, 'brand_name', None) or 'default'
+        # An admin may only profile requests of their own brand (or brand-less admin endpoints)
+        if admin is None or brand_name not in ('default', admin.brand_name):
+            return self.get_sampler(request)
+
+        return RequestProfiler(request, 'admin', admin.brand_name)
+
 
 def get_current_brand():
     """
@@ -18,6 +18,17 @@ class Brand(models.Model):
     db_port = models.CharField(max_length=10, default='3306')
     db_user = models.CharField(max_length=100)
 
+    # Admission control, empty values fall back to the RATE_LIMIT_* settings
+    rate_limit = models.FloatField(null=True, blank=True, help_text="Requests per second for the whole brand")
+    rate_burst = models.PositiveIntegerField(null=True, blank=True)
+    user_rate_limit = models.FloatField(null=True, blank=True, help_text="Requests per second for one user / client")
+    user_rate_burst = models.PositiveIntegerField(null=True, blank=True)
+    max_concurrent_requests = models.PositiveIntegerField(null=True, blank=True, help_text="In flight requests per worker")
+
+    # Days after their last update that rows move to the archive tables, empty values fall back to the ARCHIVE_* settings
+    task_retention_days = models.PositiveIntegerField(null=True, blank=True)
+    contact_retention_days = models.PositiveIntegerField(null=True, blank=True)
+
     def __str__(self):
         return self.brand_name
 
@@ -46,6 +57,7 @@ class BrandAdmin(models.Model):
     class Meta:
         db_table = "brand_admin"
         verbose_name_plural = 'brand_admin'
+        unique_together = [['email', 'brand_name']]
 
 
 class UserManager(BaseUserManager):
@@ -115,6 +127,10 @@ class Tasks(models.Model):
         db_table = 'tasks'
         verbose_name_plural = "tasks"
         unique_together = [['userid', 'saved_search']]
+        indexes = [
+            # Cursor used by the change feed
+            models.Index(fields=['userid', 'updated_at', 'id'], name='tasks_sync_cursor_idx'),
+        ]
 
 
 ADMIN_APPROVEL = [
@@ -145,7 +161,163 @@ class ContactUs(models.Model):
         db_table = "contanct_us"
         verbose_name_plural = "contanct_us"
         get_latest_by = 'created_at'
+        indexes = [
+            # Cursor used by the change feed
+            models.Index(fields=['userid', 'updated_at', 'id'], name='contact_sync_cursor_idx'),
+        ]
 
     def __str__(self):
         return f"UserId is: {self.userid} And Create Task is Request is: {self.request_for_task}"
-    
+
+
+class ArchivedTask(models.Model):
+    """Task moved out of the hot tasks table by app/archival.py, it keeps its id and timestamps"""
+    id = models.BigIntegerField(primary_key=True)
+    userid = models.IntegerField()
+    saved_search = models.CharField(max_length=200)
+    min_price = models.FloatField(blank=True, null=True)
+    max_price = models.FloatField(blank=True, null=True)
+    postcode = models.CharField(max_length=100, blank=True, null=True)
+    radius = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "tasks_archive"
+        verbose_name_plural = "tasks_archive"
+        indexes = [
+            models.Index(fields=['userid', 'created_at'], name='tasks_archive_user_idx'),
+        ]
+
+
+class ArchivedContact(models.Model):
+    """Processed contact request moved out of the hot contanct_us table by app/archival.py"""
+    id = models.BigIntegerField(primary_key=True)
+    userid = models.IntegerField()
+    firstname = models.CharField(max_length=50)
+    surname = models.CharField(max_length=50)
+    email = models.CharField(max_length=50)
+    total_count = models.IntegerField(default=1)
+    saved_search = models.CharField(max_length=200)
+    min_price = models.FloatField(blank=True, null=True)
+    max_price = models.FloatField(blank=True, null=True)
+    request_for_task = models.IntegerField(default=1)
+    postcode = models.CharField(max_length=100, blank=True, null=True)
+    radius = models.IntegerField(blank=True, null=True)
+    description = models.TextField(null=True, blank=True)
+    approved_by = models.IntegerField(default=0, null=True, blank=True)
+    status = models.CharField(max_length=2, choices=ADMIN_APPROVEL, default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "contanct_us_archive"
+        verbose_name_plural = "contanct_us_archive"
+        indexes = [
+            models.Index(fields=['userid', 'created_at'], name='contact_archive_user_idx'),
+        ]
+
+
+class Tombstone(models.Model):
+    """Record of a deleted row so the change feed can tell clients about it"""
+    userid = models.IntegerField()
+    model_name = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "tombstones"
+        verbose_name_plural = "tombstones"
+        indexes = [
+            models.Index(fields=['userid', 'deleted_at', 'id'], name='tombstone_sync_cursor_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_name} {self.object_id} deleted for UserId: {self.userid}"
+
+
+JOB_STATUS = [
+    ("queued", "Queued"),
+    ("running", "Running"),
+    ("succeeded", "Succeeded"),
+    ("failed", "Failed"),
+]
+
+
+class Job(models.Model):
+    """Background job, kept in the default database and run by `manage.py run_jobs`"""
+    kind = models.CharField(max_length=50)
+    brand_name = models.CharField(max_length=100, db_index=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=JOB_STATUS, default="queued")
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    progress_done = models.IntegerField(default=0)
+    progress_total = models.IntegerField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "jobs"
+        verbose_name_plural = "jobs"
+        indexes = [
+            # Picking the next runnable job
+            models.Index(fields=['status', 'run_after', 'id'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} of {self.brand_name} is {self.status}"
+
+
+class LoginDirectory(models.Model):
+    """Global email -> brand directory in the default database, so login can find the user's tenant"""
+    email_hash = models.CharField(max_length=64, db_index=True)
+    brand_name = models.CharField(max_length=100)
+    userid = models.IntegerField()
+    shard = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "login_directory"
+        verbose_name_plural = "login_directory"
+        unique_together = [['brand_name', 'userid']]
+
+    def __str__(self):
+        return f"UserId {self.userid} of {self.brand_name}"
+
+
+RELOCATION_PHASES = [
+    ("copying", "Copying"),
+    ("verifying", "Verifying"),
+    ("cutover", "Cut over"),
+    ("done", "Done"),
+    ("aborted", "Aborted"),
+]
+
+
+class Relocation(models.Model):
+    """Move of a brand database to another alias, kept in the default database (see app/relocation.py)"""
+    brand_name = models.CharField(max_length=100, db_index=True)
+    source_alias = models.CharField(max_length=100)
+    target_alias = models.CharField(max_length=100)
+    phase = models.CharField(max_length=10, choices=RELOCATION_PHASES, default="copying")
+    # table -> last primary key copied, so an interrupted copy resumes there
+    cursors = models.JSONField(default=dict)
+    mismatches = models.IntegerField(null=True, blank=True)
+    cutover_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "relocations"
+        verbose_name_plural = "relocations"
+
+    def __str__(self):
+        return f"{self.brand_name} {self.source_alias} -> {self.target_alias} is {self.phase}"
@@ -0,0 +1,158 @@
+# Include Django Packages
+from django.conf import settings
+from django.utils import timezone
+
+# Include From the Project Directory
+from .cache import get_cache, make_key
+from .instrumentation import capture_queries
+from .models import BrandAdmin
+from .utils import is_admin_token
+
+# Include third-party packages
+import jwt
+
+# Include Built-in Package
+import cProfile
+import pstats
+import random
+import time
+import uuid
+
+
+class ProfileStore:
+    """
+    Ring buffer of the latest request profiles of each brand. It lives in the
+    tenant cache, so any worker serves the profiles the others recorded.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+
+    def slot_key(self, brand_name, slot):
+        return make_key(brand_name, 'profiles', slot)
+
+    def add(self, profile):
+        cache = get_cache()
+        counter = make_key(profile['brand_name'], 'profiles', 'next')
+        try:
+            number = cache.incr(counter)
+        except ValueError:
+            number = 0
+            cache.set(counter, number, timeout=None)
+        cache.set(self.slot_key(profile['brand_name'], number % self.size), profile, timeout=self.timeout)
+
+    def list(self, brand_name):
+        keys = [self.slot_key(brand_name, slot) for slot in range(self.size)]
+        found = get_cache().get_many(keys).values()
+        return sorted(found, key=lambda profile: profile['created_at'], reverse=True)
+
+    def get(self, profile_id, brand_name):
+        for profile in self.list(brand_name):
+            if profile['id'] == profile_id:
+                return profile
+        return None
+
+
+# ?profile=1 profiles these endpoints only, other requests ask with the X-Profile-Token header
+ADMIN_PATH_PREFIX = '/api/admin/'
+
+profiles = ProfileStore(getattr(settings, 'PROFILING_BUFFER_SIZE', 50), getattr(settings, 'PROFILING_TIMEOUT', 3600))
+
+
+def get_profiling_admin(request):
+    """
+    The active BrandAdmin of the X-Profile-Token header (or of the Authorization
+    header when ?profile=1 is used on an admin endpoint), None when the request
+    did not ask for a profile. User tokens are refused, their user_id is not an admin id.
+    """
+    token = request.META.get('HTTP_X_PROFILE_TOKEN')
+    if not token and request.GET.get('profile') == '1' and request.path.startswith(ADMIN_PATH_PREFIX):
+        token = request.META.get('HTTP_AUTHORIZATION', '').split(' ')[-1]
+    if not token:
+        return None
+
+    try:
+        decoded_token = jwt.decode(token, settings.SIMPLE_JWT['SIGNING_KEY'], algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+    if not is_admin_token(decoded_token):
+        return None
+
+    return BrandAdmin.objects.using('default').filter(
+        id=decoded_token.get('user_id'),
+        brand_name=decoded_token.get('brand_name'),
+        is_active=True
+    ).first()
+
+
+def should_sample():
+    sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+class RequestProfiler:
+    """
+    cProfile of the view plus the SQL timeline of one request
+    """
+
+    def __init__(self, request, trigger, brand_name):
+        self.request = request
+        self.trigger = trigger
+        self.brand_name = brand_name
+        self.queries = []
+        self.profiler = cProfile.Profile()
+
+    def record_query(self, alias, sql, duration):
+        self.queries.append({
+            'alias': alias,
+            'sql': sql[:2000],
+            'start_ms': round((time.perf_counter() - duration - self.started) * 1000, 3),
+            'duration_ms': round(duration * 1000, 3),
+        })
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._capture = capture_queries(self.record_query)
+        self._capture.__enter__()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self._capture.__exit__(*exc_info)
+        self.duration = time.perf_counter() - self.started
+
+    def save(self, response):
+        profile_id = uuid.uuid4().hex[:12]
+        resolver_match = getattr(self.request, 'resolver_match', None)
+
+        profiles.add({
+            'id': profile_id,
+            'brand_name': self.brand_name,
+            'trigger': self.trigger,
+            'method': self.request.method,
+            'path': self.request.path,
+            'view': resolver_match.url_name if resolver_match else None,
+            'status_code': response.status_code,
+            'duration_ms': round(self.duration * 1000, 3),
+            'created_at': timezone.now(),
+            'query_count': len(self.queries),
+            'queries': self.queries,
+            'functions': self.top_functions(getattr(settings, 'PROFILING_TOP_FUNCTIONS', 30)),
+        })
+        response['X-Profile-Id'] = profile_id
+        return profile_id
+
+    def top_functions(self, limit):
+        stats = pstats.Stats(self.profiler)
+        rows = []
+        for (filename, line, name), (_, calls, total_time, cumulative_time, _) in stats.stats.items():
+            rows.append({
+                'function': f"{filename}:{line}({name})",
+                'calls': calls,
+                'total_ms': round(total_time * 1000, 3),
+                'cumulative_ms': round(cumulative_time * 1000, 3),
+            })
+        rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+        return rows[:limit]
@@ -0,0 +1,220 @@
+# Include Django Packages
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+# Include From the Project Directory
+from .health import health
+from .utils import is_admin_token
+
+# Include third-party packages
+import jwt
+
+# Include Built-in Package
+import math
+import threading
+import time
+
+
+def client_ip(request):
+    """
+    The client address: behind a reverse proxy REMOTE_ADDR is the proxy's, the
+    RATE_LIMIT_CLIENT_IP_HEADER set by the proxy has the client's instead. Its
+    last address is the one the proxy appended, the ones before it came from the client.
+    """
+    header = getattr(settings, 'RATE_LIMIT_CLIENT_IP_HEADER', None)
+    if header:
+        value = request.META.get(header, '').split(',')[-1].strip()
+        if value:
+            return value
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, rate, burst, now):
+        """
+        Take one token, returns 0 when allowed, else the seconds until a token is back
+        """
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate
+
+
+class LocalBucketStore:
+    """
+    Token buckets of this worker process
+    """
+    # Seconds after which an unused bucket has refilled and can be dropped
+    max_idle = 60
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self.prune(now)
+                bucket = self._buckets[key] = TokenBucket(burst, now)
+            return bucket.take(rate, burst, now)
+
+    def prune(self, now):
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket.updated < self.max_idle
+        }
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SharedBucketStore:
+    """
+    Buckets shared by the workers of a host through a cache alias (memcached on
+    localhost, for example). They are approximated with a counter per window of
+    burst / rate seconds, which allows `burst` requests per window.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, key, rate, burst):
+        cache = caches[self.alias]
+        now = time.time()
+        window = max(1.0, burst / rate)
+        slot = int(now // window)
+        counter = f'ratelimit:{key}:{slot}'
+
+        cache.add(counter, 0, timeout=math.ceil(window) + 1)
+        try:
+            count = cache.incr(counter)
+        except ValueError:
+            # Evicted between add and incr
+            cache.set(counter, 1, timeout=math.ceil(window) + 1)
+            count = 1
+
+        if count <= burst:
+            return 0
+        return (slot + 1) * window - now
+
+    def reset(self):
+        caches[self.alias].clear()
+
+
+class AdmissionController:
+    """
+    Per brand and per user token buckets plus a per brand limit of requests in
+    flight. The brand rate shrinks while its database latency EWMA is above
+    RATE_LIMIT_SHED_LATENCY, so a slow database sheds load instead of queueing it.
+    """
+
+    def __init__(self):
+        self._local = LocalBucketStore()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def buckets(self):
+        alias = getattr(settings, 'RATE_LIMIT_SHARED_CACHE', None)
+        return SharedBucketStore(alias) if alias else self._local
+
+    @staticmethod
+    def limit(limits, field, setting, default):
+        value = limits.get(field)
+        return value if value is not None else getattr(settings, setting, default)
+
+    @staticmethod
+    def shed_factor(brand_name):
+        threshold = getattr(settings, 'RATE_LIMIT_SHED_LATENCY', None)
+        latency = health.breaker(brand_name).latency_ewma
+        if threshold is None or latency is None or latency <= threshold:
+            return 1.0
+        return max(getattr(settings, 'RATE_LIMIT_MIN_SHARE', 0.1), threshold / latency)
+
+    @staticmethod
+    def client_key(request):
+        """
+        The user or admin of the bearer token, the client address for anonymous requests
+        """
+        token = request.META.get('HTTP_AUTHORIZATION', '').split(' ')[-1]
+        if token:
+            try:
+                claims = jwt.decode(token, settings.SIMPLE_JWT['SIGNING_KEY'], algorithms=['HS256'])
+                # User and admin ids are counted apart, user 1 is not admin 1
+                principal = 'admin' if is_admin_token(claims) else 'user'
+                return f"{principal}:{claims['user_id']}"
+            except Exception:
+                pass
+        return f"ip:{client_ip(request)}"
+
+    def check_rate(self, request, brand_name, limits):
+        """
+        None when the request may go on, else the 429 response
+        """
+        # The user bucket goes first, requests it rejects must not drain the brand's budget
+        rate = self.limit(limits, 'user_rate_limit', 'RATE_LIMIT_USER_RATE', 10)
+        burst = self.limit(limits, 'user_rate_burst', 'RATE_LIMIT_USER_BURST', 20)
+        wait = self.buckets.take(f'{brand_name}:{self.client_key(request)}', rate, burst)
+
+        if not wait:
+            share = self.shed_factor(brand_name)
+            rate = self.limit(limits, 'rate_limit', 'RATE_LIMIT_BRAND_RATE', 200) * share
+            burst = max(1, int(self.limit(limits, 'rate_burst', 'RATE_LIMIT_BRAND_BURST', 400) * share))
+            wait = self.buckets.take(f'{brand_name}:brand', rate, burst)
+
+        if not wait:
+            return None
+        return self.rejected(429, "Too many requests, please slow down.", wait)
+
+    def enter(self, brand_name, limits):
+        """
+        Count a request in flight, False when the brand is at its concurrency limit
+        """
+        limit = self.limit(limits, 'max_concurrent_requests', 'RATE_LIMIT_MAX_CONCURRENT', None)
+        with self._lock:
+            in_flight = self._in_flight.get(brand_name, 0)
+            if limit is not None and in_flight >= limit:
+                return False
+            self._in_flight[brand_name] = in_flight + 1
+            return True
+
+    def leave(self, brand_name):
+        with self._lock:
+            self._in_flight[brand_name] -= 1
+
+    def in_flight(self, brand_name):
+        return self._in_flight.get(brand_name, 0)
+
+    @staticmethod
+    def rejected(status, message, retry_after):
+        response = JsonResponse({
+            'status': 'error',
+            'message': message
+        }, status=status)
+        response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def too_busy(self):
+        return self.rejected(503, "The server is busy, please retry.", 1)
+
+    def reset(self):
+        self._local.reset()
+        with self._lock:
+            self._in_flight.clear()
+
+
+admission = AdmissionController()
@@ -0,0 +1,178 @@
+# Include Django Packages
+from django.conf import settings
+from django.utils.http import quote_etag
+
+# Include From the Project Directory
+from .cache import cached, get_versions
+from .models import Brand
+from .singleflight import group
+
+# Include Built-in Package
+import hashlib
+import json
+import time
+
+
+def load_active_brands():
+    return frozenset(
+        Brand.objects.using('default').filter(is_active=True).values_list('brand_name', flat=True)
+    )
+
+
+def get_active_brands():
+    """
+    Names of the active brands, cached and rebuilt once per Brand change
+    """
+    return cached('default', [Brand], ('active-brands',), load_active_brands)
+
+
+def is_active_brand(brand_name):
+    """
+    An active brand with a configured database, 'default' is always valid
+    """
+    if brand_name == 'default':
+        return True
+    return brand_name in settings.DATABASES and brand_name in get_active_brands()
+
+
+LIMIT_FIELDS = ('rate_limit', 'rate_burst', 'user_rate_limit', 'user_rate_burst', 'max_concurrent_requests')
+
+
+def load_brand_limits():
+    return {
+        row.pop('brand_name'): row
+        for row in Brand.objects.using('default').values('brand_name', *LIMIT_FIELDS)
+    }
+
+
+def get_brand_limits(brand_name):
+    """
+    Admission limits stored on the brand, empty for 'default' and unknown brands
+    """
+    return cached('default', [Brand], ('brand-limits',), load_brand_limits).get(brand_name, {})
+
+
+class BrandHostIndex:
+    """
+    host -> brand and URL prefix -> brand dicts of the active brands, compiled
+    once per Brand cache version so resolving a request is a dict lookup. The
+    version is read from the tenant cache at most every BRAND_REGISTRY_POLL_INTERVAL
+    seconds, a Brand change made in this process drops the index at once.
+    """
+
+    def __init__(self):
+        self._index = None
+
+    def get(self):
+        index = self._index
+        if self.is_recent(index):
+            return index
+
+        cache_version = get_versions('default', [Brand])[0]
+        if index is None or index['cache_version'] != cache_version:
+            return group.do(('brand-host-index', cache_version), lambda: self.build(cache_version))
+        index['checked_at'] = time.monotonic()
+        return index
+
+    def is_current(self):
+        """
+        True when get() answers without going to the database
+        """
+        index = self._index
+        if self.is_recent(index):
+            return True
+        return index is not None and index['cache_version'] == get_versions('default', [Brand])[0]
+
+    @staticmethod
+    def is_recent(index):
+        interval = getattr(settings, 'BRAND_REGISTRY_POLL_INTERVAL', 1)
+        return index is not None and time.monotonic() - index['checked_at'] < interval
+
+    def build(self, cache_version):
+        active = set()
+        hosts = {}
+        prefixes = {}
+        base_domains = [domain.lower().strip('.') for domain in getattr(settings, 'BRAND_BASE_DOMAINS', [])]
+
+        brands = Brand.objects.using('default').filter(is_active=True).values_list('brand_name', 'subdomain')
+        for brand_name, subdomain in brands:
+            if brand_name not in settings.DATABASES:
+                continue
+            active.add(brand_name)
+            label = (subdomain or brand_name).lower()
+            prefixes[label] = brand_name
+            for domain in base_domains:
+                hosts[f'{label}.{domain}'] = brand_name
+
+        self._index = {
+            'cache_version': cache_version, 'checked_at': time.monotonic(),
+            'brands': frozenset(active), 'hosts': hosts, 'prefixes': prefixes,
+        }
+        return self._index
+
+    def invalidate(self):
+        self._index = None
+
+    def is_active(self, brand_name):
+        """
+        Same answer as is_active_brand, from the index
+        """
+        return brand_name == 'default' or brand_name in self.get()['brands']
+
+    def brand_for_host(self, host):
+        """
+        Brand of a Host header value (the port is ignored), None when it is no brand host
+        """
+        return self.get()['hosts'].get(host.rsplit(':', 1)[0].lower())
+
+    def brand_for_prefix(self, path):
+        """
+        (brand, path without the prefix) of a /<BRAND_URL_PREFIX>/<subdomain>/... path, None otherwise
+        """
+        prefix = getattr(settings, 'BRAND_URL_PREFIX', None)
+        if not prefix or not path.startswith(prefix):
+            return None
+
+        label, _, rest = path[len(prefix):].partition('/')
+        brand_name = self.get()['prefixes'].get(label.lower())
+        if brand_name is None:
+            return None
+        return brand_name, '/' + rest
+
+
+brand_hosts = BrandHostIndex()
+
+
+class BrandListSnapshot:
+    """
+    The brand list response body, encoded once and kept in memory until a
+    Brand save / delete moves the Brand cache version
+    """
+
+    def __init__(self):
+        self._snapshot = None
+
+    def get(self):
+        cache_version = get_versions('default', [Brand])[0]
+        snapshot = self._snapshot
+        if snapshot is None or snapshot['cache_version'] != cache_version:
+            snapshot = group.do(('brand-list', cache_version), lambda: self.build(cache_version))
+        return snapshot
+
+    def build(self, cache_version):
+        rows = list(Brand.objects.using('default').order_by('brand_id').values_list('brand_id', 'brand_name'))
+
+        body = json.dumps({
+            "status": "success",
+            "data": dict(rows)
+        }, separators=(',', ':')).encode()
+
+        self._snapshot = {
+            'cache_version': cache_version,
+            'body': body,
+            'etag': quote_etag(hashlib.md5(body, usedforsecurity=False).hexdigest()),
+        }
+        return self._snapshot
+
+
+brand_list = BrandListSnapshot()
@@ -0,0 +1,366 @@
+# Include Django Packages
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Max
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+# Include From the Project Directory
+from .models import Brand, Relocation, Users, Tasks, ContactUs, Tombstone, ArchivedTask, ArchivedContact
+from .cache import get_versions
+from .singleflight import group
+
+# Include Built-in Package
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Copied parents first, so the foreign keys of a copied row always resolve
+RELOCATED_MODELS = [Users, Tasks, ContactUs, Tombstone, ArchivedTask, ArchivedContact]
+# Rows the database removes along with a deleted row (model -> [(child model, foreign key)])
+CASCADES = {Users: [(Tasks, 'userid')]}
+
+# Writes go to both databases until every worker reads from the new one
+DUAL_WRITE_PHASES = ('copying', 'verifying', 'cutover')
+MOVED_PHASES = ('cutover', 'done')
+CONNECTION_KEYS = ('ENGINE', 'NAME', 'USER', 'HOST', 'PORT')
+
+
+class RelocationError(ValueError):
+    pass
+
+
+def connection_key(settings_dict):
+    return tuple(settings_dict.get(key) for key in CONNECTION_KEYS)
+
+
+def remember_connection_target(connection):
+    """
+    Note the database a new connection talks to, see RelocationRegistry.point
+    """
+    connection.connected_to = connection_key(connection.settings_dict)
+
+
+def upsert(model, alias, rows):
+    """
+    Insert or overwrite `rows` in `alias` as they are, timestamps included
+    """
+    if not rows:
+        return
+
+    fields = model._meta.concrete_fields
+    options = {'on_conflict': OnConflict.UPDATE, 'update_fields': [field for field in fields if not field.primary_key]}
+    if connections[alias].features.supports_update_conflicts_with_target:
+        options['unique_fields'] = [model._meta.pk]
+
+    queryset = model._base_manager.using(alias)
+    batch_size = max(1, connections[alias].ops.bulk_batch_size(fields, rows))
+    for start in range(0, len(rows), batch_size):
+        # raw keeps auto_now / auto_now_add from stamping the copy with the current time
+        queryset._insert(rows[start:start + batch_size], fields=fields, raw=True, using=alias, **options)
+
+
+def sync_rows(model, source, target, pks):
+    """
+    Make the rows `pks` of `target` equal to `source`: copy the ones that
+    exist and delete the ones that are gone
+    """
+    rows = list(model._base_manager.using(source).filter(pk__in=pks))
+    found = {row.pk for row in rows}
+    missing = [pk for pk in pks if pk not in found]
+
+    with transaction.atomic(using=target):
+        upsert(model, target, rows)
+        if missing:
+            # Raw deletes send no signals, the source already ran the cascade
+            for child, field in CASCADES.get(model, ()):
+                child._base_manager.using(target).filter(**{f'{field}__in': missing})._raw_delete(target)
+            model._base_manager.using(target).filter(pk__in=missing)._raw_delete(target)
+
+
+def max_pk(model, alias):
+    return model._base_manager.using(alias).aggregate(high=Max('pk'))['high'] or 0
+
+
+def checksum(model, alias, low, high):
+    """
+    (row count, md5 of every column) of the rows with low <= pk < high
+    """
+    columns = [field.attname for field in model._meta.concrete_fields]
+    rows = model._base_manager.using(alias).filter(pk__gte=low, pk__lt=high).order_by('pk').values_list(*columns)
+
+    digest = hashlib.md5(usedforsecurity=False)
+    count = 0
+    for row in rows.iterator(chunk_size=2000):
+        digest.update(repr(row).encode())
+        count += 1
+    return count, digest.hexdigest()
+
+
+class RelocationRegistry:
+    """
+    brand -> phase, target and current database of the relocations that are
+    not aborted, loaded once per Relocation cache version and reloaded every
+    RELOCATION_POLL_INTERVAL seconds. Points the connections of a moved brand
+    at its new database and mirrors the writes of a brand that is still moving.
+    """
+
+    def __init__(self):
+        self._state = None
+        self._original = {}
+
+    def get(self):
+        cache_version = get_versions('default', [Relocation])[0]
+        state = self._state
+        if not self.is_fresh(state, cache_version):
+            state = group.do(('relocations', cache_version), lambda: self.build(cache_version))
+        return state
+
+    def is_current(self):
+        """
+        True when get() answers without going to the database
+        """
+        return self.is_fresh(self._state, get_versions('default', [Relocation])[0])
+
+    @staticmethod
+    def is_fresh(state, cache_version):
+        # The version bump of a phase change only reaches the processes sharing
+        # the tenant cache, the others notice it by reading the table again
+        if state is None or state['cache_version'] != cache_version:
+            return False
+        interval = getattr(settings, 'RELOCATION_POLL_INTERVAL', 5)
+        return interval is None or time.monotonic() - state['loaded_at'] < interval
+
+    def build(self, cache_version):
+        brands = {}
+        rows = Relocation.objects.using('default').exclude(phase='aborted').order_by('id').values_list(
+            'brand_name', 'phase', 'target_alias'
+        )
+        for brand_name, phase, target_alias in rows:
+            entry = brands.setdefault(brand_name, {'moved_to': None})
+            entry['phase'], entry['target'] = phase, target_alias
+            if phase in MOVED_PHASES:
+                entry['moved_to'] = target_alias
+
+        self._state = {'cache_version': cache_version, 'loaded_at': time.monotonic(), 'brands': brands}
+        return self._state
+
+    def invalidate(self):
+        self._state = None
+
+    def apply(self):
+        """
+        Point every moved brand alias at its new database, runs at the start of
+        each request so every worker follows a cutover within one request
+        """
+        brands = self.get()['brands']
+        for alias in set(brands) | set(self._original):
+            moved_to = brands.get(alias, {}).get('moved_to')
+            wanted = connections.settings[moved_to] if moved_to else self._original.get(alias)
+            if wanted is not None and alias in connections.settings:
+                self.point(alias, wanted)
+
+    def point(self, alias, wanted):
+        current = connections.settings[alias]
+        if connection_key(current) != connection_key(wanted):
+            self._original.setdefault(alias, dict(current))
+            # Every thread's connection of the alias shares this settings dict
+            current.update({key: value for key, value in wanted.items() if key != 'TEST'})
+
+        # A connection opened before the switch talks to the old database, and a
+        # persistent one (CONN_MAX_AGE) would still run this request there while
+        # dual_write_target() no longer mirrors it. Closed now, it reopens on the
+        # new database; one inside a transaction is closed when its request ends.
+        connection = connections[alias]
+        if connection.connection is not None and getattr(connection, 'connected_to', None) != connection_key(current):
+            if connection.in_atomic_block:
+                connection.close_at = time.monotonic()
+            else:
+                connection.close()
+
+    def restore(self, alias):
+        original = self._original.pop(alias, None)
+        if original is not None:
+            connections.settings[alias].update(original)
+
+    def dual_write_target(self, alias):
+        """
+        The alias the writes of `alias` are mirrored to, None when it is not moving
+        """
+        entry = self.get()['brands'].get(alias)
+        if entry is None or entry['phase'] not in DUAL_WRITE_PHASES:
+            return None
+        # After the cutover only the workers still on the old database mirror
+        if connection_key(connections.settings[alias]) == connection_key(connections.settings[entry['target']]):
+            return None
+        return entry['target']
+
+    def mirror(self, model, alias, pks):
+        """
+        Dual write: once the transaction commits, copy the rows `pks` of a
+        moving brand to its new database
+        """
+        if model not in RELOCATED_MODELS:
+            return
+        target = self.dual_write_target(alias)
+        if target is None:
+            return
+
+        def copy_rows():
+            try:
+                sync_rows(model, alias, target, pks)
+            except IntegrityError:
+                # The parent row is not copied yet, the copy / verify pass brings both
+                logger.info("Could not mirror %s %s to %s yet", model._meta.db_table, pks, target)
+            except Exception:
+                logger.warning("Could not mirror %s %s to %s", model._meta.db_table, pks, target, exc_info=True)
+
+        transaction.on_commit(copy_rows, using=alias)
+
+
+relocations = RelocationRegistry()
+
+
+def start(brand_name, target_alias):
+    """
+    Create the relocation of a brand, or return the one in progress to resume it
+    """
+    if target_alias not in settings.DATABASES or target_alias == brand_name:
+        raise RelocationError(f"{target_alias} is not another configured database")
+    if brand_name not in settings.DATABASES:
+        raise RelocationError(f"{brand_name} has no database")
+
+    relocation = Relocation.objects.using('default').filter(
+        brand_name=brand_name, phase__in=('copying', 'verifying')
+    ).first()
+    if relocation is not None:
+        if relocation.target_alias != target_alias:
+            raise RelocationError(f"{brand_name} is already moving to {relocation.target_alias}")
+        return relocation
+
+    return Relocation.objects.using('default').create(
+        brand_name=brand_name, source_alias=brand_name, target_alias=target_alias
+    )
+
+
+def copy(relocation, chunk_size=1000, report=None):
+    """
+    Copy every table in primary key order, the cursor of each table is saved
+    after every chunk so an interrupted copy resumes where it stopped
+    """
+    source, target = relocation.source_alias, relocation.target_alias
+
+    for model in RELOCATED_MODELS:
+        table = model._meta.db_table
+        cursor = relocation.cursors.get(table, 0)
+        while True:
+            rows = list(model._base_manager.using(source).filter(pk__gt=cursor).order_by('pk')[:chunk_size])
+            if not rows:
+                break
+            with transaction.atomic(using=target):
+                upsert(model, target, rows)
+            cursor = relocation.cursors[table] = rows[-1].pk
+            Relocation.objects.using('default').filter(id=relocation.id).update(
+                cursors=relocation.cursors, updated_at=timezone.now()
+            )
+            if report:
+                report(table, cursor)
+
+
+def verify(relocation, chunk_size=1000, repair=True):
+    """
+    Compare both databases chunk by chunk of primary keys and, with `repair`,
+    copy the chunks that differ again. Returns the number of chunks that differed.
+    """
+    source, target = relocation.source_alias, relocation.target_alias
+    mismatches = 0
+
+    for model in RELOCATED_MODELS:
+        high_pk = max(max_pk(model, source), max_pk(model, target))
+        for low in range(0, high_pk + 1, chunk_size):
+            high = low + chunk_size
+            if checksum(model, source, low, high) == checksum(model, target, low, high):
+                continue
+            mismatches += 1
+            if repair:
+                pks = set()
+                for alias in (source, target):
+                    pks.update(model._base_manager.using(alias).filter(pk__gte=low, pk__lt=high).values_list('pk', flat=True))
+                sync_rows(model, source, target, sorted(pks))
+
+    relocation.phase = 'verifying'
+    relocation.mismatches = mismatches
+    relocation.save(using='default', update_fields=['phase', 'mismatches', 'updated_at'])
+    return mismatches
+
+
+def cutover(relocation):
+    """
+    Move the reads and writes of the brand to the new database with one row
+    update, every worker switches on its next request
+    """
+    if relocation.phase != 'verifying' or relocation.mismatches:
+        raise RelocationError("Only a relocation whose last verify pass matched can cut over")
+
+    target = settings.DATABASES[relocation.target_alias]
+    with transaction.atomic(using='default'):
+        relocation.phase = 'cutover'
+        relocation.cutover_at = timezone.now()
+        relocation.save(using='default', update_fields=['phase', 'cutover_at', 'updated_at'])
+
+        brand = Brand.objects.using('default').filter(brand_name=relocation.brand_name).first()
+        if brand is not None:
+            brand.db_host = target.get('HOST') or brand.db_host
+            brand.db_port = str(target.get('PORT') or brand.db_port)
+            brand.save(using='default', update_fields=['db_host', 'db_port', 'updated_at'])
+
+    relocations.invalidate()
+    relocations.apply()
+
+
+def finish(relocation):
+    """
+    Stop the dual writes once every worker reads from the new database
+    """
+    if relocation.phase != 'cutover':
+        raise RelocationError("Only a relocation that cut over can finish")
+    relocation.phase = 'done'
+    relocation.save(using='default', update_fields=['phase', 'updated_at'])
+
+
+def abort(relocation):
+    if relocation.phase not in ('copying', 'verifying'):
+        raise RelocationError("A relocation that cut over cannot be aborted")
+    relocation.phase = 'aborted'
+    relocation.save(using='default', update_fields=['phase', 'updated_at'])
+
+
+def relocate(brand_name, target_alias, chunk_size=1000, rounds=5, do_cutover=True, log=None):
+    """
+    Copy, verify until a pass matches (the dual writes keep the copy current
+    meanwhile) and cut over. Safe to run again after an interruption.
+    """
+    log = log or (lambda message: None)
+    relocations.apply()
+
+    relocation = start(brand_name, target_alias)
+    if relocation.phase == 'copying':
+        copy(relocation, chunk_size, lambda table, cursor: log(f"{table}: copied up to {cursor}"))
+
+    for round_number in range(1, rounds + 1):
+        mismatches = verify(relocation, chunk_size)
+        log(f"Verify pass {round_number}: {mismatches} chunks differed")
+        if not mismatches:
+            break
+    else:
+        # The repairs of the last pass are checked by the next run
+        mismatches = verify(relocation, chunk_size, repair=False)
+        if mismatches:
+            raise RelocationError(f"{mismatches} chunks still differ after {rounds} verify passes")
+
+    if do_cutover:
+        cutover(relocation)
+        log(f"{brand_name} now uses {target_alias}")
+    return relocation
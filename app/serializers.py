@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from .models import Users, Tasks, Brand, ContactUs
+from .models import Users, Tasks, Brand, ContactUs, ArchivedTask, ArchivedContact
 from .middleware import get_current_brand
+from .utils import SparseFieldsetMixin, insert_unique
 
 class UserSerializer(serializers.ModelSerializer):
     """
@@ -12,6 +13,8 @@ class UserSerializer(serializers.ModelSerializer):
         model = Users
         fields = ('userid', 'email', 'firstname', 'surname', 'password', 'brand_name', 'number_task', 'valid_user', 'created_at', 'updated_at')
         read_only_fields = ('userid', 'created_at', 'updated_at', 'brand_name')
+        # No UniqueValidator query, see create
+        extra_kwargs = {'email': {'validators': []}}
 
     def validate_email(self, value):
         """Strip whitespace from email"""
@@ -38,7 +41,6 @@ class UserSerializer(serializers.ModelSerializer):
         return value
 
     def validate(self, attrs):
-        brand_name = self.context.get('brand_name')
         email = attrs.get('email')
         password = attrs.get('password')
         firstname = attrs.get('firstname')
@@ -47,21 +49,15 @@ class UserSerializer(serializers.ModelSerializer):
         if not all([email, password, firstname, surname]):
             raise ValueError("All fields (email, password, firstname, surname) are required")
 
-        db_alias = brand_name if brand_name != 'default' else 'default'
-        
-        existing_user = Users.objects.using(db_alias).filter(
-            email=email, 
-            brand_name=brand_name
-        ).first()
-        if existing_user:
-            raise ValueError('User with this email already exists in this brand')
-                    
+        # A duplicate email is refused by the (email, brand_name) unique constraint on insert
         return attrs
 
     def create(self, validated_data):
         validated_data['brand_name'] = get_current_brand()
-        user = Users.objects.create_user(**validated_data)
-        return user
+        return insert_unique(
+            lambda: Users.objects.create_user(**validated_data),
+            validated_data['brand_name'], 'User with this email already exists in this brand'
+        )
 
     def update(self, instance, validated_data):
         if 'password' in validated_data:
@@ -69,7 +65,7 @@ class UserSerializer(serializers.ModelSerializer):
             instance.set_password(password)
         return super().update(instance, validated_data)
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for Task model
     """
@@ -94,7 +90,8 @@ class TaskSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        return Tasks.objects.create(**validated_data)
+        using = validated_data.pop('using', None)
+        return Tasks.objects.db_manager(using).create(**validated_data)
 
     def validate(self, data):
         """
@@ -111,7 +108,7 @@ class TaskSerializer(serializers.ModelSerializer):
         return data
     
 
-class ContactSerializer(serializers.ModelSerializer):
+class ContactSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = ContactUs
         fields = "__all__"
@@ -137,7 +134,11 @@ class ContactSerializer(serializers.ModelSerializer):
         if not request_for_task or request_for_task == 0 :
             raise ValueError("Please enter a number of tasks you want to create")
 
-        user = Users.objects.using(brand_name).filter(userid=userid, brand_name=brand_name).first()
+        # The JWT permission already loaded the user, only look it up when called without a request
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        if not isinstance(user, Users) or user.userid != userid:
+            user = Users.objects.using(brand_name).filter(userid=userid, brand_name=brand_name).first()
 
         if not user:
             raise ValueError("User not found")
@@ -145,14 +146,15 @@ class ContactSerializer(serializers.ModelSerializer):
         if not user.is_active:
             raise ValueError("Your account is deactivated so not able to send a contact us form.")
         
-        contacts = ContactUs.objects.using(brand_name).filter(userid=userid)
+        latest_contact = ContactUs.objects.using(brand_name).filter(userid=userid).order_by('-created_at').first()
         
-        if contacts.exists():
-            latest_contact = contacts.latest()
-            if latest_contact.status == '0':
-                raise ValueError("You have already submitted the Contact Us form, and it is currently pending approval by the admin. Please wait for it to be approved before submitting it again.")
+        if latest_contact and latest_contact.status == '0':
+            raise ValueError("You have already submitted the Contact Us form, and it is currently pending approval by the admin. Please wait for it to be approved before submitting it again.")
         
-        attrs['total_count'] = contacts.count() + 1
+        # Every request carries the running count, older requests may have moved to the archive
+        if latest_contact is None:
+            latest_contact = ArchivedContact.objects.using(brand_name).filter(userid=userid).order_by('-created_at').first()
+        attrs['total_count'] = (latest_contact.total_count if latest_contact else 0) + 1
         attrs['firstname'] = user.firstname
         attrs['surname'] = user.surname
         attrs['email'] = user.email
@@ -162,4 +164,16 @@ class ContactSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         brand_name = self.context.get('brand_name')
-        return ContactUs.objects.using(brand_name).create(**validated_data)
\ No newline at end of file
+        return ContactUs.objects.using(brand_name).create(**validated_data)
+
+
+class ArchivedContactSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedContact
+        fields = "__all__"
+
+
+class ArchivedTaskSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedTask
+        fields = "__all__"
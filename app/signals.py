@@ -0,0 +1,64 @@
+# Include Django Packages
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Include From the Project Directory
+from .instrumentation import install_query_listener
+from .health import install_health_tracker
+from .cache import bump_version
+from .models import Brand, BrandAdmin, Users
+from .registry import brand_hosts
+from .directory import sync_user, remove_user
+from .relocation import relocations, remember_connection_target
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Report the queries of every new database connection to the request metrics and the health tracker"""
+    install_query_listener(connection)
+    install_health_tracker(connection)
+    remember_connection_target(connection)
+
+
+# Tasks and contacts get no post_delete receiver: a receiver makes their bulk
+# deletes load every row first, record_tombstones bumps their version instead
+@receiver(post_save)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=BrandAdmin)
+@receiver(post_delete, sender=Users)
+def invalidate_cached_reads(sender, using, update_fields=None, **kwargs):
+    """Drop the cached reads of the saved / deleted model in its brand database"""
+    if sender._meta.app_label not in ('app', 'admin_panel'):
+        return
+    # A login only touches last_login, which no cached read depends on
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    bump_version(using, sender)
+
+
+@receiver(post_save)
+@receiver(post_delete, sender=Users)
+def dual_write_relocating_rows(sender, instance, using, **kwargs):
+    """Mirror the writes of a brand that is moving to another database (tasks and contacts deletes go through record_tombstones)"""
+    relocations.mirror(sender, using, [instance.pk])
+
+
+@receiver(post_save, sender=Users)
+def sync_login_directory(sender, instance, using, created, update_fields=None, **kwargs):
+    """Keep the login directory entry of the user on their current email and brand"""
+    if created or update_fields is None or {'email', 'brand_name'} & set(update_fields):
+        sync_user(instance, using)
+
+
+@receiver(post_delete, sender=Users)
+def remove_from_login_directory(sender, instance, using, **kwargs):
+    remove_user(instance, using)
+
+
+@receiver(setting_changed)
+def reset_brand_hosts(setting, **kwargs):
+    """Recompile the host index when the brand host settings change (tests)"""
+    if setting in ('BRAND_BASE_DOMAINS', 'DATABASES'):
+        brand_hosts.invalidate()
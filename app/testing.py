@@ -0,0 +1,146 @@
+# Include Django Packages
+from django.conf import settings
+from django.db import connections
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+# Include DRF Packages
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Include From the Project Directory
+from .models import Brand, BrandAdmin, Users, Tasks, ContactUs
+from .cache import get_cache, bump_version
+from .registry import get_active_brands, get_brand_limits, brand_hosts
+from .health import health
+from .ratelimit import admission
+from .relocation import relocations
+from .utils import ADMIN_TOKEN_ROLE
+
+# Include Built-in Package
+from contextlib import ExitStack, contextmanager
+import bcrypt
+
+
+class TenantTestCase(TestCase):
+    """
+    Base test case for the endpoints, runs against the SQLite stand-ins of
+    `default` and the brand databases (see marketplace/test_settings.py)
+    """
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = Brand.objects.using('default').create(
+            brand_name='vehicle', database_name='vehicle', subdomain='vehicle', db_user='vehicle'
+        )
+        cls.furniture = Brand.objects.using('default').create(
+            brand_name='furniture', database_name='furniture', subdomain='furniture', db_user='furniture'
+        )
+        cls.user = cls.create_user('vehicle', 'user@vehicle.com', number_task=100, valid_user=True)
+        cls.admin = BrandAdmin.objects.using('default').create(
+            firstname='Admin', surname='Vehicle', email='admin@vehicle.com', brand_name='vehicle', is_active=True,
+            password=bcrypt.hashpw(b'password', bcrypt.gensalt(rounds=4)).decode(),
+        )
+
+    def setUp(self):
+        # The local memory cache outlives the rolled back test transactions
+        get_cache().clear()
+        # So do the breakers of the database health tracker and the rate limits
+        health.reset()
+        admission.reset()
+        # Budgets measure the steady state, with the brand registries built
+        get_active_brands()
+        get_brand_limits('default')
+        relocations.get()
+        brand_hosts.get()
+
+    @classmethod
+    def create_user(cls, brand_name, email, password='password', **extra_fields):
+        # The login directory entry is written once the brand transaction commits
+        with cls.captureOnCommitCallbacks(using=brand_name, execute=True):
+            return Users.objects.db_manager(brand_name).create_user(
+                email=email, password=password, firstname='Test', surname='User', brand_name=brand_name, **extra_fields
+            )
+
+    @staticmethod
+    def create_tasks(user, count, start=0):
+        Tasks.objects.using(user.brand_name).bulk_create([
+            Tasks(userid_id=user.userid, saved_search=f'search {index}', min_price=index, max_price=index + 10)
+            for index in range(start, start + count)
+        ])
+        bump_version(user.brand_name, Tasks)
+
+    @staticmethod
+    def create_contacts(user, count, start=0, status='1'):
+        ContactUs.objects.using(user.brand_name).bulk_create([
+            ContactUs(
+                userid=user.userid, firstname=user.firstname, surname=user.surname, email=user.email,
+                saved_search=f'{user.brand_name} {user.userid} contact {index}', request_for_task=5, status=status,
+            )
+            for index in range(start, start + count)
+        ])
+        bump_version(user.brand_name, ContactUs)
+
+    @staticmethod
+    def token_for(principal, brand_name, role=None):
+        refresh = RefreshToken.for_user(principal)
+        refresh['brand_name'] = brand_name
+        if role:
+            refresh['role'] = role
+        access = refresh.access_token
+        access['brand_name'] = brand_name
+        return str(access)
+
+    def user_headers(self, user=None):
+        user = user or self.user
+        return {
+            'HTTP_AUTHORIZATION': f'Bearer {self.token_for(user, user.brand_name)}',
+            'HTTP_X_BRAND_NAME': user.brand_name,
+        }
+
+    def admin_headers(self, admin=None):
+        admin = admin or self.admin
+        return {'HTTP_AUTHORIZATION': f'Bearer {self.token_for(admin, admin.brand_name, ADMIN_TOKEN_ROLE)}'}
+
+    @contextmanager
+    def assertQueryBudget(self, budget):
+        """
+        Fail when the block runs more than `budget` queries over all databases
+        """
+        with ExitStack() as stack:
+            contexts = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in settings.DATABASES
+            ]
+            yield contexts
+
+        executed = [
+            f"{context.connection.alias}: {query['sql']}"
+            for context in contexts
+            for query in context.captured_queries
+        ]
+        self.assertLessEqual(
+            len(executed), budget,
+            f"{len(executed)} queries executed, the budget is {budget}:\n" + '\n'.join(executed)
+        )
+
+    def count_queries(self, request):
+        """
+        Number of queries `request()` runs over all databases
+        """
+        with ExitStack() as stack:
+            contexts = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in settings.DATABASES
+            ]
+            request()
+        return sum(len(context.captured_queries) for context in contexts)
+
+    def assertQueriesDoNotGrow(self, request, grow):
+        """
+        Fail when the queries of `request()` grow after `grow()` adds more rows (N+1)
+        """
+        before = self.count_queries(request)
+        grow()
+        after = self.count_queries(request)
+        self.assertEqual(before, after, f"Query count grew with the row count: {before} -> {after}")
@@ -1,3 +1,1079 @@
-from django.test import TestCase
+# Include Django Packages
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.db.utils import IntegrityError, OperationalError
+from django.utils import timezone
+from django.utils.http import http_date
+from django.test import AsyncClient, Client, RequestFactory, SimpleTestCase, override_settings
 
-# Create your tests here.
+# Include From the Project Directory
+from .models import Brand, Users, Tasks, ContactUs, Tombstone, LoginDirectory, Relocation, ArchivedTask, ArchivedContact, Job
+from .testing import TenantTestCase
+from .singleflight import SingleFlight, group
+from .cache import bump_version, cached, get_cache, get_versions, make_key, versioned_key
+from .write_behind import last_logins
+from .directory import backfill_alias, lookup
+from .health import health, CLOSED, OPEN
+from .db_router import MultiTenantRouter, set_brand_context
+from .ratelimit import admission
+from .archival import archive_brand
+from .jobs import schedule_archival, enqueue, drain
+from .relocation import relocations, verify, start, copy, checksum
+from .middleware import brotli
+from .registry import brand_list, brand_hosts
+from .checks import check_tenant_cache
+from . import batch as batch_module
+from .utils import AlreadyExists, insert_unique
+
+# Include Built-in Package
+from datetime import timedelta
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
+import base64
+import gzip
+import json
+import threading
+import time
+import warnings
+
+
+class UserAuthEndpointTests(TenantTestCase):
+
+    def test_register(self):
+        # The users insert and the savepoint the test transaction puts around it, then
+        # on commit the login directory upsert and the cleanup of an entry under another brand
+        with self.assertQueryBudget(5), self.captureOnCommitCallbacks(using='vehicle', execute=True):
+            response = self.client.post('/register', {
+                'email': 'new@vehicle.com', 'password': 'password', 'firstname': 'New', 'surname': 'User'
+            }, content_type='application/json', HTTP_X_BRAND_NAME='vehicle')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Users.objects.using('vehicle').filter(email='new@vehicle.com').exists())
+        self.assertEqual(lookup('new@vehicle.com'), [('vehicle', 'vehicle')])
+
+    def test_register_over_stale_directory_entry(self):
+        userid = Users.objects.using('vehicle').order_by('-userid').first().userid + 1
+        LoginDirectory.objects.using('default').create(email_hash='stale', brand_name='vehicle', userid=userid, shard='vehicle')
+
+        with self.captureOnCommitCallbacks(using='vehicle', execute=True):
+            response = self.client.post('/register', {
+                'email': 'new@vehicle.com', 'password': 'password', 'firstname': 'New', 'surname': 'User'
+            }, content_type='application/json', HTTP_X_BRAND_NAME='vehicle')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(lookup('new@vehicle.com'), [('vehicle', 'vehicle')])
+        self.assertFalse(LoginDirectory.objects.using('default').filter(email_hash='stale').exists())
+
+    def test_brand_change_moves_directory_entry(self):
+        self.user.brand_name = 'furniture'
+        with self.captureOnCommitCallbacks(using='vehicle', execute=True):
+            self.user.save(using='vehicle', update_fields=['brand_name'])
+
+        self.assertEqual(lookup('user@vehicle.com'), [('furniture', 'vehicle')])
+
+    def test_register_existing_email(self):
+        response = self.client.post('/register', {
+            'email': 'user@vehicle.com', 'password': 'password', 'firstname': 'Same', 'surname': 'User'
+        }, content_type='application/json', HTTP_X_BRAND_NAME='vehicle')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Users.objects.using('vehicle').filter(email='user@vehicle.com').count(), 1)
+
+    def test_insert_unique_only_maps_the_unique_constraint(self):
+        create = lambda: Users.objects.db_manager('vehicle').create_user(
+            email='user@vehicle.com', password='password', firstname='Same', surname='User', brand_name='vehicle'
+        )
+        with self.assertRaises(AlreadyExists):
+            insert_unique(create, 'vehicle', 'exists')
+
+        create = lambda: Users.objects.db_manager('vehicle').create_user(
+            email='new@vehicle.com', password='password', firstname=None, surname='User', brand_name='vehicle'
+        )
+        with self.assertRaises(IntegrityError):
+            insert_unique(create, 'vehicle', 'exists')
+
+    def test_login(self):
+        with self.assertQueryBudget(3):
+            response = self.client.post('/login', {
+                'email': 'user@vehicle.com', 'password': 'password'
+            }, content_type='application/json', HTTP_X_BRAND_NAME='vehicle')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json()['data']['tokens'])
+
+    def test_login_without_brand_header(self):
+        self.create_user('furniture', 'chair@furniture.com')
+
+        with self.assertQueryBudget(2):
+            response = self.client.post('/login', {
+                'email': 'chair@furniture.com', 'password': 'password'
+            }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['user']['brand_name'], 'furniture')
+
+    def test_login_without_brand_header_does_not_reveal_accounts(self):
+        self.create_user('furniture', 'user@vehicle.com')
+
+        several = self.client.post('/login', {'email': 'user@vehicle.com', 'password': 'password'}, content_type='application/json')
+        unknown = self.client.post('/login', {'email': 'nobody@vehicle.com', 'password': 'password'}, content_type='application/json')
+
+        self.assertEqual(several.status_code, 401)
+        self.assertEqual((several.status_code, several.json()), (unknown.status_code, unknown.json()))
+
+    def test_login_directory_backfill(self):
+        LoginDirectory.objects.using('default').all().delete()
+        LoginDirectory.objects.using('default').create(email_hash='stale', brand_name='vehicle', userid=999, shard='vehicle')
+
+        self.assertEqual(backfill_alias('vehicle'), 1)
+
+        self.assertEqual(lookup('user@vehicle.com'), [('vehicle', 'vehicle')])
+        self.assertFalse(LoginDirectory.objects.using('default').filter(userid=999).exists())
+
+    def test_login_last_login_written_behind(self):
+        last_logins.flush()
+        before = Users.objects.using('vehicle').get(userid=self.user.userid).last_login
+        for _ in range(3):
+            self.client.post('/login', {
+                'email': 'user@vehicle.com', 'password': 'password'
+            }, content_type='application/json', HTTP_X_BRAND_NAME='vehicle')
+
+        self.assertEqual(last_logins.pending(), 1)
+        self.assertEqual(Users.objects.using('vehicle').get(userid=self.user.userid).last_login, before)
+
+        with self.assertQueryBudget(1):
+            last_logins.flush()
+
+        self.assertGreater(Users.objects.using('vehicle').get(userid=self.user.userid).last_login, before)
+
+
+class BrandResolutionTests(TenantTestCase):
+
+    def user_token(self):
+        return {'HTTP_AUTHORIZATION': self.user_headers()['HTTP_AUTHORIZATION']}
+
+    @override_settings(BRAND_BASE_DOMAINS=['example.com'])
+    def test_brand_from_subdomain(self):
+        self.client.get('/my-tasks', HTTP_HOST='vehicle.example.com', **self.user_token())
+
+        # Only the principal lookup, it is never cached
+        with self.assertQueryBudget(1):
+            response = self.client.get('/my-tasks', HTTP_HOST='vehicle.example.com:8000', **self.user_token())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['brand'], 'vehicle')
+
+    def test_brand_from_url_prefix(self):
+        response = self.client.get('/b/vehicle/my-tasks', **self.user_token())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['brand'], 'vehicle')
+
+    @override_settings(BRAND_BASE_DOMAINS=['example.com'])
+    def test_unknown_host_uses_default(self):
+        user = self.create_user('default', 'user@default.com')
+        token = {'HTTP_AUTHORIZATION': f'Bearer {self.token_for(user, "default")}'}
+
+        response = self.client.get('/my-tasks', HTTP_HOST='nope.example.com', **token)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['brand'], 'default')
+
+        # A brand's token is no good on the default brand
+        response = self.client.get('/my-tasks', HTTP_HOST='nope.example.com', **self.user_token())
+        self.assertIn('another brand', response.json()['message'])
+
+    @override_settings(BRAND_REGISTRY_POLL_INTERVAL=60)
+    def test_host_index_polls_the_cache_version(self):
+        brand_hosts.invalidate()
+        brand_hosts.get()
+
+        with mock.patch('app.registry.get_versions', wraps=get_versions) as versions:
+            self.assertEqual(brand_hosts.brand_for_host('vehicle.localhost'), 'vehicle')
+            self.assertTrue(brand_hosts.is_current())
+        versions.assert_not_called()
+
+        # A Brand change of another worker is picked up once the interval is over
+        bump_version('default', Brand)
+        with mock.patch('app.registry.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertFalse(brand_hosts.is_current())
+
+    async def test_async_brand_resolution_loads_cold_registries(self):
+        brand_hosts.invalidate()
+        relocations.invalidate()
+
+        response = await AsyncClient().get('/async/my-tasks', headers={
+            'Authorization': self.user_token()['HTTP_AUTHORIZATION'], 'X-Brand-Name': 'vehicle'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(brand_hosts.is_current())
+        self.assertTrue(relocations.is_current())
+
+
+class TaskEndpointTests(TenantTestCase):
+
+    def test_create_task(self):
+        self.create_tasks(self.user, 5)
+
+        with self.assertQueryBudget(6):
+            response = self.client.post('/create-task', {
+                'saved_search': 'new search', 'min_price': 1, 'max_price': 2
+            }, content_type='application/json', **self.user_headers())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Tasks.objects.using('vehicle').filter(userid=self.user.userid).count(), 6)
+
+    def test_update_task(self):
+        self.create_tasks(self.user, 1)
+        task = Tasks.objects.using('vehicle').get(userid=self.user.userid)
+
+        with self.assertQueryBudget(5):
+            response = self.client.put('/update-task', {
+                'id': task.id, 'max_price': 99
+            }, content_type='application/json', **self.user_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['max_price'], 99)
+
+    def test_delete_task_records_tombstone(self):
+        self.create_tasks(self.user, 1)
+        task = Tasks.objects.using('vehicle').get(userid=self.user.userid)
+
+        with self.assertQueryBudget(7):
+            response = self.client.delete('/delete-task', {
+                'id': task.id
+            }, content_type='application/json', **self.user_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Tombstone.objects.using('vehicle').filter(object_id=task.id, model_name='tasks').exists())
+
+    def test_my_tasks(self):
+        self.create_tasks(self.user, 5)
+
+        with self.assertQueryBudget(4):
+            response = self.client.get('/my-tasks', **self.user_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['pagination']['total_tasks'], 5)
+        self.assertQueriesDoNotGrow(
+            lambda: self.client.get('/my-tasks?limit=100', **self.user_headers()),
+            lambda: self.create_tasks(self.user, 20, start=5),
+        )
+
+    def test_my_tasks_sparse_fieldset(self):
+        self.create_tasks(self.user, 2)
+
+        response = self.client.get('/my-tasks?fields=id,saved_search', **self.user_headers())
+
+        self.assertEqual(set(response.json()['data']['tasks'][0]), {'id', 'saved_search'})
+
+    def test_my_tasks_not_modified(self):
+        self.create_tasks(self.user, 2)
+        etag = self.client.get('/my-tasks', **self.user_headers())['ETag']
+
+        with self.assertQueryBudget(3):
+            response = self.client.get('/my-tasks', HTTP_IF_NONE_MATCH=etag, **self.user_headers())
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_deleted_task_not_hidden_by_if_modified_since(self):
+        self.create_tasks(self.user, 2)
+        first = self.client.get('/my-tasks', **self.user_headers())
+        self.assertFalse(first.has_header('Last-Modified'))
+
+        task = Tasks.objects.using('vehicle').filter(userid=self.user.userid).order_by('id').first()
+        with self.captureOnCommitCallbacks(using='vehicle', execute=True):
+            self.client.delete('/delete-task', {'id': task.id}, content_type='application/json', **self.user_headers())
+
+        response = self.client.get('/my-tasks', HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60), **self.user_headers())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['pagination']['total_tasks'], 1)
+
+    def test_my_tasks_cached_until_tasks_change(self):
+        self.create_tasks(self.user, 2)
+        self.client.get('/my-tasks', **self.user_headers())
+
+        with self.assertQueryBudget(1):
+            response = self.client.get('/my-tasks', **self.user_headers())
+        self.assertEqual(response.json()['data']['pagination']['total_tasks'], 2)
+
+        self.client.post('/create-task', {
+            'saved_search': 'fresh search', 'min_price': 1, 'max_price': 2
+        }, content_type='application/json', **self.user_headers())
+
+        response = self.client.get('/my-tasks', **self.user_headers())
+        self.assertEqual(response.json()['data']['pagination']['total_tasks'], 3)
+
+    def test_deactivated_user_refused_with_warm_caches(self):
+        self.create_tasks(self.user, 2)
+        self.client.get('/my-tasks', **self.user_headers())
+
+        # An update from another process, the version keys of this one are not bumped
+        Users.objects.using('vehicle').filter(userid=self.user.userid).update(is_active=False)
+
+        response = self.client.get('/my-tasks', **self.user_headers())
+        self.assertNotEqual(response.status_code, 200)
+        self.assertIn('deactivated', response.json()['message'])
+
+    def test_changes(self):
+        self.create_tasks(self.user, 3)
+        self.create_contacts(self.user, 2)
+
+        with self.assertQueryBudget(5):
+            response = self.client.get('/changes', **self.user_headers())
+
+        data = response.json()['data']
+        self.assertEqual(len(data['changes']['tasks']), 3)
+        self.assertEqual(len(data['changes']['contacts']), 2)
+
+        response = self.client.get(f"/changes?cursor={data['cursor']}", **self.user_headers())
+        self.assertEqual(response.json()['data']['changes']['tasks'], [])
+
+        self.assertQueriesDoNotGrow(
+            lambda: self.client.get('/changes', **self.user_headers()),
+            lambda: self.create_tasks(self.user, 20, start=3),
+        )
+
+
+    def test_changes_invalid_input(self):
+        bad_timestamp = base64.urlsafe_b64encode(b'{"tasks":["yesterday",1]}').decode()
+
+        for query in ('limit=abc', 'limit=-5', 'limit=0', f'cursor={bad_timestamp}', 'cursor=not-a-cursor'):
+            response = self.client.get(f'/changes?{query}', **self.user_headers())
+            self.assertEqual(response.status_code, 400, query)
+
+    @override_settings(TOMBSTONE_RETENTION_DAYS=30)
+    def test_tombstones_pruned_after_retention(self):
+        Tombstone.objects.using('vehicle').bulk_create([
+            Tombstone(userid=self.user.userid, model_name='tasks', object_id=1),
+            Tombstone(userid=self.user.userid, model_name='tasks', object_id=2),
+        ])
+        Tombstone.objects.using('vehicle').filter(object_id=1).update(deleted_at=timezone.now() - timedelta(days=31))
+
+        enqueue('prune_tombstones', 'vehicle', {})
+        drain()
+
+        self.assertEqual(list(Tombstone.objects.using('vehicle').values_list('object_id', flat=True)), [2])
+        # A cursor issued before the pruned tombstones were deleted cannot be resumed
+        issued_at = (timezone.now() - timedelta(days=31)).isoformat()
+        cursor = base64.urlsafe_b64encode(json.dumps({'issued_at': issued_at}).encode()).decode()
+        response = self.client.get(f'/changes?cursor={cursor}', **self.user_headers())
+        self.assertEqual(response.status_code, 400)
+
+
+class CompressionTests(TenantTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_tasks(self.user, 30)
+
+    def test_gzip_large_response(self):
+        plain = self.client.get('/my-tasks?limit=100', **self.user_headers())
+        response = self.client.get('/my-tasks?limit=100', HTTP_ACCEPT_ENCODING='gzip', **self.user_headers())
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+        # The compressed body only keeps a weak validator
+        self.assertEqual(response['ETag'], f"W/{plain['ETag']}")
+
+    def test_gzip_length_padded_against_breach(self):
+        lengths = {
+            len(self.client.get('/my-tasks?limit=100', HTTP_ACCEPT_ENCODING='gzip', **self.user_headers()).content)
+            for _ in range(10)
+        }
+
+        self.assertGreater(len(lengths), 1)
+
+    @skipUnless(brotli, "brotli is not installed")
+    def test_brotli_preferred(self):
+        response = self.client.get('/my-tasks?limit=100', HTTP_ACCEPT_ENCODING='gzip, br', **self.user_headers())
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(response.content))['status'], 'success')
+
+    @skipUnless(brotli, "brotli is not installed")
+    def test_brotli_length_padded_against_breach(self):
+        responses = [
+            self.client.get('/my-tasks?limit=100', HTTP_ACCEPT_ENCODING='br', **self.user_headers())
+            for _ in range(10)
+        ]
+
+        self.assertGreater(len({len(response.content) for response in responses}), 1)
+        self.assertEqual(len({brotli.decompress(response.content) for response in responses}), 1)
+
+    def test_refused_encoding_not_used(self):
+        response = self.client.get('/my-tasks?limit=100', HTTP_ACCEPT_ENCODING='gzip;q=0, br;q=0', **self.user_headers())
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.json()['status'], 'success')
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_SIZE=1024 * 1024)
+    def test_small_response_not_compressed(self):
+        response = self.client.get('/my-tasks?limit=100', HTTP_ACCEPT_ENCODING='gzip', **self.user_headers())
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertTrue(response['ETag'].startswith('"'))
+
+
+class AsyncTaskEndpointTests(TenantTestCase):
+
+    def test_async_create_task(self):
+        with self.assertQueryBudget(6):
+            response = self.client.post('/async/create-task', {
+                'saved_search': 'async search', 'min_price': 1, 'max_price': 2
+            }, content_type='application/json', **self.user_headers())
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_async_views_skip_csrf_check(self):
+        client = Client(enforce_csrf_checks=True)
+
+        response = client.post('/async/create-task', {
+            'saved_search': 'no csrf token', 'min_price': 1, 'max_price': 2
+        }, content_type='application/json', **self.user_headers())
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_async_update_and_delete_task(self):
+        self.create_tasks(self.user, 1)
+        task = Tasks.objects.using('vehicle').get(userid=self.user.userid)
+
+        with self.assertQueryBudget(5):
+            response = self.client.put('/async/update-task', {
+                'id': task.id, 'max_price': 50
+            }, content_type='application/json', **self.user_headers())
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertQueryBudget(7):
+            response = self.client.delete('/async/delete-task', {
+                'id': task.id
+            }, content_type='application/json', **self.user_headers())
+        self.assertEqual(response.status_code, 200)
+
+    def test_async_my_tasks(self):
+        self.create_tasks(self.user, 5)
+
+        with self.assertQueryBudget(4):
+            response = self.client.get('/async/my-tasks', **self.user_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']['tasks']), 5)
+        self.assertQueriesDoNotGrow(
+            lambda: self.client.get('/async/my-tasks?limit=100', **self.user_headers()),
+            lambda: self.create_tasks(self.user, 20, start=5),
+        )
+
+
+class ContactEndpointTests(TenantTestCase):
+
+    def test_contact_us(self):
+        self.create_contacts(self.user, 2)
+
+        with self.assertQueryBudget(5):
+            response = self.client.post('/user/contact', {
+                'request_for_task': 10, 'saved_search': 'more tasks please'
+            }, content_type='application/json', **self.user_headers())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ContactUs.objects.using('vehicle').filter(userid=self.user.userid).count(), 3)
+
+    def test_contact_events_long_poll(self):
+        with self.assertQueryBudget(3):
+            response = self.client.get('/user/contact/events?timeout=0.01', **self.user_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'], [])
+
+    def test_contact_events_between_polls_are_delivered(self):
+        self.create_contacts(self.user, 1, status='0')
+        cursor = self.client.get('/user/contact/events?timeout=0.01', **self.user_headers()).json()['cursor']
+
+        # Approved while no poll is open
+        contact = ContactUs.objects.using('vehicle').get(userid=self.user.userid)
+        self.client.put(f'/api/admin/contact/{contact.id}', {
+            'status': '1', 'request_for_task': 5
+        }, content_type='application/json', **self.admin_headers())
+
+        response = self.client.get(f'/user/contact/events?timeout=0.01&cursor={cursor}', **self.user_headers())
+
+        events = response.json()['data']
+        self.assertEqual([(event['type'], event['contact_id']) for event in events], [('contact.approved', contact.id)])
+        self.assertEqual(events[0]['number_task'], 5)
+
+        response = self.client.get(f"/user/contact/events?timeout=0.01&cursor={response.json()['cursor']}", **self.user_headers())
+        self.assertEqual(response.json()['data'], [])
+
+    @override_settings(CONTACT_EVENTS_WSGI_MAX_TIMEOUT=0.01)
+    def test_contact_events_long_poll_capped_under_wsgi(self):
+        started = time.monotonic()
+        response = self.client.get('/user/contact/events?timeout=60', **self.user_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_contact_event_stream_refused_under_wsgi(self):
+        response = self.client.get('/user/contact/events', HTTP_ACCEPT='text/event-stream', **self.user_headers())
+
+        self.assertEqual(response.status_code, 406)
+
+
+class ArchivalTests(TenantTestCase):
+
+    def age(self, queryset, days):
+        queryset.update(updated_at=timezone.now() - timedelta(days=days))
+
+    @override_settings(ARCHIVE_TASKS_AFTER_DAYS=365)
+    def test_archive_moves_old_rows(self):
+        self.create_tasks(self.user, 5)
+        self.create_contacts(self.user, 3, status='1')
+        self.create_contacts(self.user, 1, start=3, status='0')
+        self.age(Tasks.objects.using('vehicle').filter(min_price__lt=3), 400)
+        self.age(ContactUs.objects.using('vehicle'), 400)
+
+        moved = archive_brand('vehicle', chunk_size=2)
+
+        self.assertEqual(moved, {'tasks': 3, 'contacts': 3})
+        self.assertEqual(Tasks.objects.using('vehicle').count(), 2)
+        self.assertEqual(ArchivedTask.objects.using('vehicle').count(), 3)
+        # The pending request waits for an admin
+        self.assertEqual(ContactUs.objects.using('vehicle').get().status, '0')
+        # Archived rows still exist, syncing clients must not drop them
+        self.assertFalse(Tombstone.objects.using('vehicle').exists())
+        self.assertEqual(self.client.get('/changes', **self.user_headers()).json()['data']['changes']['deleted'], [])
+
+        archived = ArchivedTask.objects.using('vehicle').order_by('id').first()
+        self.assertTrue(archived.updated_at < timezone.now() - timedelta(days=399))
+
+    def test_tasks_stay_hot_by_default(self):
+        self.create_tasks(self.user, 2)
+        self.age(Tasks.objects.using('vehicle'), 4000)
+
+        self.assertNotIn('tasks', archive_brand('vehicle'))
+        self.assertEqual(Tasks.objects.using('vehicle').count(), 2)
+
+    @override_settings(ARCHIVE_TASKS_AFTER_DAYS=365)
+    def test_my_tasks_with_archived(self):
+        self.create_tasks(self.user, 5)
+        self.age(Tasks.objects.using('vehicle').filter(min_price__lt=3), 400)
+        archive_brand('vehicle')
+
+        response = self.client.get('/my-tasks?limit=4', **self.user_headers())
+        self.assertEqual(response.json()['data']['pagination']['total_tasks'], 2)
+
+        pages = [
+            self.client.get(f'/my-tasks?limit=4&page={page}&include_archived=1', **self.user_headers()).json()['data']
+            for page in (1, 2)
+        ]
+        self.assertEqual(pages[0]['pagination']['total_tasks'], 5)
+        self.assertEqual([len(page['tasks']) for page in pages], [4, 1])
+        self.assertEqual(sorted(task['min_price'] for page in pages for task in page['tasks']), [0, 1, 2, 3, 4])
+        self.assertIn('archived_at', pages[1]['tasks'][0])
+
+    def test_brand_retention_overrides_setting(self):
+        self.vehicle.task_retention_days = 1
+        self.vehicle.save()
+        self.create_tasks(self.user, 2)
+        self.age(Tasks.objects.using('vehicle'), 2)
+
+        self.assertEqual(archive_brand('vehicle')['tasks'], 2)
+
+    def test_contact_count_continues_after_archive(self):
+        self.create_contacts(self.user, 2, status='1')
+        ContactUs.objects.using('vehicle').update(total_count=2)
+        self.age(ContactUs.objects.using('vehicle'), 400)
+        archive_brand('vehicle')
+
+        response = self.client.post('/user/contact', {
+            'request_for_task': 10, 'saved_search': 'more tasks please'
+        }, content_type='application/json', **self.user_headers())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ContactUs.objects.using('vehicle').get().total_count, 3)
+
+    @override_settings(ARCHIVE_TASKS_AFTER_DAYS=365)
+    def test_scheduled_archival_job(self):
+        self.create_tasks(self.user, 1)
+        self.age(Tasks.objects.using('vehicle'), 400)
+
+        self.assertEqual(len(schedule_archival()), 2)
+        self.assertEqual(schedule_archival(), [])
+        drain()
+
+        self.assertEqual(ArchivedTask.objects.using('vehicle').count(), 1)
+        self.assertEqual(set(Job.objects.using('default').values_list('status', flat=True)), {'succeeded'})
+
+
+class DatabaseHealthTests(TenantTestCase):
+
+    def trip(self, alias):
+        # The test transaction of the next test must not meet an open breaker
+        self.addCleanup(health.reset)
+        breaker = health.breaker(alias)
+        for _ in range(settings.DB_BREAKER_MIN_REQUESTS):
+            breaker.record(error=Exception('connection refused'))
+        return breaker
+
+    def test_open_breaker_fails_fast(self):
+        self.assertEqual(self.trip('vehicle').state, OPEN)
+
+        with self.assertQueryBudget(0):
+            response = self.client.get('/my-tasks', **self.user_headers())
+
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(int(response['Retry-After']) > 0)
+
+    def test_other_brands_are_not_affected(self):
+        self.trip('furniture')
+
+        response = self.client.get('/my-tasks', **self.user_headers())
+
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(DB_BREAKER_OPEN_SECONDS=0)
+    def test_successful_probe_closes_breaker(self):
+        breaker = self.trip('vehicle')
+
+        response = self.client.get('/my-tasks', **self.user_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(breaker.state, CLOSED)
+
+    @override_settings(DB_BREAKER_OPEN_SECONDS=0, DB_BREAKER_LATENCY_THRESHOLD=2.0)
+    def test_fast_probe_closes_breaker_tripped_by_latency(self):
+        self.addCleanup(health.reset)
+        breaker = health.breaker('vehicle')
+        breaker.record(duration=3.0)
+        self.assertEqual(breaker.state, OPEN)
+
+        response = self.client.get('/my-tasks', **self.user_headers())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_unreachable_database_trips_breaker_on_authentication(self):
+        self.addCleanup(health.reset)
+        # Fails where a connect would, before the queries reach the health tracker
+        def unreachable(*args):
+            raise OperationalError("Can't connect to MySQL server on vehicle")
+
+        with mock.patch.object(connections['vehicle'], 'create_cursor', side_effect=unreachable):
+            for _ in range(settings.DB_BREAKER_MIN_REQUESTS):
+                self.assertEqual(self.client.get('/my-tasks', **self.user_headers()).status_code, 500)
+
+            self.assertEqual(health.breaker('vehicle').state, OPEN)
+            response = self.client.get('/my-tasks', **self.user_headers())
+
+        self.assertEqual(response.status_code, 503)
+
+    @override_settings(TENANT_READ_REPLICAS={'vehicle': 'furniture'})
+    def test_reads_move_to_replica_while_open(self):
+        router = MultiTenantRouter()
+        set_brand_context('vehicle')
+        self.addCleanup(set_brand_context, None)
+
+        self.assertEqual(router.db_for_read(Tasks), 'vehicle')
+        self.trip('vehicle')
+        self.assertEqual(router.db_for_read(Tasks), 'furniture')
+        self.assertEqual(router.db_for_write(Tasks), 'vehicle')
+
+
+class AdmissionTests(TenantTestCase):
+
+    @override_settings(RATE_LIMIT_USER_RATE=0.01, RATE_LIMIT_USER_BURST=2)
+    def test_user_rate_limit(self):
+        other = self.create_user('vehicle', 'other@vehicle.com')
+
+        responses = [self.client.get('/my-tasks', **self.user_headers()) for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [200, 200, 429])
+        self.assertTrue(int(responses[-1]['Retry-After']) > 0)
+        self.assertEqual(self.client.get('/my-tasks', **self.user_headers(other)).status_code, 200)
+
+    @override_settings(
+        RATE_LIMIT_BRAND_RATE=0.01, RATE_LIMIT_BRAND_BURST=30, RATE_LIMIT_USER_RATE=0.01, RATE_LIMIT_USER_BURST=5
+    )
+    def test_rejected_user_does_not_drain_brand(self):
+        other = self.create_user('vehicle', 'other@vehicle.com')
+
+        statuses = [self.client.get('/my-tasks', **self.user_headers()).status_code for _ in range(40)]
+
+        self.assertEqual(statuses.count(429), 35)
+        self.assertEqual(self.client.get('/my-tasks', **self.user_headers(other)).status_code, 200)
+
+    def test_users_and_admins_counted_apart(self):
+        self.assertEqual(self.user.userid, self.admin.id)
+        factory = RequestFactory()
+
+        user_key = admission.client_key(factory.get('/my-tasks', **self.user_headers()))
+        admin_key = admission.client_key(factory.get('/api/admin/metrics', **self.admin_headers()))
+
+        self.assertEqual((user_key, admin_key), (f'user:{self.user.userid}', f'admin:{self.admin.id}'))
+
+    @override_settings(RATE_LIMIT_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_client_address_from_proxy_header(self):
+        factory = RequestFactory()
+
+        # The proxy appends the address it sees to whatever the client sent
+        request = factory.post('/login', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.1, 203.0.113.7')
+        self.assertEqual(admission.client_key(request), 'ip:203.0.113.7')
+        self.assertEqual(admission.client_key(factory.post('/login', REMOTE_ADDR='10.0.0.1')), 'ip:10.0.0.1')
+
+    def test_brand_limits_from_brand(self):
+        self.vehicle.rate_limit = 0.01
+        self.vehicle.rate_burst = 1
+        self.vehicle.save()
+
+        self.assertEqual(self.client.get('/my-tasks', **self.user_headers()).status_code, 200)
+        self.assertEqual(self.client.get('/my-tasks', **self.user_headers()).status_code, 429)
+        self.assertEqual(self.client.get('/api/admin/brands', HTTP_X_BRAND_NAME='furniture').status_code, 200)
+
+    def test_concurrency_limit(self):
+        self.vehicle.max_concurrent_requests = 1
+        self.vehicle.save()
+        self.assertTrue(admission.enter('vehicle', {'max_concurrent_requests': 1}))
+        self.addCleanup(admission.leave, 'vehicle')
+
+        response = self.client.get('/my-tasks', **self.user_headers())
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(admission.in_flight('vehicle'), 1)
+
+    @override_settings(RATE_LIMIT_SHED_LATENCY=0.25, RATE_LIMIT_MIN_SHARE=0.1)
+    def test_slow_database_sheds_load(self):
+        breaker = health.breaker('vehicle')
+
+        breaker.latency_ewma = 0.1
+        self.assertEqual(admission.shed_factor('vehicle'), 1.0)
+        breaker.latency_ewma = 1.0
+        self.assertEqual(admission.shed_factor('vehicle'), 0.25)
+        breaker.latency_ewma = 10.0
+        self.assertEqual(admission.shed_factor('vehicle'), 0.1)
+
+
+class IdempotencyTests(TenantTestCase):
+
+    def create_task(self, key, saved_search='retried search'):
+        return self.client.post('/create-task', {
+            'saved_search': saved_search, 'min_price': 1, 'max_price': 2
+        }, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key, **self.user_headers())
+
+    def test_retry_replays_response(self):
+        first = self.create_task('key-1')
+        with self.assertNumQueries(1, using='vehicle'):
+            retry = self.create_task('key-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Tasks.objects.using('vehicle').filter(userid=self.user.userid).count(), 1)
+
+    def test_key_reused_for_other_request(self):
+        self.create_task('key-1')
+
+        response = self.create_task('key-1', saved_search='another search')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Tasks.objects.using('vehicle').filter(userid=self.user.userid).count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT=0)
+    def test_duplicate_in_flight_elsewhere(self):
+        cache_key = make_key('vehicle', 'idempotency', self.user.userid, 'key-1')
+        get_cache().add(f'{cache_key}:lock', 1)
+
+        response = self.create_task('key-1')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Tasks.objects.using('vehicle').filter(userid=self.user.userid).exists())
+
+    async def test_async_retry_replays_response(self):
+        client = AsyncClient()
+        headers = {'Authorization': self.user_headers()['HTTP_AUTHORIZATION'], 'X-Brand-Name': 'vehicle', 'Idempotency-Key': 'key-1'}
+        body = {'saved_search': 'retried search', 'min_price': 1, 'max_price': 2}
+
+        first = await client.post('/async/create-task', body, content_type='application/json', headers=headers)
+        retry = await client.post('/async/create-task', body, content_type='application/json', headers=headers)
+        reused = await client.post('/async/create-task', {**body, 'saved_search': 'other'}, content_type='application/json', headers=headers)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(reused.status_code, 422)
+        self.assertEqual(await Tasks.objects.using('vehicle').filter(userid=self.user.userid).acount(), 1)
+
+
+class BatchTests(TenantTestCase):
+
+    def batch(self, requests, **options):
+        return self.client.post('/batch', {
+            'requests': requests, **options
+        }, content_type='application/json', **self.user_headers())
+
+    def test_async_sub_request(self):
+        self.create_tasks(self.user, 2)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = self.batch([{'path': '/async/my-tasks'}])
+
+        self.assertEqual(response.json()['data'][0]['status'], 200)
+        self.assertEqual(response.json()['data'][0]['body']['data']['pagination']['total_tasks'], 2)
+        self.assertEqual([str(warning.message) for warning in caught if 'async_to_sync' in str(warning.message)], [])
+
+    def test_sub_requests_run_in_order(self):
+        self.create_tasks(self.user, 2)
+
+        response = self.batch([
+            {'method': 'POST', 'path': '/create-task', 'body': {'saved_search': 'batched search'}},
+            {'path': '/my-tasks?limit=10'},
+            {'path': '/api/admin/brands'},
+            {'path': '/missing'},
+            {'path': '/batch'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['data']
+        self.assertEqual([result['status'] for result in results], [201, 200, 200, 404, 400])
+        self.assertEqual(results[1]['body']['data']['pagination']['total_tasks'], 3)
+        self.assertIn('ETag', results[2]['headers'])
+
+    def test_parallel_reads(self):
+        brand_list.get()
+        response = self.batch([{'path': '/api/admin/brands'}] * 3, parallel=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['data']], [200] * 3)
+
+    def test_parallel_reads_keep_thread_connections(self):
+        self.addCleanup(setattr, batch_module, '_executor', None)
+        self.addCleanup(lambda: batch_module._executor and batch_module._executor.shutdown())
+        brand_list.get()
+        call_view = batch_module.call_view
+
+        def read_default(sub_request, charge):
+            connections['default'].ensure_connection()
+            return call_view(sub_request, charge)
+
+        DatabaseWrapper = type(connections['default'])
+        with mock.patch.dict(connections.settings['default'], {'CONN_MAX_AGE': 60}), \
+                mock.patch.object(batch_module, 'call_view', read_default), \
+                mock.patch.object(DatabaseWrapper, 'get_new_connection', autospec=True,
+                                  side_effect=DatabaseWrapper.get_new_connection) as opened:
+            for _ in range(3):
+                self.batch([{'path': '/api/admin/brands'}] * 3, parallel=True)
+
+        # One connection per batch thread at most, not one per read
+        self.assertLessEqual(opened.call_count, settings.BATCH_MAX_WORKERS)
+
+    def test_parallel_reads_wait_for_concurrency_limit(self):
+        self.vehicle.max_concurrent_requests = 1
+        self.vehicle.save()
+        brand_list.get()
+        call_view = batch_module.call_view
+        threads = []
+
+        def record_thread(sub_request, charge):
+            threads.append(threading.current_thread())
+            return call_view(sub_request, charge)
+
+        with mock.patch.object(batch_module, 'call_view', record_thread):
+            response = self.batch([{'path': '/api/admin/brands'}] * 3, parallel=True)
+
+        # The batch request holds the brand's only slot, its reads run one after the other
+        self.assertEqual([result['status'] for result in response.json()['data']], [200] * 3)
+        self.assertEqual(set(threads), {threading.current_thread()})
+        self.assertEqual(admission.in_flight('vehicle'), 0)
+
+    def test_parallel_only_for_reads(self):
+        response = self.batch([{'method': 'POST', 'path': '/create-task', 'body': {}}], parallel=True)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Tasks.objects.using('vehicle').filter(userid=self.user.userid).exists())
+
+
+class WarmUpTests(TenantTestCase):
+
+    def test_warm_up_command(self):
+        out = StringIO()
+        call_command('warm_up', stdout=out)
+
+        for phase in ('connections', 'registries', 'urls', 'serializers'):
+            self.assertIn(f'Warm-up {phase}:', out.getvalue())
+        self.assertEqual(health.breaker('furniture').state, CLOSED)
+
+
+class RelocationTests(TenantTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.create_tasks(self.user, 5)
+        self.create_contacts(self.user, 3)
+        # The cutover points the vehicle alias at vehicle_next for the whole process
+        self.addCleanup(relocations.restore, 'vehicle')
+
+    def assertSameRows(self, model):
+        for alias in ('vehicle', 'vehicle_next'):
+            self.assertTrue(model.objects.using(alias).exists())
+        self.assertEqual(checksum(model, 'vehicle', 0, 10 ** 9), checksum(model, 'vehicle_next', 0, 10 ** 9))
+
+    def test_relocate_and_cut_over(self):
+        output = StringIO()
+        call_command('relocate_brand', 'vehicle', 'vehicle_next', '--chunk-size', '2', stdout=output)
+
+        for model in (Users, Tasks, ContactUs):
+            self.assertSameRows(model)
+        self.assertIn('Verify pass 1: 0 chunks differed', output.getvalue())
+        self.assertEqual(Relocation.objects.using('default').get().phase, 'cutover')
+        self.assertEqual(connections.settings['vehicle']['NAME'], connections.settings['vehicle_next']['NAME'])
+
+    def test_dual_write_while_copying(self):
+        relocation = start('vehicle', 'vehicle_next')
+        copy(relocation)
+
+        with self.captureOnCommitCallbacks(using='vehicle', execute=True):
+            response = self.client.post('/create-task', {
+                'saved_search': 'written during the copy', 'min_price': 1, 'max_price': 2
+            }, content_type='application/json', **self.user_headers())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Tasks.objects.using('vehicle_next').filter(saved_search='written during the copy').exists())
+        self.assertEqual(verify(relocation, repair=False), 0)
+
+    def test_write_behind_logins_mirrored(self):
+        relocation = start('vehicle', 'vehicle_next')
+        copy(relocation)
+
+        logged_in = timezone.now().replace(microsecond=0)
+        last_logins.record('vehicle', self.user.userid, logged_in)
+        with self.captureOnCommitCallbacks(using='vehicle', execute=True):
+            last_logins.flush()
+
+        self.assertEqual(Users.objects.using('vehicle_next').get(userid=self.user.userid).last_login, logged_in)
+        self.assertEqual(verify(relocation, repair=False), 0)
+
+    def test_cutover_noticed_without_cache_version(self):
+        relocation = start('vehicle', 'vehicle_next')
+        relocations.apply()
+
+        # run by relocate_brand in another process, the version bump never reaches this one
+        Relocation.objects.using('default').filter(id=relocation.id).update(phase='cutover')
+        relocations.apply()
+        self.assertNotEqual(connections.settings['vehicle']['NAME'], connections.settings['vehicle_next']['NAME'])
+
+        with override_settings(RELOCATION_POLL_INTERVAL=0):
+            relocations.apply()
+        self.assertEqual(connections.settings['vehicle']['NAME'], connections.settings['vehicle_next']['NAME'])
+
+    def test_point_closes_connection_to_old_database(self):
+        connection = connections['vehicle']
+        connection.ensure_connection()
+
+        with mock.patch.object(connection, 'in_atomic_block', False), mock.patch.object(connection, 'close') as close:
+            relocations.point('vehicle', connections.settings['vehicle_next'])
+
+        close.assert_called_once_with()
+
+    def test_verify_repairs_drift(self):
+        relocation = start('vehicle', 'vehicle_next')
+        copy(relocation, chunk_size=2)
+
+        # Writes that skip the signals and the mirroring
+        Tasks.objects.using('vehicle').filter(min_price=0).update(max_price=999)
+        Tasks.objects.using('vehicle').filter(min_price=1).delete()
+
+        self.assertTrue(verify(relocation, chunk_size=2) > 0)
+        self.assertEqual(verify(relocation, chunk_size=2), 0)
+        self.assertEqual(Tasks.objects.using('vehicle_next').get(min_price=0).max_price, 999)
+        self.assertFalse(Tasks.objects.using('vehicle_next').filter(min_price=1).exists())
+
+    def test_copy_resumes_from_cursor(self):
+        relocation = start('vehicle', 'vehicle_next')
+        relocation.cursors = {'tasks': Tasks.objects.using('vehicle').order_by('id').values_list('id', flat=True)[2]}
+
+        copy(relocation, chunk_size=2)
+
+        self.assertEqual(Tasks.objects.using('vehicle_next').count(), 2)
+        self.assertEqual(Users.objects.using('vehicle_next').count(), 1)
+
+
+class WaitCountingEvent(threading.Event):
+    """Event that releases `waiting` for every thread that starts waiting on it"""
+
+    def __init__(self):
+        super().__init__()
+        self.waiting = threading.Semaphore(0)
+
+    def wait(self, timeout=None):
+        self.waiting.release()
+        return super().wait(timeout)
+
+
+class CacheTests(SimpleTestCase):
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_single_flight_collapses_concurrent_loads(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def load():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'value'
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = [executor.submit(flight.do, 'key', load)]
+            self.assertTrue(started.wait(5))
+
+            # Count the callers that wait for the running load
+            call = flight._calls['key']
+            call.done = WaitCountingEvent()
+            results += [executor.submit(flight.do, 'key', load) for _ in range(7)]
+            for _ in range(7):
+                self.assertTrue(call.done.waiting.acquire(timeout=5))
+            release.set()
+
+        self.assertEqual([result.result() for result in results], ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    @override_settings(TENANT_CACHE_STALE_TIMEOUT=60)
+    def test_stale_entry_served_while_refreshed(self):
+        calls = []
+        refreshed = threading.Event()
+
+        def compute():
+            calls.append(1)
+            if len(calls) > 1:
+                refreshed.set()
+            return 'first' if len(calls) == 1 else 'second'
+
+        self.assertEqual(cached('vehicle', ['app.tasks'], ('stale',), compute, timeout=60), 'first')
+
+        # Age the entry past its fresh timeout
+        key = versioned_key('vehicle', ['app.tasks'], 'stale')
+        value, _ = get_cache().get(key)
+        get_cache().set(key, (value, time.time() - 1), timeout=60)
+
+        self.assertEqual(cached('vehicle', ['app.tasks'], ('stale',), compute, timeout=60), 'first')
+        self.assertTrue(refreshed.wait(5))
+        # Joins the refresh still in flight, it returns once the new value is stored
+        group.do(key, lambda: None)
+        self.assertEqual(cached('vehicle', ['app.tasks'], ('stale',), compute, timeout=60), 'second')
+
+    @override_settings(DEBUG=False)
+    def test_check_refuses_process_local_tenant_cache(self):
+        errors = check_tenant_cache(None)
+        self.assertEqual([error.id for error in errors], ['app.E001'])
+
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_tenant_cache(None), [])
@@ -2,7 +2,7 @@
 from django.urls import path
 
 # Include From the Project Directory
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     # Authentication URLs
@@ -14,6 +14,17 @@ urlpatterns = [
     path('update-task', views.UpdateTaskAPIView.as_view(), name='update-task'),
     path('delete-task', views.DeleteTaskAPIView.as_view(), name='delete-task'),
     path('my-tasks', views.UserTasksListView.as_view(), name='user-tasks'),
+    path('changes', views.ChangeFeedView.as_view(), name='changes'),
 
-    path("user/contact", views.ContactUsView.as_view(), name="contact_admin")
+    # Async Task Management URLs, served without a thread per request under ASGI
+    path('async/create-task', async_views.AsyncCreateTaskAPIView.as_view(), name='async-create-task'),
+    path('async/update-task', async_views.AsyncUpdateTaskAPIView.as_view(), name='async-update-task'),
+    path('async/delete-task', async_views.AsyncDeleteTaskAPIView.as_view(), name='async-delete-task'),
+    path('async/my-tasks', async_views.AsyncUserTasksListView.as_view(), name='async-user-tasks'),
+
+    path("user/contact", views.ContactUsView.as_view(), name="contact_admin"),
+    path("user/contact/events", views.ContactEventsView.as_view(), name="contact_events"),
+
+    # Several API requests in one, see app/batch.py
+    path('batch', views.BatchView.as_view(), name='batch')
 ]
\ No newline at end of file
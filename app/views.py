@@ -1,6 +1,11 @@
 # Include a Django Packages
+from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.views import View
 
 # Include DRF Packages
 from rest_framework.response import Response
@@ -8,11 +13,27 @@ from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 
 # Include From the Project Directory
-from .models import Users
-from .db_router import get_brand_context
+from .models import Users, ArchivedTask
+from .db_router import get_brand_context, set_brand_context
 from .jwt_auth import JWTAuthorization
 from .serializers import *
-from .utils import APIValidateView
+from .changes import get_changes, record_tombstones, InvalidCursor, decode_cursor, head_cursor, contact_events
+from .events import hub
+from .cache import cached
+from .write_behind import last_logins
+from .directory import lookup
+from .health import health
+from .idempotency import idempotent
+from .batch import run_batch, BatchError
+from .utils import (
+    APIValidateView, get_sparse_fieldset, narrow_queryset,
+    get_collection_version, get_not_modified_response, set_version_headers, merge_versions
+)
+
+# Include Built-in Package
+from asgiref.sync import sync_to_async
+import asyncio
+import json
 
 
 class UserRegistrationView(APIValidateView):
@@ -21,6 +42,7 @@ class UserRegistrationView(APIValidateView):
     Register a new user.
     """
 
+    @idempotent
     def post(self, request):
         brand_name = getattr(request, 'brand_name', 'default')
 
@@ -76,11 +98,21 @@ class UserLoginView(APIValidateView):
 
         # Get a latest brand_name from the middleware
         brand_name = get_brand_context()
-
-        user = Users.objects.using(brand_name).get(
+        database = brand_name
+
+        # No brand in the request, the login directory knows the user's tenant
+        if brand_name == 'default':
+            tenants = lookup(email)
+            # Several brands need the X-Brand-Name header, answered like an unknown
+            # email so the response does not tell the account exists
+            if len(tenants) == 1:
+                brand_name, database = tenants[0]
+                set_brand_context(brand_name)
+
+        user = Users.objects.using(database).filter(
             email=email, 
             brand_name=brand_name
-        )
+        ).first()
 
         if not user:
             return Response({
@@ -100,8 +132,8 @@ class UserLoginView(APIValidateView):
             refresh['brand_name'] = brand_name
             refresh.access_token['brand_name'] = brand_name
 
-            user.last_login = timezone.now()
-            user.save(using=brand_name, update_fields=['last_login'])
+            # Written in batches by the write-behind buffer, not in the login path
+            last_logins.record(database, user.userid, timezone.now())
             
             return Response({
                 'status': 'success',
@@ -113,7 +145,7 @@ class UserLoginView(APIValidateView):
                         'firstname': user.firstname,
                         'surname': user.surname,
                         'brand_name': user.brand_name,
-                        'database_used': brand_name
+                        'database_used': database
                     },
                     'tokens': {
                         'refresh': str(refresh),
@@ -134,14 +166,14 @@ class CreateTaskAPIView(APIValidateView):
     """
     permission_classes = [JWTAuthorization]
 
+    @idempotent
     def post(self, request):
         data = request.data.copy()
-        userid = request.user.userid
+        user = request.user
+        userid = user.userid
 
         brand_name = request.brand_name
 
-        user = Users.objects.using(brand_name).filter(userid=userid).first()
-
         if not user.valid_user:
             return Response({
                 "status":"error",
@@ -176,6 +208,7 @@ class UpdateTaskAPIView(APIValidateView):
     """
     permission_classes = [JWTAuthorization]
 
+    @idempotent
     def put(self, request):
         
         task_id = request.data.get('id')
@@ -230,7 +263,9 @@ class DeleteTaskAPIView(APIValidateView):
                 'message': 'Task not found'
             }, status=status.HTTP_404_NOT_FOUND)
 
-        task.delete()
+        with transaction.atomic(using=brand_name):
+            record_tombstones(brand_name, 'tasks', [(request.user.userid, task.id)])
+            task.delete()
 
         return Response({
             'status': 'success',
@@ -247,37 +282,65 @@ class UserTasksListView(APIValidateView):
     def get(self, request):
         brand_name = request.brand_name
         
-        tasks_query = Tasks.objects.using(brand_name).filter(
-            userid=request.user.userid
-        )
-        
-        # Order by creation date (newest first)
-        tasks_query = tasks_query.order_by('-created_at')
-        
         # Pagination
         page = int(request.GET.get('page', 1))
         limit = int(request.GET.get('limit', 10))
         start = (page - 1) * limit
         end = start + limit
-        
-        # Get total count for pagination info
-        total_tasks = tasks_query.count()
-        
-        # Get paginated tasks
-        tasks = tasks_query[start:end]
-        
-        # Serialize tasks
-        serializer = TaskSerializer(tasks, many=True)
+
+        # Only select and render the fields the client asked for
+        fieldset = get_sparse_fieldset(request)
+        # ?include_archived=1 continues the list with the tasks moved to the archive table
+        include_archived = request.GET.get('include_archived') in ('1', 'true')
+
+        def load_page():
+            read_alias = health.read_alias(brand_name)
+            tasks_query = Tasks.objects.using(read_alias).filter(
+                userid=request.user.userid
+            )
+
+            # Order by creation date (newest first)
+            tasks_query = tasks_query.order_by('-created_at')
+
+            # Get total count for pagination info along with the list version
+            version = get_collection_version(tasks_query, brand_name, request.user.userid, request.GET.urlencode())
+
+            tasks = narrow_queryset(tasks_query, TaskSerializer, **fieldset)[start:end]
+            tasks = list(TaskSerializer(tasks, many=True, **fieldset).data)
+
+            if include_archived:
+                archived_query = ArchivedTask.objects.using(read_alias).filter(
+                    userid=request.user.userid
+                ).order_by('-created_at')
+                hot_total = version['total']
+                version = merge_versions(version, get_collection_version(archived_query, brand_name, request.user.userid, 'archived'))
+
+                if len(tasks) < limit:
+                    offset = max(0, start - hot_total)
+                    archived = narrow_queryset(archived_query, ArchivedTaskSerializer, **fieldset)[offset:offset + limit - len(tasks)]
+                    tasks += ArchivedTaskSerializer(archived, many=True, **fieldset).data
+
+            return {'version': version, 'tasks': tasks}
+
+        # The page is cached per brand until one of the brand's tasks changes
+        task_page = cached(brand_name, [Tasks, ArchivedTask], ('tasks-page', request.user.userid, request.GET.urlencode()), load_page)
+        version = task_page['version']
+        total_tasks = version['total']
+
+        # Skip rendering when the client already has this page
+        not_modified = get_not_modified_response(request, version)
+        if not_modified is not None:
+            return not_modified
         
         # Calculate pagination info
         total_pages = (total_tasks + limit - 1) // limit
         has_next = page < total_pages
         has_previous = page > 1
         
-        return Response({
+        response = Response({
             'status': 'success',
             'data': {
-                'tasks': serializer.data,
+                'tasks': task_page['tasks'],
                 'pagination': {
                     'current_page': page,
                     'total_pages': total_pages,
@@ -289,14 +352,53 @@ class UserTasksListView(APIValidateView):
                 'brand': brand_name
             }
         }, status=status.HTTP_200_OK)
+
+        return set_version_headers(response, version)
         
     
+class ChangeFeedView(APIValidateView):
+    """
+    Tasks, contact requests and deletions changed since the given cursor.
+    Archived rows are not deletions, they leave the feed without a tombstone
+    and are still listed with ?include_archived=1.
+    """
+    permission_classes = [JWTAuthorization]
+
+    def get(self, request):
+        brand_name = request.brand_name
+
+        try:
+            limit = int(request.GET.get('limit', 100))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({
+                'status': 'error',
+                'message': "limit must be a positive number"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(limit, 500)
+
+        try:
+            data = get_changes(brand_name, request.user.userid, request.GET.get('cursor'), limit)
+        except InvalidCursor as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'success',
+            'data': data
+        }, status=status.HTTP_200_OK)
+
+
 class ContactUsView(APIValidateView):
     """
     Contact Us views for sending the admin
     """
     permission_classes = [JWTAuthorization]
 
+    @idempotent
     def post(self, request):
 
         userid = request.user.userid
@@ -326,4 +428,141 @@ class ContactUsView(APIValidateView):
         return Response({
             "status": "success",
             "message": "Contact Us form submitted successfully"
-        }, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        }, status=status.HTTP_201_CREATED)
+
+
+class ContactEventsView(View):
+    """
+    Push contact request updates to the user as Server-Sent Events,
+    or long-poll for the next one when the client does not accept a stream.
+    Events are read from the change feed after the `cursor` parameter (or
+    Last-Event-ID), the hub only wakes the waiting request up, so updates
+    made between two polls are delivered by the next one.
+    Streams need the ASGI app, a WSGI worker would buffer the endless response.
+    Long-polls belong there too, under WSGI each one holds a worker, so the wait
+    is capped at CONTACT_EVENTS_WSGI_MAX_TIMEOUT.
+    """
+
+    async def get(self, request):
+        user = await self.get_user(request)
+        if user is None:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Authentication credentials were not provided or are invalid.'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+
+        if isinstance(request, ASGIRequest):
+            max_timeout = settings.CONTACT_EVENTS_MAX_TIMEOUT
+        else:
+            max_timeout = settings.CONTACT_EVENTS_WSGI_MAX_TIMEOUT
+        try:
+            timeout = min(float(request.GET.get('timeout', 25)), max_timeout)
+        except ValueError:
+            timeout = -1
+        if timeout < 0:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'timeout must be a number of seconds'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        streaming = 'text/event-stream' in request.headers.get('Accept', '')
+        if streaming and not isinstance(request, ASGIRequest):
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Event streams are only served by the ASGI app, long-poll without the text/event-stream Accept header'
+            }, status=status.HTTP_406_NOT_ACCEPTABLE)
+
+        cursor = request.GET.get('cursor') or request.headers.get('Last-Event-ID')
+        try:
+            if cursor:
+                decode_cursor(cursor)
+            else:
+                cursor = await sync_to_async(head_cursor)(request.brand_name, user.userid)
+        except InvalidCursor as e:
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if streaming:
+            response = StreamingHttpResponse(
+                self.stream(request.brand_name, user.userid, cursor),
+                content_type='text/event-stream'
+            )
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        # Subscribe before reading the feed, an update made in between still wakes the poll
+        subscription = hub.subscribe(request.brand_name, user.userid)
+        try:
+            events, next_cursor = await sync_to_async(contact_events)(request.brand_name, user.userid, cursor)
+            if not events:
+                try:
+                    await asyncio.wait_for(subscription.queue.get(), timeout)
+                    events, next_cursor = await sync_to_async(contact_events)(request.brand_name, user.userid, cursor)
+                except asyncio.TimeoutError:
+                    next_cursor = cursor
+        finally:
+            hub.unsubscribe(subscription)
+
+        return JsonResponse({
+            'status': 'success',
+            'data': events,
+            'cursor': next_cursor
+        }, status=status.HTTP_200_OK)
+
+    async def stream(self, brand_name, userid, cursor):
+        heartbeat = getattr(settings, 'EVENT_STREAM_HEARTBEAT', 15)
+        subscription = hub.subscribe(brand_name, userid)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                events, cursor = await sync_to_async(contact_events)(brand_name, userid, cursor)
+                for event in events:
+                    data = json.dumps(event, cls=DjangoJSONEncoder)
+                    # The client sends the last id back as Last-Event-ID when it reconnects
+                    yield f"id: {cursor}\nevent: {event['type']}\ndata: {data}\n\n"
+                try:
+                    await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ': keep-alive\n\n'
+        finally:
+            hub.unsubscribe(subscription)
+
+    async def get_user(self, request):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return None
+
+        decoded_token = JWTAuthorization.decode_jwt_token(auth_header.split(' ')[-1])
+        if not decoded_token or decoded_token.get('brand_name') != request.brand_name:
+            return None
+
+        return await Users.objects.using(request.brand_name).filter(
+            userid=decoded_token['user_id'],
+            brand_name=request.brand_name,
+            is_active=True
+        ).afirst()
+
+
+class BatchView(APIValidateView):
+    """
+    Run several requests of the API in one, each sub-request authenticates
+    itself with the batch's Authorization header or its own.
+    """
+
+    def post(self, request):
+        try:
+            responses = run_batch(request, request.data)
+        except BatchError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'success',
+            'data': responses
+        }, status=status.HTTP_200_OK)
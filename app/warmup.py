@@ -0,0 +1,108 @@
+# Include Django Packages
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+
+# Include DRF Packages
+from rest_framework import serializers
+
+# Include From the Project Directory
+from .health import record_connection_error
+from .registry import get_active_brands, get_brand_limits, brand_hosts, brand_list
+from .relocation import relocations
+
+# Include Built-in Package
+import importlib
+import inspect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Modules whose serializers are built once at warm-up
+SERIALIZER_MODULES = ('app.serializers', 'admin_panel.serializers')
+
+
+def warm_connections():
+    """
+    Open a connection to every database and check it with a query, the
+    latency lands in the breaker of the alias. Returns alias -> error or None.
+    """
+    errors = {}
+    for alias in settings.DATABASES:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            errors[alias] = None
+        except Exception as e:
+            record_connection_error(alias, e)
+            errors[alias] = str(e)
+            logger.warning("Warm-up could not reach database %s: %s", alias, e)
+    return errors
+
+
+def warm_registries():
+    relocations.apply()
+    get_active_brands()
+    get_brand_limits('default')
+    brand_hosts.get()
+    brand_list.get()
+
+
+def warm_urls():
+    # Compiles the patterns of every URLconf included from the root one
+    get_resolver().reverse_dict
+
+
+def warm_serializers():
+    """
+    Build the fields of every serializer once, which loads the model metadata they read
+    """
+    built = 0
+    for module_name in SERIALIZER_MODULES:
+        module = importlib.import_module(module_name)
+        for _, serializer_class in inspect.getmembers(module, inspect.isclass):
+            if not issubclass(serializer_class, serializers.BaseSerializer) or serializer_class.__module__ != module_name:
+                continue
+            try:
+                serializer_class(context={}).fields
+                built += 1
+            except Exception:
+                logger.warning("Warm-up could not build %s", serializer_class.__name__, exc_info=True)
+    return built
+
+
+PHASES = [
+    ('connections', warm_connections),
+    ('registries', warm_registries),
+    ('urls', warm_urls),
+    ('serializers', warm_serializers),
+]
+
+
+def warm_up(log=None):
+    """
+    Do the work the first requests of a new worker would otherwise pay for.
+    Returns phase -> (seconds, result of the phase). A failing phase is logged
+    and the next one still runs.
+    """
+    log = log or logger.info
+    apps.check_apps_ready()
+
+    timings = {}
+    for name, phase in PHASES:
+        started = time.perf_counter()
+        try:
+            result = phase()
+        except Exception as e:
+            logger.warning("Warm-up phase %s failed", name, exc_info=True)
+            result = f"failed: {e}"
+        timings[name] = (time.perf_counter() - started, result)
+        log(f"Warm-up {name}: {timings[name][0] * 1000:.1f} ms")
+
+    errors = timings['connections'][1]
+    unhealthy = [alias for alias, error in errors.items() if error] if isinstance(errors, dict) else []
+    if unhealthy:
+        log(f"Warm-up could not reach: {', '.join(unhealthy)}")
+    return timings
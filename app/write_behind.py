@@ -0,0 +1,108 @@
+# Include Django Packages
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, When, Value, DateTimeField
+
+# Include From the Project Directory
+from .models import Users
+from .relocation import relocations
+
+# Include Built-in Package
+from collections import defaultdict
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LastLoginBuffer:
+    """
+    Write-behind buffer of last_login timestamps: logins only record the time
+    in memory, a background thread writes them every LAST_LOGIN_FLUSH_INTERVAL
+    seconds (and once more at exit) as one UPDATE ... CASE per brand
+    """
+
+    batch_size = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(dict)
+        self._flusher = None
+        self._stop = threading.Event()
+
+    def record(self, brand_name, userid, timestamp):
+        with self._lock:
+            previous = self._pending[brand_name].get(userid)
+            if previous is None or timestamp > previous:
+                self._pending[brand_name][userid] = timestamp
+        self.start()
+
+    def pending(self):
+        with self._lock:
+            return sum(len(rows) for rows in self._pending.values())
+
+    def flush(self):
+        """
+        Write every buffered timestamp, rows of a failed brand go back to the buffer
+        """
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(dict)
+
+        written = 0
+        for brand_name, rows in pending.items():
+            try:
+                written += self.write(brand_name, rows)
+            except Exception:
+                logger.exception("Flushing %s last_login updates of brand %s failed", len(rows), brand_name)
+                self.restore(brand_name, rows)
+        return written
+
+    def write(self, brand_name, rows):
+        items = list(rows.items())
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            userids = [userid for userid, _ in batch]
+            Users.objects.using(brand_name).filter(userid__in=userids).update(
+                last_login=Case(
+                    *[When(userid=userid, then=Value(timestamp)) for userid, timestamp in batch],
+                    output_field=DateTimeField(),
+                )
+            )
+            # A queryset update sends no post_save, a moving brand needs the rows mirrored
+            relocations.mirror(Users, brand_name, userids)
+        return len(items)
+
+    def restore(self, brand_name, rows):
+        with self._lock:
+            for userid, timestamp in rows.items():
+                current = self._pending[brand_name].get(userid)
+                if current is None or timestamp > current:
+                    self._pending[brand_name][userid] = timestamp
+
+    def start(self):
+        """
+        Start the flushing thread once, LAST_LOGIN_FLUSH_INTERVAL=None leaves flushing to the caller
+        """
+        interval = getattr(settings, 'LAST_LOGIN_FLUSH_INTERVAL', 5)
+        if self._flusher is not None or interval is None:
+            return
+
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self.run, args=(interval,), name='last-login-flusher', daemon=True)
+            self._flusher.start()
+            atexit.register(self.shutdown)
+
+    def run(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+            connections.close_all()
+
+    def shutdown(self):
+        self._stop.set()
+        self.flush()
+
+
+last_logins = LastLoginBuffer()
@@ -0,0 +1,21 @@
+# gunicorn --config gunicorn.conf.py marketplace.wsgi
+#
+# post_fork runs before a worker has imported the app, post_worker_init right
+# after, so the warm-up hooks in there: the worker opens its database
+# connections and primes its caches before it accepts the first request.
+
+import os
+
+# The WSGI workers keep their database connections open between requests, read
+# by marketplace/settings.py when the worker loads the app
+os.environ.setdefault('DB_CONN_MAX_AGE', '60')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+
+def post_worker_init(worker):
+    from django.apps import apps
+
+    apps.get_app_config('app').warm_up(log=worker.log.info)
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'marketplace.settings')
 
 application = get_asgi_application()
+
+# Receive contact events published by the other workers (needs EVENT_BROKER_URL)
+from app.events import start_event_listener  # noqa: E402
+
+start_event_listener()
@@ -0,0 +1,46 @@
+"""
+Settings for the benchmark suite (`manage.py bench_seed` / `manage.py bench_run`).
+
+Stands up BENCH_TENANTS SQLite brand databases named tenant1..tenantN next to
+a SQLite `default`, all stored under BENCH_DATA_DIR.
+"""
+
+from pathlib import Path
+import os
+
+from .settings import *  # noqa: F401,F403
+from .test_settings import DisableMigrations
+
+
+SECRET_KEY = os.environ.get('SECRET_KEY') or 'bench-secret-key-used-only-for-benchmarks'
+SIMPLE_JWT = {**SIMPLE_JWT, 'SIGNING_KEY': SECRET_KEY}
+
+DEBUG = False
+
+BENCH_TENANTS = int(os.environ.get('BENCH_TENANTS', 3))
+BENCH_DATA_DIR = Path(os.environ.get('BENCH_DATA_DIR', BASE_DIR / 'bench_data'))
+BENCH_DATA_DIR.mkdir(parents=True, exist_ok=True)
+
+DATABASES = {
+    alias: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BENCH_DATA_DIR / f'{alias}.sqlite3',
+        'OPTIONS': {'timeout': 30},
+    }
+    for alias in ['default'] + [f'tenant{index}' for index in range(1, BENCH_TENANTS + 1)]
+}
+
+MIGRATION_MODULES = DisableMigrations()
+
+# Password hashing would hide the cost of the tenant stack, set BENCH_REAL_HASHER=1 to keep it
+if os.environ.get('BENCH_REAL_HASHER') != '1':
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+SLOW_QUERY_SAMPLE_RATE = 0.0
+
+# bench_run drives the app in one process with the test client
+SILENCED_SYSTEM_CHECKS = ['app.E001']
+
+# All bench_run requests come from one client address and a few users, the rate
+# limiter would answer most of them with a 429 and be all the benchmark measures
+RATE_LIMIT_ENABLED = False
@@ -52,9 +52,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'app.middleware.QueryMetricsMiddleware',
     'app.middleware.TenantMiddleware',
+    'app.middleware.AdmissionMiddleware',
+    'app.middleware.ProfilingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -81,6 +85,132 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'marketplace.wsgi.application'
+ASGI_APPLICATION = 'marketplace.asgi.application'
+
+# Responses smaller than this (in bytes) are sent uncompressed
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+
+# Local event broker (see `manage.py run_event_broker`) shared by all workers,
+# leave unset to keep contact events inside each worker process
+EVENT_BROKER_URL = os.environ.get('EVENT_BROKER_URL')
+EVENT_STREAM_HEARTBEAT = 15
+
+# Per request query metrics, served at api/admin/metrics
+QUERY_METRICS_ENABLED = True
+SLOW_QUERY_THRESHOLD = float(os.environ.get('SLOW_QUERY_THRESHOLD', 0.5))  # seconds
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', 0.1))
+
+# Request profiling, admins ask for it per request, the sample rate profiles a share of all traffic
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_BUFFER_SIZE = 50  # latest profiles kept per brand, in the tenant cache shared by the workers
+PROFILING_TIMEOUT = 3600  # seconds
+PROFILING_TOP_FUNCTIONS = 30
+
+# Cache, local memory by default. Point CACHE_BACKEND / CACHE_LOCATION at
+# django.core.cache.backends.filebased.FileBasedCache and a directory, or at
+# django.core.cache.backends.memcached.PyMemcacheCache and host:port, to share it between workers
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'marketplace'),
+    }
+}
+
+# Every tenant cache key is prefixed with the brand and versioned per (brand, model)
+TENANT_CACHE_ALIAS = 'default'
+TENANT_CACHE_TIMEOUT = 300  # seconds
+TENANT_CACHE_STALE_TIMEOUT = 60  # seconds an expired entry is still served while it is refreshed
+
+# POST / PUT requests carrying an Idempotency-Key header run once per (brand, user, key), the
+# response is kept in the tenant cache (bounded by its MAX_ENTRIES) and replayed to retries.
+# A retry landing on another worker only finds it in a shared backend, see the app.E001 check
+IDEMPOTENCY_TTL = 86400  # seconds
+IDEMPOTENCY_WAIT = 10  # seconds a duplicate waits for the first request running in another worker
+IDEMPOTENCY_LOCK_TIMEOUT = 60  # seconds
+
+# POST /batch, sub-requests per batch and threads of a parallel batch of reads
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# GET /user/contact/events waits this long at most for the next event. A WSGI worker is held
+# for the whole wait and gunicorn.conf.py kills it after 30 seconds, long-polls belong on the ASGI app
+CONTACT_EVENTS_MAX_TIMEOUT = 60  # seconds
+CONTACT_EVENTS_WSGI_MAX_TIMEOUT = 5  # seconds
+
+# Logins buffer last_login in memory, it is written to the brand databases this often
+LAST_LOGIN_FLUSH_INTERVAL = 5  # seconds
+
+# Background jobs (manage.py run_jobs), failed attempts are retried with exponential backoff
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_DELAY = 5  # seconds
+JOB_RETRY_MAX_DELAY = 600  # seconds
+JOB_LOCK_TIMEOUT = 600  # seconds without progress before another worker takes a running job over
+JOB_DELETE_CHUNK_SIZE = 1000  # rows per delete transaction
+
+# Tasks / processed contact requests not updated for this many days move to the archive tables,
+# a Brand's retention fields override these, None keeps the rows hot. Tasks are saved searches
+# the user still expects in /my-tasks, a brand opts in to archiving them
+ARCHIVE_TASKS_AFTER_DAYS = None
+ARCHIVE_CONTACTS_AFTER_DAYS = 365
+ARCHIVE_CHUNK_SIZE = 1000  # rows moved per transaction
+
+# Change feed tombstones are deleted after this many days, older cursors have to sync again from scratch
+TOMBSTONE_RETENTION_DAYS = 90
+
+# django-crontab (manage.py crontab add), the jobs it queues are run by manage.py run_jobs
+CRONJOBS = [
+    ('30 3 * * *', 'app.jobs.schedule_archival'),
+    ('45 3 * * *', 'app.jobs.schedule_tombstone_pruning'),
+]
+
+# Workers read the relocations table again this often (seconds) to follow a brand database
+# move, the cache version bump of a phase change only reaches processes sharing the tenant cache
+RELOCATION_POLL_INTERVAL = 5
+
+# CSV user import, rows validated / inserted per chunk and password hashing processes (None = one per CPU)
+USER_IMPORT_CHUNK_SIZE = 1000
+USER_IMPORT_HASH_WORKERS = None
+
+# Brand resolution besides the X-Brand-Name header: <subdomain>.<base domain> hosts
+# and <BRAND_URL_PREFIX><subdomain>/... paths
+BRAND_BASE_DOMAINS = [domain for domain in os.environ.get('BRAND_BASE_DOMAINS', 'localhost').split(',') if domain]
+BRAND_URL_PREFIX = '/b/'
+
+# Workers check the Brand cache version for host / URL prefix changes made by other processes at
+# most this often (seconds), instead of once per request
+BRAND_REGISTRY_POLL_INTERVAL = 1
+
+# Clients may reuse the public brand list this long before revalidating it
+BRAND_LIST_MAX_AGE = 60  # seconds
+
+# Tenant database health: a breaker opens when the error rate over the window, or the
+# latency EWMA, crosses its threshold, requests then fail fast with a 503 until a probe succeeds
+DB_BREAKER_WINDOW = 30  # seconds
+DB_BREAKER_MIN_REQUESTS = 10  # queries in the window before the error rate counts
+DB_BREAKER_ERROR_RATE = 0.5
+DB_BREAKER_LATENCY_THRESHOLD = float(os.environ.get('DB_BREAKER_LATENCY_THRESHOLD', 2.0))  # seconds
+DB_BREAKER_OPEN_SECONDS = 15  # before a probe request is let through
+DB_LATENCY_EWMA_ALPHA = 0.2
+DB_BREAKER_EXEMPT_PATHS = ['/api/admin/health']
+# Brand alias -> read replica alias (also in DATABASES), reads move there while the brand breaker is open
+TENANT_READ_REPLICAS = {}
+
+# Admission control (AdmissionMiddleware), the limit fields of a Brand override these defaults.
+# Token buckets live in each worker, RATE_LIMIT_SHARED_CACHE names a cache alias (memcached
+# on localhost, for example) that the workers of a host share them through instead
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_BRAND_RATE = 200  # requests per second
+RATE_LIMIT_BRAND_BURST = 400
+RATE_LIMIT_USER_RATE = 10  # requests per second per user / client address
+RATE_LIMIT_USER_BURST = 20
+RATE_LIMIT_MAX_CONCURRENT = None  # requests in flight per brand and worker
+RATE_LIMIT_SHED_LATENCY = 0.25  # seconds of brand database latency EWMA above which the brand rate shrinks
+RATE_LIMIT_MIN_SHARE = 0.1  # the brand rate never shrinks below this share
+RATE_LIMIT_SHARED_CACHE = None
+# Anonymous requests are counted per client address. Behind a reverse proxy REMOTE_ADDR is the proxy,
+# name the request.META key of the header it sets instead, e.g. 'HTTP_X_FORWARDED_FOR' or 'HTTP_X_REAL_IP'.
+# Only set it when a proxy always sets the header, clients could send their own otherwise
+RATE_LIMIT_CLIENT_IP_HEADER = os.environ.get('RATE_LIMIT_CLIENT_IP_HEADER') or None
 
 # Database configuration
 DATABASES = {
@@ -114,6 +244,13 @@ DATABASES = {
     }
 }
 
+# Connections close at the end of each request unless DB_CONN_MAX_AGE says otherwise. gunicorn.conf.py
+# sets it for the WSGI workers, which reuse the connections they open at warm-up (app/warmup.py);
+# the ASGI app keeps the default, Django advises against persistent connections under ASGI
+for database in DATABASES.values():
+    database.setdefault('CONN_MAX_AGE', int(os.environ.get('DB_CONN_MAX_AGE', 0)))
+    database.setdefault('CONN_HEALTH_CHECKS', True)
+
 # Database router for multi-tenant setup
 DATABASE_ROUTERS = ['app.db_router.MultiTenantRouter']
 
@@ -161,10 +298,10 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'  # Required for collectstatic
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Tokens are checked by the JWTAuthorization / AdminJWTAuthorization permission
+# classes, simplejwt's authentication would look users up by a missing `id` column
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    'DEFAULT_AUTHENTICATION_CLASSES': ()
 }
 
 SIMPLE_JWT = {
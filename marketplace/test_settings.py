@@ -0,0 +1,55 @@
+"""
+Settings for running the test suite without MySQL.
+
+    python manage.py test --settings=marketplace.test_settings
+
+Local SQLite databases stand in for `default` and the brand databases.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+
+SECRET_KEY = 'test-secret-key-used-only-for-the-test-suite'
+SIMPLE_JWT = {**SIMPLE_JWT, 'SIGNING_KEY': SECRET_KEY}
+
+DATABASES = {
+    alias: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'test_{alias}.sqlite3',
+    }
+    # vehicle_next is the empty database the relocation tests move vehicle to
+    for alias in ('default', 'vehicle', 'furniture', 'vehicle_next')
+}
+
+
+class DisableMigrations:
+    """The apps keep no migrations in the repo, so build every table straight from the models"""
+
+    def __contains__(self, item):
+        return True
+
+    def __getitem__(self, item):
+        return None
+
+
+MIGRATION_MODULES = DisableMigrations()
+
+# Hashing with the production hashers would dominate the test run
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# Slow query sampling is noise in test output
+SLOW_QUERY_SAMPLE_RATE = 0.0
+
+# Tests flush the last_login buffer themselves, a flushing thread would not see their transactions
+LAST_LOGIN_FLUSH_INTERVAL = None
+
+# MD5 hashing is cheaper than starting the hashing processes
+USER_IMPORT_HASH_WORKERS = 0
+
+# Query budgets would count a poll of the relocations table, the tests that need it override this
+RELOCATION_POLL_INTERVAL = None
+# Brand changes are seen by the next request, as other workers would see them after the interval
+BRAND_REGISTRY_POLL_INTERVAL = 0
+
+# The suite runs in one process, the in-memory tenant cache is shared by everything it tests
+SILENCED_SYSTEM_CHECKS = ['app.E001']